@@ -5,13 +5,22 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
+from notify_bot import media_cache
 from notify_bot.admin_handlers import admin_router
 from notify_bot.config import Settings
 from notify_bot.context import AppContext
 from notify_bot.database import Database
 from notify_bot.handlers import set_commands, user_router
+from notify_bot.http_clients import HttpClients
+from notify_bot.jobs import create_job_queue
+from notify_bot.known_ads import KnownAdsIndex
+from notify_bot.leases import CheckLeases, worker_name
+from notify_bot.log_sink import JobLogSink
+from notify_bot.notifier import NotificationDispatcher
+from notify_bot.outbox import OutboxDrainer
 from notify_bot.scheduler import run_scheduler
 from notify_bot.services import InstaMonitorService, MonitorService
+from scrapers import browser_pool, http_cache, parse_executor
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,16 +32,38 @@ logger = logging.getLogger(__name__)
 async def main():
     settings = Settings.load()
     db = await Database(settings).connect()
+    log_sink = JobLogSink(db)
+    log_sink.start()
+    ad_index = KnownAdsIndex(db)
+    ad_index.start()
+    parse_executor.start(settings.parse_workers)
+    http_cache.start(settings.http_cache_path, settings.http_cache_max_entries)
+    media_cache.start(settings.media_cache_dir, settings.media_cache_max_megabytes)
+    http_clients = HttpClients(settings)
+    browser_pool.start(
+        settings.insta_browser_contexts,
+        settings.insta_pages_per_context,
+        settings.insta_page_max_uses,
+    )
     bot = Bot(
         token=settings.telegram_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
+    notifier = NotificationDispatcher(settings)
+    outbox = OutboxDrainer(bot, db, http_clients)
+    monitor_service = MonitorService(db, http_clients)
+    owner = worker_name('bot')
+    jobs = create_job_queue(bot, db, monitor_service, http_clients, owner)
     bot.app_context = AppContext(
         settings=settings,
         db=db,
         bot=bot,
-        monitor_service=MonitorService(db),
+        monitor_service=monitor_service,
         insta_service=InstaMonitorService(db),
+        http_clients=http_clients,
+        notifier=notifier,
+        outbox=outbox,
+        jobs=jobs,
     )
 
     dp = Dispatcher()
@@ -40,20 +71,46 @@ async def main():
     dp.include_router(admin_router)
 
     await set_commands(bot)
-    scheduler_task = asyncio.create_task(
-        run_scheduler(
-            bot,
-            db,
-            settings.request_interval_minutes,
-            settings.insta_request_interval_minutes,
+    notifier.start()
+    outbox.start()
+    scheduler_task = None
+    if settings.bot_runs_checks:
+        scheduler_task = asyncio.create_task(
+            run_scheduler(
+                bot,
+                db,
+                settings.request_interval_minutes,
+                settings.insta_request_interval_minutes,
+                http_clients=http_clients,
+                leases=CheckLeases(db, owner),
+                jobs=jobs,
+            )
         )
-    )
+    else:
+        logger.info('Scheduled checks are left to worker processes (BOT_RUNS_CHECKS=false)')
+    # an in-memory queue can only be served here
+    if settings.bot_runs_checks or settings.job_queue_backend == 'local':
+        jobs.start()
 
     logger.info('Telegram bot started')
     try:
         await dp.start_polling(bot)
     finally:
-        scheduler_task.cancel()
+        if scheduler_task is not None:
+            scheduler_task.cancel()
+            # lets the scheduler hand its leases back before the database is closed
+            await asyncio.gather(scheduler_task, return_exceptions=True)
+        await jobs.close()
+        await outbox.close()
+        await notifier.close()
+        parse_executor.shutdown()
+        http_cache.shutdown()
+        media_cache.shutdown()
+        await http_clients.close()
+        await browser_pool.shutdown()
+        await ad_index.close()
+        # writes what is still buffered while the database is open
+        await log_sink.close()
         await db.close()
         await bot.session.close()
 
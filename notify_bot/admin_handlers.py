@@ -1,5 +1,3 @@
-import asyncio
-import math
 from datetime import timedelta, timezone
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
@@ -8,11 +6,22 @@ from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import CallbackQuery
 
 from notify_bot.handlers import get_context
-from notify_bot.keyboards import get_admin_logs_keyboard, get_admin_menu_keyboard, get_admin_user_edit_keyboard, get_admin_users_keyboard
-from notify_bot.tasks import check_new_ads_async, check_new_insta_content_async
+from notify_bot.keyboards import (
+    get_admin_logs_keyboard,
+    get_admin_menu_keyboard,
+    get_admin_next_pages_keyboard,
+    get_admin_user_edit_keyboard,
+    get_admin_users_keyboard,
+)
+from notify_bot.jobs import JOB_CHECK_ADS, JOB_CHECK_INSTA
 
 admin_router = Router(name='admin')
 ADMIN_LOGS_PAGE_SIZE = 10
+ADMIN_LIST_PAGE_SIZE = 30
+ADMIN_ADS_PAGE_SIZE = 15
+QUERY_SECTIONS = {'olx': 'OLX', 'rieltor': 'Rieltor.ua'}
+LOG_LEVELS = ('', 'ERROR', 'WARNING', 'INFO')
+LOG_JOB_NAMES = ('', 'check_new_ads', 'check_insta', 'initialize_query_ads')
 
 
 @admin_router.callback_query(F.data == 'admin_menu')
@@ -32,6 +41,9 @@ async def admin_stats_handler(callback: CallbackQuery):
         await callback.answer('Доступ лише для адміністратора', show_alert=True)
         return
     stats = await ctx.db.dashboard_stats()
+    job_counts = await ctx.jobs.counts()
+    queued = sum(counts.get('queued', 0) for counts in job_counts.values())
+    running = sum(counts.get('running', 0) for counts in job_counts.values())
     await callback.answer('')
     await callback.message.answer(
         f"{html.bold('Статистика')}\n"
@@ -40,7 +52,8 @@ async def admin_stats_handler(callback: CallbackQuery):
         f"Деактивованих моніторингів: {stats['inactive_queries']}\n"
         f"OLX: {stats['olx_queries']}\n"
         f"Rieltor: {stats['rieltor_queries']}\n"
-        f"Instagram підписок: {stats['insta_subscriptions']}"
+        f"Instagram підписок: {stats['insta_subscriptions']}\n"
+        f"Завдань у черзі: {queued}, виконується: {running}"
     )
 
 
@@ -112,58 +125,138 @@ async def admin_toggle_admin_handler(callback: CallbackQuery):
     )
 
 
+def _owner_label(user, user_telegram_id: int) -> str:
+    return (user.full_name or user.username) if user and (user.full_name or user.username) else str(user_telegram_id)
+
+
+def _queries_section(title: str, queries) -> str:
+    lines = []
+    for query in queries:
+        sign = '✅' if query.is_active else '🚫'
+        lines.append(f'{sign} {query.query_name} — {_owner_label(query.user, query.user_telegram_id)}')
+    return html.bold(title) + '\n' + '\n'.join(lines)
+
+
+def _subscriptions_section(subscriptions) -> str:
+    lines = []
+    for subscription in subscriptions:
+        sign = '✅' if subscription.is_active else '🚫'
+        owner = _owner_label(subscription.user, subscription.user_telegram_id)
+        lines.append(f'{sign} @{subscription.observed_user.username} — {owner}')
+    return html.bold('Instagram') + '\n' + '\n'.join(lines)
+
+
+async def _queries_page(ctx, source: str, before_id: int | None = None) -> tuple[str | None, list[tuple[str, str]]]:
+    # one row past the page tells whether a next page exists
+    title = QUERY_SECTIONS[source]
+    queries = await ctx.db.list_queries_page(source, before_id, ADMIN_LIST_PAGE_SIZE + 1)
+    if not queries:
+        return None, []
+    page = queries[:ADMIN_LIST_PAGE_SIZE]
+    more = [(f'{title}: далі ▶️', f'admin_queries_{source}_{page[-1].id}')] if len(queries) > len(page) else []
+    return _queries_section(title, page), more
+
+
+async def _subscriptions_page(ctx, before_id: int | None = None) -> tuple[str | None, list[tuple[str, str]]]:
+    subscriptions = await ctx.db.list_insta_subscriptions_page(before_id, ADMIN_LIST_PAGE_SIZE + 1)
+    if not subscriptions:
+        return None, []
+    page = subscriptions[:ADMIN_LIST_PAGE_SIZE]
+    more = [('Instagram: далі ▶️', f'admin_subscriptions_{page[-1].id}')] if len(subscriptions) > len(page) else []
+    return _subscriptions_section(page), more
+
+
 @admin_router.callback_query(F.data == 'admin_queries')
 async def admin_queries_handler(callback: CallbackQuery):
     ctx = get_context(callback)
     if not ctx.is_admin(callback.from_user.id):
         await callback.answer('Доступ лише для адміністратора', show_alert=True)
         return
-    queries = await ctx.db.list_all_queries()
-    subscriptions = await ctx.db.list_insta_subscriptions()
+    sections, pages = [], []
+    for source in QUERY_SECTIONS:
+        section, more = await _queries_page(ctx, source)
+        if section:
+            sections.append(section)
+            pages.extend(more)
+    section, more = await _subscriptions_page(ctx)
+    if section:
+        sections.append(section)
+        pages.extend(more)
     await callback.answer('')
-    if not queries and not subscriptions:
+    if not sections:
         await callback.message.answer('Моніторингів немає')
         return
+    await callback.message.answer(
+        html.bold('Моніторинги') + '\n\n' + '\n\n'.join(sections),
+        reply_markup=get_admin_next_pages_keyboard(pages) if pages else None,
+    )
+
 
-    sections = []
-    for source, title in (('olx', 'OLX'), ('rieltor', 'Rieltor.ua')):
-        source_queries = [query for query in queries if query.source == source]
-        if not source_queries:
-            continue
-        lines = []
-        for query in source_queries[:30]:
-            sign = '✅' if query.is_active else '🚫'
-            user_label = query.user.full_name if query.user else str(query.user_telegram_id)
-            lines.append(f'{sign} {query.query_name} — {user_label}')
-        sections.append(html.bold(title) + '\n' + '\n'.join(lines))
-
-    if subscriptions:
-        insta_lines = []
-        for subscription in subscriptions[:30]:
-            sign = '✅' if subscription.is_active else '🚫'
-            user_label = subscription.user.full_name if subscription.user else str(subscription.user_telegram_id)
-            insta_lines.append(f'{sign} @{subscription.observed_user.username} — {user_label}')
-        sections.append(html.bold('Instagram') + '\n' + '\n'.join(insta_lines))
-
-    await callback.message.answer(html.bold('Моніторинги') + '\n\n' + '\n\n'.join(sections))
+@admin_router.callback_query(F.data.startswith('admin_queries_'))
+async def admin_queries_page_handler(callback: CallbackQuery):
+    ctx = get_context(callback)
+    if not ctx.is_admin(callback.from_user.id):
+        await callback.answer('Доступ лише для адміністратора', show_alert=True)
+        return
+    _, _, source, before_id = callback.data.split('_', 3)
+    section, more = await _queries_page(ctx, source, int(before_id))
+    await callback.answer('')
+    if not section:
+        await callback.message.answer('Більше моніторингів немає')
+        return
+    await callback.message.answer(section, reply_markup=get_admin_next_pages_keyboard(more))
 
 
-@admin_router.callback_query(F.data == 'admin_ads')
-async def admin_ads_handler(callback: CallbackQuery):
+@admin_router.callback_query(F.data.startswith('admin_subscriptions_'))
+async def admin_subscriptions_page_handler(callback: CallbackQuery):
     ctx = get_context(callback)
     if not ctx.is_admin(callback.from_user.id):
         await callback.answer('Доступ лише для адміністратора', show_alert=True)
         return
-    ads = await ctx.db.list_recent_ads(limit=15)
+    section, more = await _subscriptions_page(ctx, int(callback.data.rsplit('_', 1)[-1]))
     await callback.answer('')
+    if not section:
+        await callback.message.answer('Більше підписок немає')
+        return
+    await callback.message.answer(section, reply_markup=get_admin_next_pages_keyboard(more))
+
+
+async def _send_recent_ads(callback: CallbackQuery, before_id: int | None = None) -> None:
+    ctx = get_context(callback)
+    ads = await ctx.db.list_recent_ads(limit=ADMIN_ADS_PAGE_SIZE + 1, before_id=before_id)
     if not ads:
-        await callback.message.answer('Оголошень немає')
+        await callback.message.answer('Оголошень немає' if before_id is None else 'Старіших оголошень немає')
         return
+    page = ads[:ADMIN_ADS_PAGE_SIZE]
     lines = []
-    for ad in ads:
+    for ad in page:
         query_name = ad.query.query_name if ad.query else str(ad.query_id)
         lines.append(f'{query_name}: {ad.ad_description[:80]} — {ad.ad_url}')
-    await callback.message.answer(html.bold('Останні оголошення') + '\n\n' + '\n\n'.join(lines))
+    more = [('Старіші ▶️', f'admin_ads_before_{page[-1].id}')] if len(ads) > len(page) else []
+    await callback.message.answer(
+        html.bold('Останні оголошення') + '\n\n' + '\n\n'.join(lines),
+        reply_markup=get_admin_next_pages_keyboard(more) if more else None,
+    )
+
+
+@admin_router.callback_query(F.data == 'admin_ads')
+async def admin_ads_handler(callback: CallbackQuery):
+    ctx = get_context(callback)
+    if not ctx.is_admin(callback.from_user.id):
+        await callback.answer('Доступ лише для адміністратора', show_alert=True)
+        return
+    await callback.answer('')
+    await _send_recent_ads(callback)
+
+
+@admin_router.callback_query(F.data.startswith('admin_ads_before_'))
+async def admin_ads_page_handler(callback: CallbackQuery):
+    ctx = get_context(callback)
+    if not ctx.is_admin(callback.from_user.id):
+        await callback.answer('Доступ лише для адміністратора', show_alert=True)
+        return
+    await callback.answer('')
+    await _send_recent_ads(callback, int(callback.data.rsplit('_', 1)[-1]))
 
 
 @admin_router.callback_query(F.data == 'admin_insta')
@@ -186,29 +279,47 @@ def _format_log_time(created_at) -> str:
     return created_at.strftime('%d.%m.%Y %H:%M:%S')
 
 
-def _build_logs_text(logs, page: int, total_pages: int, total: int) -> str:
+def _build_logs_text(logs, level: str, job_name: str, total: int) -> str:
     lines = [
         f"{_format_log_time(log.created_at)} | [{log.level}] {log.job_name or '-'}: {log.message[:120]}"
         for log in logs
     ]
-    return (
-        f"{html.bold('Логи')} (сторінка {page + 1}/{total_pages}, всього {total})\n\n"
-        + '\n'.join(lines)
-    )
-
-
-async def _send_admin_logs(callback: CallbackQuery, page: int, *, edit: bool = False) -> None:
+    header = f"{html.bold('Логи')} ({level or 'всі рівні'}, {job_name or 'всі задачі'}, ≈{total})"
+    return header + '\n\n' + ('\n'.join(lines) if lines else 'Логів немає')
+
+
+async def _send_admin_logs(
+    callback: CallbackQuery,
+    level: str = '',
+    job_name: str = '',
+    before_id: int | None = None,
+    after_id: int | None = None,
+    *,
+    edit: bool = False,
+) -> None:
     ctx = get_context(callback)
-    total = await ctx.db.count_job_logs()
-    if total == 0:
+    filters = {'level': level or None, 'job_name': job_name or None}
+    logs = []
+    if after_id is not None:
+        logs = await ctx.db.get_job_logs(limit=ADMIN_LOGS_PAGE_SIZE + 1, after_id=after_id, **filters)
+    if len(logs) > ADMIN_LOGS_PAGE_SIZE:
+        page = logs[-ADMIN_LOGS_PAGE_SIZE:]
+        newer_id, older_id = page[0].id, page[-1].id
+    else:
+        # fewer than a page above the cursor: show the newest page instead
+        if after_id is not None:
+            before_id = None
+        logs = await ctx.db.get_job_logs(limit=ADMIN_LOGS_PAGE_SIZE + 1, before_id=before_id, **filters)
+        page = logs[:ADMIN_LOGS_PAGE_SIZE]
+        newer_id = page[0].id if page and before_id is not None else None
+        older_id = page[-1].id if len(logs) > len(page) else None
+    if not page and not level and not job_name and before_id is None:
         await callback.message.answer('Логів немає')
         return
 
-    total_pages = max(1, math.ceil(total / ADMIN_LOGS_PAGE_SIZE))
-    page = max(0, min(page, total_pages - 1))
-    logs = await ctx.db.get_job_logs(limit=ADMIN_LOGS_PAGE_SIZE, offset=page * ADMIN_LOGS_PAGE_SIZE)
-    text = _build_logs_text(logs, page, total_pages, total)
-    markup = get_admin_logs_keyboard(page, total_pages)
+    total = await ctx.db.count_job_logs(**filters)
+    text = _build_logs_text(page, level, job_name, total)
+    markup = get_admin_logs_keyboard(level, job_name, LOG_LEVELS, LOG_JOB_NAMES, newer_id, older_id, total)
     if edit:
         try:
             await callback.message.edit_text(text, reply_markup=markup)
@@ -225,18 +336,22 @@ async def admin_logs_handler(callback: CallbackQuery):
         await callback.answer('Доступ лише для адміністратора', show_alert=True)
         return
     await callback.answer('')
-    await _send_admin_logs(callback, page=0)
+    await _send_admin_logs(callback)
 
 
-@admin_router.callback_query(F.data.startswith('admin_logs_page_'))
+@admin_router.callback_query(F.data.startswith('admin_logs:'))
 async def admin_logs_page_handler(callback: CallbackQuery):
     ctx = get_context(callback)
     if not ctx.is_admin(callback.from_user.id):
         await callback.answer('Доступ лише для адміністратора', show_alert=True)
         return
-    page = int(callback.data.rsplit('_', 1)[-1])
+    _, level, job_name, cursor = callback.data.split(':', 3)
+    level = level if level in LOG_LEVELS else ''
+    job_name = job_name if job_name in LOG_JOB_NAMES else ''
+    before_id = int(cursor[1:]) if cursor.startswith('b') else None
+    after_id = int(cursor[1:]) if cursor.startswith('a') else None
     await callback.answer('')
-    await _send_admin_logs(callback, page=page, edit=True)
+    await _send_admin_logs(callback, level, job_name, before_id, after_id, edit=True)
 
 
 @admin_router.callback_query(F.data == 'admin_logs_noop')
@@ -250,8 +365,8 @@ async def admin_run_ads_handler(callback: CallbackQuery):
     if not ctx.is_admin(callback.from_user.id):
         await callback.answer('Доступ лише для адміністратора', show_alert=True)
         return
-    await callback.answer('Запускаю перевірку OLX/Rieltor')
-    asyncio.create_task(check_new_ads_async(ctx.bot, ctx.db))
+    job, created = await ctx.jobs.submit(JOB_CHECK_ADS, JOB_CHECK_ADS)
+    await callback.answer(_job_status_text('Перевірка OLX/Rieltor', job, created))
 
 
 @admin_router.callback_query(F.data == 'admin_run_insta')
@@ -260,5 +375,13 @@ async def admin_run_insta_handler(callback: CallbackQuery):
     if not ctx.is_admin(callback.from_user.id):
         await callback.answer('Доступ лише для адміністратора', show_alert=True)
         return
-    await callback.answer('Запускаю перевірку Instagram')
-    asyncio.create_task(check_new_insta_content_async(ctx.bot, ctx.db))
+    job, created = await ctx.jobs.submit(JOB_CHECK_INSTA, JOB_CHECK_INSTA)
+    await callback.answer(_job_status_text('Перевірка Instagram', job, created))
+
+
+def _job_status_text(label: str, job, created: bool) -> str:
+    if created:
+        return f'{label}: поставлено в чергу'
+    if job.status == 'running':
+        return f'{label} вже виконується'
+    return f'{label} вже в черзі'
@@ -14,6 +14,10 @@ def _env_int(name: str, default: int) -> int:
     return int(os.getenv(name, default))
 
 
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
 def _env_ids(name: str) -> set[int]:
     raw = os.getenv(name, '').strip()
     if not raw:
@@ -32,11 +36,59 @@ class Settings:
     db_user: str
     db_password: str
     db_port: int
+    pg_statement_cache_size: int
     admin_telegram_ids: set[int]
     use_async_mode: bool
     workers_number: int
     request_interval_minutes: int
     insta_request_interval_minutes: int
+    olx_concurrency: int
+    rieltor_concurrency: int
+    insta_concurrency: int
+    olx_request_delay_seconds: float
+    rieltor_request_delay_seconds: float
+    insta_request_delay_seconds: float
+    parse_workers: int
+    full_crawl_interval_minutes: int
+    http_cache_path: str
+    http_cache_max_entries: int
+    http_timeout_seconds: float
+    http_connections_per_host: int
+    insta_browser_contexts: int
+    insta_pages_per_context: int
+    insta_page_max_uses: int
+    media_cache_dir: str
+    media_cache_max_megabytes: int
+    notify_senders: int
+    notify_global_per_second: float
+    notify_chat_interval_seconds: float
+    notify_max_attempts: int
+    outbox_batch_size: int
+    outbox_poll_seconds: float
+    outbox_lease_seconds: float
+    outbox_max_attempts: int
+    outbox_retention_days: int
+    digest_window_minutes: int
+    scheduler_jitter: float
+    scheduler_refresh_seconds: int
+    adaptive_polling: bool
+    adaptive_min_interval_minutes: int
+    adaptive_max_interval_minutes: int
+    adaptive_window_hours: int
+    adaptive_recount_minutes: int
+    bot_runs_checks: bool
+    lease_ttl_seconds: int
+    job_queue_backend: str
+    job_initial_parse_concurrency: int
+    job_poll_seconds: float
+    job_lease_seconds: float
+    job_max_attempts: int
+    job_log_retention_days: int
+    job_log_flush_seconds: float
+    job_log_batch_size: int
+    job_log_buffer_size: int
+    job_log_handler_level: str
+    known_ads_verify_minutes: int
 
     @classmethod
     def load(cls) -> 'Settings':
@@ -58,11 +110,59 @@ class Settings:
             db_user=os.getenv('DB_USER', '').strip(),
             db_password=os.getenv('DB_PASSWORD', '').strip(),
             db_port=_env_int('DB_PORT', 5432),
+            pg_statement_cache_size=_env_int('PG_STATEMENT_CACHE_SIZE', 512),
             admin_telegram_ids=_env_ids('ADMIN_TELEGRAM_IDS'),
             use_async_mode=_env_bool('USE_ASYNC_MODE', True),
             workers_number=_env_int('WORKERS_NUMBER', 1),
             request_interval_minutes=_env_int('REQUEST_INTERVAL_MINUTES', 15),
             insta_request_interval_minutes=_env_int('INSTA_REQUEST_INTERVAL_MINUTES', 30),
+            olx_concurrency=_env_int('OLX_CONCURRENCY', 4),
+            rieltor_concurrency=_env_int('RIELTOR_CONCURRENCY', 2),
+            insta_concurrency=_env_int('INSTA_CONCURRENCY', 2),
+            olx_request_delay_seconds=_env_float('OLX_REQUEST_DELAY_SECONDS', 0.5),
+            rieltor_request_delay_seconds=_env_float('RIELTOR_REQUEST_DELAY_SECONDS', 1),
+            insta_request_delay_seconds=_env_float('INSTA_REQUEST_DELAY_SECONDS', 5),
+            parse_workers=_env_int('PARSE_WORKERS', 2),
+            full_crawl_interval_minutes=_env_int('FULL_CRAWL_INTERVAL_MINUTES', 180),
+            http_cache_path=os.getenv('HTTP_CACHE_PATH', 'http_cache.json').strip(),
+            http_cache_max_entries=_env_int('HTTP_CACHE_MAX_ENTRIES', 2000),
+            http_timeout_seconds=_env_float('HTTP_TIMEOUT_SECONDS', 30),
+            http_connections_per_host=_env_int('HTTP_CONNECTIONS_PER_HOST', 8),
+            insta_browser_contexts=_env_int('INSTA_BROWSER_CONTEXTS', 1),
+            insta_pages_per_context=_env_int('INSTA_PAGES_PER_CONTEXT', 2),
+            insta_page_max_uses=_env_int('INSTA_PAGE_MAX_USES', 20),
+            media_cache_dir=os.getenv('MEDIA_CACHE_DIR', 'media_cache').strip(),
+            media_cache_max_megabytes=_env_int('MEDIA_CACHE_MAX_MEGABYTES', 500),
+            notify_senders=_env_int('NOTIFY_SENDERS', 4),
+            notify_global_per_second=_env_float('NOTIFY_GLOBAL_PER_SECOND', 25),
+            notify_chat_interval_seconds=_env_float('NOTIFY_CHAT_INTERVAL_SECONDS', 1),
+            notify_max_attempts=_env_int('NOTIFY_MAX_ATTEMPTS', 5),
+            outbox_batch_size=_env_int('OUTBOX_BATCH_SIZE', 100),
+            outbox_poll_seconds=_env_float('OUTBOX_POLL_SECONDS', 5),
+            outbox_lease_seconds=_env_float('OUTBOX_LEASE_SECONDS', 600),
+            outbox_max_attempts=_env_int('OUTBOX_MAX_ATTEMPTS', 5),
+            outbox_retention_days=_env_int('OUTBOX_RETENTION_DAYS', 7),
+            digest_window_minutes=_env_int('DIGEST_WINDOW_MINUTES', 30),
+            scheduler_jitter=_env_float('SCHEDULER_JITTER', 0.1),
+            scheduler_refresh_seconds=_env_int('SCHEDULER_REFRESH_SECONDS', 60),
+            adaptive_polling=_env_bool('ADAPTIVE_POLLING', True),
+            adaptive_min_interval_minutes=_env_int('ADAPTIVE_MIN_INTERVAL_MINUTES', 5),
+            adaptive_max_interval_minutes=_env_int('ADAPTIVE_MAX_INTERVAL_MINUTES', 120),
+            adaptive_window_hours=_env_int('ADAPTIVE_WINDOW_HOURS', 168),
+            adaptive_recount_minutes=_env_int('ADAPTIVE_RECOUNT_MINUTES', 10),
+            bot_runs_checks=_env_bool('BOT_RUNS_CHECKS', True),
+            lease_ttl_seconds=_env_int('LEASE_TTL_SECONDS', 180),
+            job_queue_backend=os.getenv('JOB_QUEUE_BACKEND', 'db').strip().lower(),
+            job_initial_parse_concurrency=_env_int('JOB_INITIAL_PARSE_CONCURRENCY', 2),
+            job_poll_seconds=_env_float('JOB_POLL_SECONDS', 5),
+            job_lease_seconds=_env_float('JOB_LEASE_SECONDS', 600),
+            job_max_attempts=_env_int('JOB_MAX_ATTEMPTS', 3),
+            job_log_retention_days=_env_int('JOB_LOG_RETENTION_DAYS', 14),
+            job_log_flush_seconds=_env_float('JOB_LOG_FLUSH_SECONDS', 2),
+            job_log_batch_size=_env_int('JOB_LOG_BATCH_SIZE', 200),
+            job_log_buffer_size=_env_int('JOB_LOG_BUFFER_SIZE', 10000),
+            job_log_handler_level=os.getenv('JOB_LOG_HANDLER_LEVEL', 'INFO').strip().upper(),
+            known_ads_verify_minutes=_env_int('KNOWN_ADS_VERIFY_MINUTES', 30),
         )
 
     @property
@@ -4,6 +4,10 @@ from aiogram import Bot
 
 from notify_bot.config import Settings
 from notify_bot.database import Database
+from notify_bot.http_clients import HttpClients
+from notify_bot.jobs import JobQueue
+from notify_bot.notifier import NotificationDispatcher
+from notify_bot.outbox import OutboxDrainer
 from notify_bot.services import InstaMonitorService, MonitorService
 
 
@@ -14,6 +18,10 @@ class AppContext:
     bot: Bot
     monitor_service: MonitorService
     insta_service: InstaMonitorService
+    http_clients: HttpClients
+    notifier: NotificationDispatcher
+    outbox: OutboxDrainer
+    jobs: JobQueue
 
     def is_admin(self, telegram_id: int, user=None) -> bool:
         if telegram_id in self.settings.admin_telegram_ids:
@@ -1,5 +1,7 @@
+import json
 import logging
 import secrets
+from collections import Counter
 from datetime import datetime
 from typing import Any
 
@@ -11,12 +13,183 @@ from notify_bot.models import (
     InstaContent,
     InstaObservedUser,
     InstaSubscription,
+    Job,
     JobLog,
+    OutboxMessage,
     TelegramUser,
 )
 
 logger = logging.getLogger(__name__)
 
+OUTBOX_SCHEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT NOT NULL UNIQUE,
+    chat_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    group_key TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS notification_outbox_pending_idx ON notification_outbox(status, available_at);
+"""
+
+OUTBOX_SCHEMA_PG = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    dedup_key TEXT NOT NULL UNIQUE,
+    chat_id BIGINT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    group_key TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    sent_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS notification_outbox_pending_idx ON notification_outbox(status, available_at);
+"""
+
+LEASE_SCHEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS check_lease (
+    lease_key TEXT PRIMARY KEY,
+    owner TEXT,
+    expires_at TEXT NOT NULL
+);
+"""
+
+LEASE_SCHEMA_PG = """
+CREATE TABLE IF NOT EXISTS check_lease (
+    lease_key TEXT PRIMARY KEY,
+    owner TEXT,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+"""
+
+JOB_QUEUE_SCHEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS job_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 10,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    error TEXT,
+    available_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TEXT,
+    finished_at TEXT
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS job_queue_active_dedup_idx ON job_queue(dedup_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS job_queue_status_idx ON job_queue(status, priority, id);
+"""
+
+JOB_QUEUE_SCHEMA_PG = """
+CREATE TABLE IF NOT EXISTS job_queue (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 10,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    error TEXT,
+    available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS job_queue_active_dedup_idx ON job_queue(dedup_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS job_queue_status_idx ON job_queue(status, priority, id);
+"""
+
+MIGRATION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migration (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at {timestamp} NOT NULL
+);
+"""
+
+# applied in order once per database and recorded in schema_migration; statements are
+# (table, sql) so a legacy database without that table skips them instead of failing
+MIGRATIONS: list[tuple[int, str, list[tuple[str, str]]]] = [
+    (
+        1,
+        'indexes for hot lookups',
+        [
+            (
+                'checker_query',
+                'CREATE INDEX IF NOT EXISTS checker_query_user_url_idx ON checker_query(user_telegram_id, query_url)',
+            ),
+            (
+                'checker_query',
+                'CREATE INDEX IF NOT EXISTS checker_query_active_idx ON checker_query(created_at) '
+                'WHERE (is_active IS TRUE) AND (is_deleted IS NOT TRUE)',
+            ),
+            ('found_ad', 'CREATE INDEX IF NOT EXISTS found_ad_query_idx ON found_ad(query_id)'),
+            ('found_ad', 'CREATE INDEX IF NOT EXISTS found_ad_created_idx ON found_ad(created_at, query_id)'),
+            ('found_ad', 'CREATE INDEX IF NOT EXISTS found_ad_active_id_idx ON found_ad(id) WHERE (is_active IS TRUE)'),
+            (
+                'insta_subscription',
+                'CREATE INDEX IF NOT EXISTS insta_subscription_observed_idx ON insta_subscription(observed_user_id) '
+                'WHERE (is_active IS TRUE) AND (is_deleted IS NOT TRUE)',
+            ),
+            (
+                'insta_subscription',
+                'CREATE INDEX IF NOT EXISTS insta_subscription_user_idx ON insta_subscription({insta_sub_user_col})',
+            ),
+            ('job_log', 'CREATE INDEX IF NOT EXISTS job_log_level_idx ON job_log(level, id)'),
+            ('job_log', 'CREATE INDEX IF NOT EXISTS job_log_job_name_idx ON job_log(job_name, id)'),
+        ],
+    ),
+    (
+        2,
+        'job log counters and hourly rollup',
+        [
+            (
+                'job_log',
+                'CREATE TABLE IF NOT EXISTS job_log_stats ('
+                "level TEXT NOT NULL, job_name TEXT NOT NULL DEFAULT '', row_count INTEGER NOT NULL DEFAULT 0, "
+                'PRIMARY KEY (level, job_name))',
+            ),
+            (
+                'job_log',
+                'CREATE TABLE IF NOT EXISTS job_log_hourly ('
+                "hour {timestamp} NOT NULL, level TEXT NOT NULL, job_name TEXT NOT NULL DEFAULT '', "
+                'row_count INTEGER NOT NULL, PRIMARY KEY (hour, level, job_name))',
+            ),
+            ('job_log', 'CREATE INDEX IF NOT EXISTS job_log_created_idx ON job_log(created_at)'),
+            (
+                'job_log',
+                'INSERT INTO job_log_stats(level, job_name, row_count) '
+                "SELECT level, COALESCE(job_name, ''), COUNT(*) FROM job_log GROUP BY 1, 2 "
+                'ON CONFLICT(level, job_name) DO NOTHING',
+            ),
+        ],
+    ),
+    (
+        3,
+        'found_ad keyset by query',
+        [
+            ('found_ad', 'CREATE INDEX IF NOT EXISTS found_ad_query_id_idx ON found_ad(query_id, id)'),
+            ('found_ad', 'DROP INDEX IF EXISTS found_ad_query_idx'),
+        ],
+    ),
+]
+
 FRESH_SCHEMA_SQLITE = """
 PRAGMA journal_mode=WAL;
 
@@ -39,6 +212,8 @@ CREATE TABLE IF NOT EXISTS checker_query (
     source TEXT NOT NULL DEFAULT 'olx',
     is_active INTEGER NOT NULL DEFAULT 1,
     is_deleted INTEGER NOT NULL DEFAULT 0,
+    digest_minutes INTEGER,
+    check_interval_minutes INTEGER,
     created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -91,7 +266,7 @@ CREATE TABLE IF NOT EXISTS job_log (
     job_name TEXT NOT NULL DEFAULT '',
     created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
-"""
+""" + OUTBOX_SCHEMA_SQLITE + LEASE_SCHEMA_SQLITE + JOB_QUEUE_SCHEMA_SQLITE
 
 
 def _parse_dt(value) -> datetime | None:
@@ -115,6 +290,30 @@ def _row_user(row: dict) -> TelegramUser:
     )
 
 
+QUERY_FIELDS = (
+    'id', 'user_telegram_id', 'query_name', 'query_url', 'source', 'is_active', 'is_deleted', 'created_at',
+    'digest_minutes', 'check_interval_minutes',
+)
+USER_FIELDS = ('user_telegram_id', 'username', 'full_name', 'first_name', 'last_name', 'is_active', 'is_admin', 'created_at')
+# only what the admin lists print next to a row
+OWNER_LABEL_FIELDS = ('user_telegram_id', 'username', 'full_name')
+# 5 parameters a row stays under the old SQLite limit of 999 per statement
+JOB_LOG_INSERT_ROWS = 150
+
+
+def _select_as(alias: str, prefix: str, fields: tuple[str, ...]) -> str:
+    return ', '.join(f'{alias}.{field} AS {prefix}{field}' for field in fields)
+
+
+def _unprefix(row: dict, prefix: str) -> dict:
+    return {key[len(prefix):]: value for key, value in row.items() if key.startswith(prefix)}
+
+
+def _row_owner(row: dict) -> TelegramUser | None:
+    owner = _unprefix(row, 'owner_')
+    return _row_user(owner) if owner.get('user_telegram_id') is not None else None
+
+
 def _row_query(row: dict, user: TelegramUser | None = None) -> CheckerQuery:
     return CheckerQuery(
         id=row['id'],
@@ -126,6 +325,78 @@ def _row_query(row: dict, user: TelegramUser | None = None) -> CheckerQuery:
         is_deleted=bool(row.get('is_deleted', 0)),
         created_at=_parse_dt(row.get('created_at')),
         user=user,
+        digest_minutes=row.get('digest_minutes'),
+        check_interval_minutes=row.get('check_interval_minutes'),
+    )
+
+
+def _row_found_ad(row: dict, query: CheckerQuery | None = None) -> FoundAd:
+    return FoundAd(
+        id=row['id'],
+        query_id=row['query_id'],
+        ad_url=row['ad_url'],
+        ad_description=row['ad_description'],
+        ad_price=float(row['ad_price']),
+        currency=row['currency'],
+        is_active=bool(row['is_active']),
+        created_at=_parse_dt(row.get('created_at')),
+        query=query,
+    )
+
+
+def _found_ad_values(parsed_ad: dict) -> tuple[str, str, float, str]:
+    return (
+        parsed_ad['ad_url'],
+        parsed_ad.get('ad_description', ''),
+        float(parsed_ad.get('ad_price', 0) or 0),
+        parsed_ad.get('currency', ''),
+    )
+
+
+def _row_outbox(row: dict) -> OutboxMessage:
+    return OutboxMessage(
+        id=row['id'],
+        dedup_key=row['dedup_key'],
+        chat_id=row['chat_id'],
+        kind=row['kind'],
+        payload=json.loads(row['payload']),
+        attempts=row['attempts'],
+        group_key=row.get('group_key'),
+        created_at=_parse_dt(row.get('created_at')),
+    )
+
+
+def _row_job(row: dict) -> Job:
+    return Job(
+        id=row['id'],
+        kind=row['kind'],
+        dedup_key=row['dedup_key'],
+        payload=json.loads(row['payload']),
+        priority=row['priority'],
+        status=row['status'],
+        attempts=row['attempts'],
+        error=row.get('error'),
+        created_at=_parse_dt(row.get('created_at')),
+        started_at=_parse_dt(row.get('started_at')),
+        finished_at=_parse_dt(row.get('finished_at')),
+    )
+
+
+def _row_insta_subscription(row: dict) -> InstaSubscription:
+    return InstaSubscription(
+        id=row['id'],
+        observed_user_id=row['observed_user_id'],
+        user_telegram_id=row['user_telegram_id'],
+        is_active=bool(row['is_active']),
+        is_deleted=bool(row.get('is_deleted', 0)),
+        created_at=_parse_dt(row.get('created_at')),
+        observed_user=InstaObservedUser(
+            id=row['observed_user_id'],
+            username=row['insta_username'],
+            is_active=True,
+            is_deleted=False,
+        ),
+        user=_row_owner(row),
     )
 
 
@@ -133,7 +404,11 @@ class Database:
     def __init__(self, settings: Settings):
         self.settings = settings
         self._backend: SqliteBackend | None = None
-        self._insta_sub_user_col: str | None = None
+        self._insta_sub_user_col = 'user_telegram_id'
+        self._job_log_insert: tuple[str, str] | None = None
+        self._job_log_counted = False
+        self.log_sink = None
+        self.ad_index = None
 
     def _b(self, value: bool):
         return int(value) if self.settings.use_sqlite else value
@@ -147,16 +422,41 @@ class Database:
     def _now_sql(self) -> str:
         return 'CURRENT_TIMESTAMP' if self.settings.use_sqlite else 'NOW()'
 
+    def _now_plus_sql(self) -> str:
+        return "datetime('now', ?)" if self.settings.use_sqlite else 'NOW() + make_interval(secs => ?)'
+
+    def _seconds(self, seconds: float):
+        return f'{float(seconds):+} seconds' if self.settings.use_sqlite else float(seconds)
+
     async def _insta_sub_user_column(self) -> str:
-        if self._insta_sub_user_col is None:
-            if await self._backend.table_exists('insta_subscription') and not await self._backend.column_exists(
-                'insta_subscription', 'user_telegram_id'
-            ):
-                self._insta_sub_user_col = 'user_id'
-            else:
-                self._insta_sub_user_col = 'user_telegram_id'
         return self._insta_sub_user_col
 
+    async def _load_schema_facts(self) -> None:
+        # schema probes the queries depend on are answered once here instead of on every call
+        backend = self._backend
+        await backend.load_schema()
+        if await backend.table_exists('insta_subscription') and not await backend.column_exists(
+            'insta_subscription', 'user_telegram_id'
+        ):
+            self._insta_sub_user_col = 'user_id'
+        else:
+            self._insta_sub_user_col = 'user_telegram_id'
+
+        # (statement head, one VALUES row); created_at is passed as an age so buffered rows keep their time
+        self._job_log_insert = None
+        if await backend.table_exists('job_log'):
+            if await backend.column_exists('job_log', 'logger_name'):
+                self._job_log_insert = (
+                    'INSERT INTO job_log(level, source, message, job_name, logger_name, created_at) VALUES ',
+                    f"(?, ?, ?, ?, 'notify_bot', {self._now_plus_sql()})",
+                )
+            else:
+                self._job_log_insert = (
+                    'INSERT INTO job_log(level, source, message, job_name, created_at) VALUES ',
+                    f'(?, ?, ?, ?, {self._now_plus_sql()})',
+                )
+        self._job_log_counted = await backend.table_exists('job_log_stats')
+
     @staticmethod
     def _subscription_telegram_id(row: dict) -> int:
         return row.get('user_telegram_id') or row['user_id']
@@ -164,6 +464,8 @@ class Database:
     async def connect(self) -> 'Database':
         self._backend = await create_backend(self.settings)
         await self._ensure_schema()
+        await self._load_schema_facts()
+        await self._run_migrations()
         logger.info('Database connected: %s', self.settings.database_label)
         return self
 
@@ -183,6 +485,8 @@ class Database:
         deleted_type = 'BOOLEAN DEFAULT FALSE' if not self.settings.use_sqlite else 'INTEGER DEFAULT 0'
         await backend.add_column_if_missing('telegram_user', 'is_admin', admin_type)
         await backend.add_column_if_missing('insta_observed_user', 'is_deleted', deleted_type)
+        await backend.add_column_if_missing('checker_query', 'digest_minutes', 'INTEGER')
+        await backend.add_column_if_missing('checker_query', 'check_interval_minutes', 'INTEGER')
 
         if not await backend.table_exists('insta_subscription'):
             if self.settings.use_sqlite:
@@ -215,37 +519,76 @@ class Database:
                 )
             await backend.commit()
 
+        if not await backend.table_exists('notification_outbox'):
+            await backend.executescript(OUTBOX_SCHEMA_SQLITE if self.settings.use_sqlite else OUTBOX_SCHEMA_PG)
+        await backend.add_column_if_missing('notification_outbox', 'group_key', 'TEXT')
+        if not await backend.table_exists('check_lease'):
+            await backend.executescript(LEASE_SCHEMA_SQLITE if self.settings.use_sqlite else LEASE_SCHEMA_PG)
+        if not await backend.table_exists('job_queue'):
+            await backend.executescript(JOB_QUEUE_SCHEMA_SQLITE if self.settings.use_sqlite else JOB_QUEUE_SCHEMA_PG)
+
+    async def _run_migrations(self) -> None:
+        backend = self._backend
+        timestamp = 'TEXT' if self.settings.use_sqlite else 'TIMESTAMPTZ'
+        if not await backend.table_exists('schema_migration'):
+            await backend.executescript(MIGRATION_TABLE_SQL.format(timestamp=timestamp))
+        applied = {row['version'] for row in await backend.fetchall('SELECT version FROM schema_migration')}
+        migrated = False
+        for version, name, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            async with backend.transaction():
+                for table, sql in statements:
+                    if not await backend.table_exists(table):
+                        logger.info('Migration %s: no %s table, skipped %s', version, table, sql.split(' ON ')[0])
+                        continue
+                    await backend.execute(sql.format(insta_sub_user_col=self._insta_sub_user_col, timestamp=timestamp))
+                # several processes may start at once; the statements above are idempotent
+                await backend.execute(
+                    f'INSERT INTO schema_migration(version, name, applied_at) VALUES (?, ?, {self._now_sql()}) '
+                    'ON CONFLICT(version) DO NOTHING',
+                    (version, name),
+                )
+            logger.info('Database migration %s applied: %s', version, name)
+            migrated = True
+        if migrated:
+            await self._load_schema_facts()
+
     async def add_job_log(self, level: str, message: str, source: str = 'system', job_name: str = '') -> None:
-        if not await self._backend.table_exists('job_log'):
+        if self.log_sink is not None:
+            self.log_sink.add(level, message, source, job_name)
             return
-        columns = await self._backend.fetchall(
-            "SELECT column_name FROM information_schema.columns WHERE table_name='job_log'"
-            if not self.settings.use_sqlite else "PRAGMA table_info(job_log)"
-        )
-        if self.settings.use_sqlite:
-            has_logger_name = any(row.get('name') == 'logger_name' for row in columns)
-        else:
-            has_logger_name = any(row.get('column_name') == 'logger_name' for row in columns)
+        await self.insert_job_logs([(level, source, message, job_name, 0.0)])
 
-        if has_logger_name:
-            await self._backend.execute(
-                f'INSERT INTO job_log(level, source, message, job_name, logger_name, created_at) VALUES (?, ?, ?, ?, ?, {self._now_sql()})',
-                (level, source, message, job_name, 'notify_bot'),
-            )
-        else:
-            await self._backend.execute(
-                f'INSERT INTO job_log(level, source, message, job_name, created_at) VALUES (?, ?, ?, ?, {self._now_sql()})',
-                (level, source, message, job_name),
-            )
-        await self._backend.commit()
+    async def insert_job_logs(self, entries: list[tuple[str, str, str, str, float]]) -> None:
+        # entries are (level, source, message, job_name, age in seconds), written as multi-row INSERTs
+        if self._job_log_insert is None or not entries:
+            return
+        head, row_sql = self._job_log_insert
+        async with self._backend.transaction():
+            for start in range(0, len(entries), JOB_LOG_INSERT_ROWS):
+                chunk = entries[start:start + JOB_LOG_INSERT_ROWS]
+                params: list[Any] = []
+                for level, source, message, job_name, age in chunk:
+                    params.extend((level, source, message, job_name or '', self._seconds(-age)))
+                await self._backend.execute(head + ', '.join([row_sql] * len(chunk)), tuple(params))
+            if self._job_log_counted:
+                counts = Counter((level, job_name or '') for level, _, _, job_name, _ in entries)
+                await self._backend.executemany(
+                    'INSERT INTO job_log_stats(level, job_name, row_count) VALUES (?, ?, ?) '
+                    'ON CONFLICT(level, job_name) DO UPDATE SET row_count = job_log_stats.row_count + excluded.row_count',
+                    [(level, job_name, count) for (level, job_name), count in counts.items()],
+                )
 
     async def get_job_logs(
         self,
         limit: int = 30,
-        offset: int = 0,
+        before_id: int | None = None,
+        after_id: int | None = None,
         level: str | None = None,
         job_name: str | None = None,
     ) -> list[JobLog]:
+        # id keyset in both directions, newest first either way; no OFFSET walks over skipped rows
         if not await self._backend.table_exists('job_log'):
             return []
         query = 'SELECT * FROM job_log'
@@ -257,12 +600,18 @@ class Database:
         if job_name:
             filters.append('job_name = ?')
             params.append(job_name)
+        if before_id is not None:
+            filters.append('id < ?')
+            params.append(before_id)
+        if after_id is not None:
+            filters.append('id > ?')
+            params.append(after_id)
         if filters:
             query += ' WHERE ' + ' AND '.join(filters)
-        query += ' ORDER BY id DESC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
+        query += f" ORDER BY id {'ASC' if after_id is not None and before_id is None else 'DESC'} LIMIT ?"
+        params.append(limit)
         rows = await self._backend.fetchall(query, tuple(params))
-        return [
+        logs = [
             JobLog(
                 id=row['id'],
                 level=row['level'],
@@ -273,11 +622,14 @@ class Database:
             )
             for row in rows
         ]
+        return sorted(logs, key=lambda log: log.id, reverse=True)
 
     async def count_job_logs(self, level: str | None = None, job_name: str | None = None) -> int:
-        if not await self._backend.table_exists('job_log'):
+        # kept by add_job_log and recounted by rollup_job_logs, so rows written by other
+        # processes may lag until the next rollup
+        if not self._job_log_counted:
             return 0
-        query = 'SELECT COUNT(*) AS cnt FROM job_log'
+        query = 'SELECT COALESCE(SUM(row_count), 0) AS cnt FROM job_log_stats'
         params: list[Any] = []
         filters = []
         if level:
@@ -289,7 +641,54 @@ class Database:
         if filters:
             query += ' WHERE ' + ' AND '.join(filters)
         row = await self._backend.fetchone(query, tuple(params))
-        return row['cnt'] or 0
+        return max(row['cnt'] or 0, 0)
+
+    async def rollup_job_logs(self, older_than_days: int, batch_size: int = 5000) -> int:
+        if not self._job_log_counted:
+            return 0
+        backend = self._backend
+        cutoff = f'created_at < {self._now_plus_sql()}'
+        cutoff_param = self._seconds(-older_than_days * 86400)
+        if self.settings.use_sqlite:
+            hour = "strftime('%Y-%m-%d %H:00:00', created_at)"
+        else:
+            hour = "date_trunc('hour', created_at)"
+        rolled = 0
+        while True:
+            async with backend.transaction():
+                row = await backend.fetchone(
+                    f'SELECT MAX(id) AS max_id, COUNT(*) AS cnt FROM '
+                    f'(SELECT id FROM job_log WHERE {cutoff} ORDER BY created_at LIMIT ?) old',
+                    (cutoff_param, batch_size),
+                )
+                if not row or row['max_id'] is None:
+                    break
+                params = (row['max_id'], cutoff_param)
+                await backend.execute(
+                    f"""
+                    INSERT INTO job_log_hourly(hour, level, job_name, row_count)
+                    SELECT {hour}, level, COALESCE(job_name, ''), COUNT(*)
+                    FROM job_log
+                    WHERE id <= ? AND {cutoff}
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT(hour, level, job_name) DO UPDATE SET row_count = job_log_hourly.row_count + excluded.row_count
+                    """,
+                    params,
+                )
+                await backend.execute(f'DELETE FROM job_log WHERE id <= ? AND {cutoff}', params)
+            rolled += row['cnt']
+            if row['cnt'] < batch_size:
+                break
+
+        # the counters drift with rows other processes write and with races against the
+        # increments, so the rollup also resets them to the real counts
+        async with backend.transaction():
+            await backend.execute('DELETE FROM job_log_stats')
+            await backend.execute(
+                'INSERT INTO job_log_stats(level, job_name, row_count) '
+                "SELECT level, COALESCE(job_name, ''), COUNT(*) FROM job_log GROUP BY 1, 2"
+            )
+        return rolled
 
     async def upsert_telegram_user(self, telegram_user, is_admin: bool = False) -> TelegramUser:
         admin_case = (
@@ -407,7 +806,7 @@ class Database:
         source: str,
         is_active: bool = True,
     ) -> CheckerQuery:
-        await self._backend.execute(
+        query_id = await self._backend.execute(
             f"""
             INSERT INTO checker_query(user_telegram_id, query_name, query_url, source, is_active, is_deleted, created_at)
             VALUES (?, ?, ?, ?, ?, ?, {self._now_sql()})
@@ -415,17 +814,24 @@ class Database:
             (user_telegram_id, query_name, query_url, source, self._b(is_active), self._b(False)),
         )
         await self._backend.commit()
-        return await self.get_query(self._backend.lastrowid)
+        return await self.get_query(query_id)
+
+    def _queries_with_owner_sql(self, where: str) -> str:
+        return f"""
+            SELECT q.*, {_select_as('u', 'owner_', USER_FIELDS)}
+            FROM checker_query q
+            LEFT JOIN telegram_user u ON u.user_telegram_id = q.user_telegram_id
+            WHERE {where}
+        """
 
     async def get_query(self, query_id: int) -> CheckerQuery | None:
         row = await self._backend.fetchone(
-            f'SELECT * FROM checker_query WHERE id = ? AND {self._not_deleted()}',
+            self._queries_with_owner_sql(f'q.id = ? AND {self._not_deleted("q.is_deleted")}'),
             (query_id,),
         )
         if not row:
             return None
-        user = await self.get_telegram_user(row['user_telegram_id'])
-        return _row_query(row, user)
+        return _row_query(row, _row_owner(row))
 
     async def list_queries_for_user(self, user_telegram_id: int, source: str | None = None) -> list[CheckerQuery]:
         if source:
@@ -442,23 +848,46 @@ class Database:
 
     async def list_all_queries(self) -> list[CheckerQuery]:
         rows = await self._backend.fetchall(
-            f'SELECT * FROM checker_query WHERE {self._not_deleted()} ORDER BY created_at DESC'
+            self._queries_with_owner_sql(self._not_deleted('q.is_deleted')) + ' ORDER BY q.created_at DESC'
         )
-        result = []
-        for row in rows:
-            user = await self.get_telegram_user(row['user_telegram_id'])
-            result.append(_row_query(row, user))
-        return result
+        return [_row_query(row, _row_owner(row)) for row in rows]
 
     async def list_active_queries(self) -> list[CheckerQuery]:
         rows = await self._backend.fetchall(
-            f'SELECT * FROM checker_query WHERE {self._is_true("is_active")} AND {self._not_deleted()} ORDER BY created_at DESC'
+            self._queries_with_owner_sql(f'{self._is_true("q.is_active")} AND {self._not_deleted("q.is_deleted")}')
+            + ' ORDER BY q.created_at DESC'
         )
-        result = []
-        for row in rows:
-            user = await self.get_telegram_user(row['user_telegram_id'])
-            result.append(_row_query(row, user))
-        return result
+        return [_row_query(row, _row_owner(row)) for row in rows]
+
+    async def list_queries_page(
+        self,
+        source: str | None = None,
+        before_id: int | None = None,
+        limit: int = 30,
+    ) -> list[CheckerQuery]:
+        # keyset page, newest first: pass the id of the last row shown to get the next page
+        filters = [self._not_deleted('q.is_deleted')]
+        params: list[Any] = []
+        if source:
+            filters.append('q.source = ?')
+            params.append(source)
+        if before_id:
+            filters.append('q.id < ?')
+            params.append(before_id)
+        params.append(limit)
+        rows = await self._backend.fetchall(
+            f"""
+            SELECT q.id, q.user_telegram_id, q.query_name, q.query_url, q.source, q.is_active,
+                   {_select_as('u', 'owner_', OWNER_LABEL_FIELDS)}
+            FROM checker_query q
+            LEFT JOIN telegram_user u ON u.user_telegram_id = q.user_telegram_id
+            WHERE {' AND '.join(filters)}
+            ORDER BY q.id DESC
+            LIMIT ?
+            """,
+            tuple(params),
+        )
+        return [_row_query(row, _row_owner(row)) for row in rows]
 
     async def toggle_query_active(self, query_id: int) -> CheckerQuery:
         query = await self.get_query(query_id)
@@ -513,65 +942,151 @@ class Database:
         )
         await self._backend.commit()
 
+    async def set_query_digest_minutes(self, query_id: int, digest_minutes: int | None) -> CheckerQuery:
+        await self._backend.execute(
+            'UPDATE checker_query SET digest_minutes = ? WHERE id = ?',
+            (digest_minutes, query_id),
+        )
+        await self._backend.commit()
+        return await self.get_query(query_id)
+
     async def list_found_ads_for_query(self, query_id: int) -> list[FoundAd]:
         rows = await self._backend.fetchall('SELECT * FROM found_ad WHERE query_id = ?', (query_id,))
-        return [
-            FoundAd(
-                id=row['id'],
-                query_id=row['query_id'],
-                ad_url=row['ad_url'],
-                ad_description=row['ad_description'],
-                ad_price=float(row['ad_price']),
-                currency=row['currency'],
-                is_active=bool(row['is_active']),
-                created_at=_parse_dt(row.get('created_at')),
-            )
+        return [_row_found_ad(row) for row in rows]
+
+    async def list_found_ad_keys(self, query_id: int, after_id: int = 0) -> list[tuple[int, str, bool]]:
+        rows = await self._backend.fetchall(
+            'SELECT id, ad_url, is_active FROM found_ad WHERE query_id = ? AND id > ? ORDER BY id',
+            (query_id, after_id),
+        )
+        return [(row['id'], row['ad_url'], bool(row['is_active'])) for row in rows]
+
+    async def found_ad_checksums_by_query(self) -> dict[int, tuple[int, int, int]]:
+        # (ads, active ads, sum of active ids) per query
+        rows = await self._backend.fetchall(
+            f"""
+            SELECT
+                query_id,
+                COUNT(*) AS cnt,
+                SUM(CASE WHEN {self._is_true('is_active')} THEN 1 ELSE 0 END) AS active,
+                SUM(CASE WHEN {self._is_true('is_active')} THEN id ELSE 0 END) AS active_id_sum
+            FROM found_ad
+            GROUP BY query_id
+            """
+        )
+        return {
+            row['query_id']: (row['cnt'], row['active'] or 0, int(row['active_id_sum'] or 0))
             for row in rows
-        ]
+        }
 
     async def create_found_ad(self, query_id: int, parsed_ad: dict) -> FoundAd:
-        await self._backend.execute(
+        ad_id = await self._backend.execute(
             f"""
             INSERT INTO found_ad(query_id, ad_url, ad_description, ad_price, currency, is_active, created_at)
             VALUES (?, ?, ?, ?, ?, ?, {self._now_sql()})
             """,
-            (
-                query_id,
-                parsed_ad['ad_url'],
-                parsed_ad.get('ad_description', ''),
-                float(parsed_ad.get('ad_price', 0) or 0),
-                parsed_ad.get('currency', ''),
-                self._b(True),
-            ),
+            (query_id, *_found_ad_values(parsed_ad), self._b(True)),
         )
         await self._backend.commit()
         row = await self._backend.fetchone(
             'SELECT * FROM found_ad WHERE id = ?',
-            (self._backend.lastrowid,),
-        )
-        return FoundAd(
-            id=row['id'],
-            query_id=row['query_id'],
-            ad_url=row['ad_url'],
-            ad_description=row['ad_description'],
-            ad_price=float(row['ad_price']),
-            currency=row['currency'],
-            is_active=bool(row['is_active']),
-            created_at=_parse_dt(row.get('created_at')),
+            (ad_id,),
         )
+        found_ad = _row_found_ad(row)
+        if self.ad_index is not None:
+            self.ad_index.apply(query_id, [found_ad])
+        return found_ad
 
     async def save_initial_ads(self, query_id: int, parsed_ads: list[dict]) -> int:
-        saved = 0
+        rows = await self._backend.fetchall('SELECT ad_url FROM found_ad WHERE query_id = ?', (query_id,))
+        known_urls = {row['ad_url'] for row in rows}
+        new_ads = []
         for ad in parsed_ads:
-            row = await self._backend.fetchone(
-                'SELECT 1 FROM found_ad WHERE query_id = ? AND ad_url = ?',
-                (query_id, ad['ad_url']),
-            )
-            if row:
+            if ad['ad_url'] in known_urls:
                 continue
-            await self.create_found_ad(query_id, ad)
-            saved += 1
-        return saved
+            known_urls.add(ad['ad_url'])
+            new_ads.append(ad)
+        created = await self.apply_ad_diff(query_id, new_ads)
+        return len(created)
+
+    async def apply_ad_diff(
+        self,
+        query_id: int,
+        inserted: list[dict],
+        reactivated_ids: list[int] = (),
+        deactivated_ids: list[int] = (),
+        outbox: list[OutboxMessage] = (),
+    ) -> list[FoundAd]:
+        if not inserted and not reactivated_ids and not deactivated_ids:
+            return []
+        async with self._backend.transaction():
+            if self.settings.use_sqlite:
+                created = await self._insert_found_ads_sqlite(query_id, inserted)
+            else:
+                created = await self._insert_found_ads_pg(query_id, inserted)
+            await self._set_found_ads_active(reactivated_ids, True)
+            await self._set_found_ads_active(deactivated_ids, False)
+            await self._insert_outbox(outbox)
+        if self.ad_index is not None:
+            self.ad_index.apply(query_id, created, reactivated_ids, deactivated_ids)
+        return created
+
+    # an ad another check saved meanwhile is skipped instead of failing the whole diff,
+    # and only the rows written here are returned
+    async def _insert_found_ads_sqlite(self, query_id: int, inserted: list[dict]) -> list[FoundAd]:
+        if not inserted:
+            return []
+        row = await self._backend.fetchone('SELECT COALESCE(MAX(id), 0) AS max_id FROM found_ad')
+        await self._backend.executemany(
+            f"""
+            INSERT INTO found_ad(query_id, ad_url, ad_description, ad_price, currency, is_active, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, {self._now_sql()})
+            ON CONFLICT DO NOTHING
+            """,
+            [(query_id, *_found_ad_values(ad), self._b(True)) for ad in inserted],
+        )
+        urls = [ad['ad_url'] for ad in inserted]
+        created = []
+        # stay below SQLITE_MAX_VARIABLE_NUMBER on old builds
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            rows = await self._backend.fetchall(
+                f'SELECT * FROM found_ad WHERE query_id = ? AND id > ? AND ad_url IN ({", ".join("?" * len(chunk))})',
+                (query_id, row['max_id'], *chunk),
+            )
+            created.extend(_row_found_ad(row) for row in rows)
+        return sorted(created, key=lambda ad: ad.id)
+
+    async def _insert_found_ads_pg(self, query_id: int, inserted: list[dict]) -> list[FoundAd]:
+        if not inserted:
+            return []
+        columns = list(zip(*(_found_ad_values(ad) for ad in inserted)))
+        rows = await self._backend.fetchall(
+            f"""
+            INSERT INTO found_ad(query_id, ad_url, ad_description, ad_price, currency, is_active, created_at)
+            SELECT ?::bigint, t.ad_url, t.ad_description, t.ad_price, t.currency, ?::boolean, {self._now_sql()}
+            FROM unnest(?::text[], ?::text[], ?::float8[], ?::text[])
+                AS t(ad_url, ad_description, ad_price, currency)
+            ON CONFLICT DO NOTHING
+            RETURNING *
+            """,
+            (query_id, self._b(True), *(list(column) for column in columns)),
+        )
+        return [_row_found_ad(row) for row in rows]
+
+    async def _set_found_ads_active(self, ad_ids: list[int], is_active: bool) -> None:
+        if not ad_ids:
+            return
+        if self.settings.use_sqlite:
+            await self._backend.executemany(
+                'UPDATE found_ad SET is_active = ? WHERE id = ?',
+                [(int(is_active), ad_id) for ad_id in ad_ids],
+            )
+        else:
+            await self._backend.execute(
+                'UPDATE found_ad SET is_active = ? WHERE id = ANY(?::bigint[])',
+                (is_active, list(ad_ids)),
+            )
 
     async def set_found_ad_active(self, ad_id: int, is_active: bool) -> None:
         await self._backend.execute(
@@ -579,29 +1094,45 @@ class Database:
             (self._b(is_active), ad_id),
         )
         await self._backend.commit()
+        if self.ad_index is not None:
+            self.ad_index.set_active([ad_id], is_active)
+
+    async def count_new_ads_by_query(self, window_seconds: float, skip_first_minutes: int) -> dict[int, int]:
+        skip_until = (
+            f"datetime(q.created_at, '+{int(skip_first_minutes)} minutes')"
+            if self.settings.use_sqlite
+            else f"q.created_at + INTERVAL '{int(skip_first_minutes)} minutes'"
+        )
+        # the unary plus keeps SQLite from walking found_ad_query_id_idx for the grouping
+        # instead of range-searching found_ad_created_idx
+        group_by = '+f.query_id' if self.settings.use_sqlite else 'f.query_id'
+        rows = await self._backend.fetchall(
+            f"""
+            SELECT f.query_id, COUNT(*) AS cnt
+            FROM found_ad f
+            JOIN checker_query q ON q.id = f.query_id
+            WHERE f.created_at >= {self._now_plus_sql()} AND f.created_at > {skip_until}
+            GROUP BY {group_by}
+            """,
+            (self._seconds(-window_seconds),),
+        )
+        return {row['query_id']: row['cnt'] for row in rows}
 
-    async def list_recent_ads(self, limit: int = 20) -> list[FoundAd]:
+    async def list_recent_ads(self, limit: int = 20, before_id: int | None = None) -> list[FoundAd]:
+        # keyset page over found_ad_active_id_idx with the owning query joined in, newest first
+        keyset = 'AND f.id < ?' if before_id else ''
         rows = await self._backend.fetchall(
-            f'SELECT * FROM found_ad WHERE {self._is_true("is_active")} ORDER BY id DESC LIMIT ?',
-            (limit,),
+            f"""
+            SELECT f.*, {_select_as('q', 'q_', QUERY_FIELDS)}
+            FROM found_ad f
+            JOIN checker_query q ON q.id = f.query_id
+            WHERE {self._is_true('f.is_active')} {keyset}
+            ORDER BY f.id DESC
+            LIMIT ?
+            """,
+            (before_id, limit) if before_id else (limit,),
         )
-        ads = []
-        for row in rows:
-            query = await self.get_query(row['query_id'])
-            ads.append(
-                FoundAd(
-                    id=row['id'],
-                    query_id=row['query_id'],
-                    ad_url=row['ad_url'],
-                    ad_description=row['ad_description'],
-                    ad_price=float(row['ad_price']),
-                    currency=row['currency'],
-                    is_active=bool(row['is_active']),
-                    created_at=_parse_dt(row.get('created_at')),
-                    query=query,
-                )
-            )
-        return ads
+        return [_row_found_ad(row, _row_query(_unprefix(row, 'q_'))) for row in rows]
 
     async def get_or_create_insta_user(self, username: str) -> InstaObservedUser:
         normalized = username.strip().lstrip('@')
@@ -617,13 +1148,13 @@ class Database:
                 is_deleted=bool(row.get('is_deleted', 0)),
                 created_at=_parse_dt(row.get('created_at')),
             )
-        await self._backend.execute(
+        observed_user_id = await self._backend.execute(
             f'INSERT INTO insta_observed_user(username, is_active, is_deleted, created_at) VALUES (?, ?, ?, {self._now_sql()})',
             (normalized, self._b(True), self._b(False)),
         )
         await self._backend.commit()
         return InstaObservedUser(
-            id=self._backend.lastrowid,
+            id=observed_user_id,
             username=normalized,
             is_active=True,
             is_deleted=False,
@@ -678,51 +1209,54 @@ class Database:
         observed_user = await self.get_insta_user(observed_user.id)
         return observed_user, created, restored
 
-    async def list_insta_subscriptions(self, user_telegram_id: int | None = None) -> list[InstaSubscription]:
+    async def _select_insta_subscriptions(
+        self,
+        filters: list[str],
+        params: list[Any],
+        order_by: str,
+        limit: int | None = None,
+        owner_fields: tuple[str, ...] = USER_FIELDS,
+    ) -> list[InstaSubscription]:
         if not await self._backend.table_exists('insta_subscription'):
             return []
         user_col = await self._insta_sub_user_column()
+        where = ' AND '.join([self._not_deleted('s.is_deleted'), self._not_deleted('o.is_deleted'), *filters])
         query = f"""
-            SELECT s.*, s.{user_col} AS user_telegram_id, u.username AS insta_username
+            SELECT s.id, s.observed_user_id, s.{user_col} AS user_telegram_id, s.is_active, s.is_deleted, s.created_at,
+                   o.username AS insta_username, {_select_as('u', 'owner_', owner_fields)}
             FROM insta_subscription s
-            JOIN insta_observed_user u ON u.id = s.observed_user_id
-            WHERE {self._not_deleted('s.is_deleted')} AND {self._not_deleted('u.is_deleted')}
+            JOIN insta_observed_user o ON o.id = s.observed_user_id
+            LEFT JOIN telegram_user u ON u.user_telegram_id = s.{user_col}
+            WHERE {where}
+            ORDER BY {order_by}
         """
-        params: list[Any] = []
+        if limit is not None:
+            query += ' LIMIT ?'
+            params = [*params, limit]
+        rows = await self._backend.fetchall(query, tuple(params))
+        return [_row_insta_subscription(row) for row in rows]
+
+    async def list_insta_subscriptions(self, user_telegram_id: int | None = None) -> list[InstaSubscription]:
+        filters, params = [], []
         if user_telegram_id:
-            query += f' AND s.{user_col} = ?'
+            filters.append(f's.{await self._insta_sub_user_column()} = ?')
             params.append(user_telegram_id)
-        query += ' ORDER BY u.username'
-        rows = await self._backend.fetchall(query, tuple(params))
-        result = []
-        for row in rows:
-            tg_id = self._subscription_telegram_id(row)
-            observed_user = InstaObservedUser(
-                id=row['observed_user_id'],
-                username=row['insta_username'],
-                is_active=True,
-                is_deleted=False,
-            )
-            user = await self.get_telegram_user(tg_id)
-            result.append(
-                InstaSubscription(
-                    id=row['id'],
-                    observed_user_id=row['observed_user_id'],
-                    user_telegram_id=tg_id,
-                    is_active=bool(row['is_active']),
-                    is_deleted=bool(row.get('is_deleted', 0)),
-                    created_at=_parse_dt(row.get('created_at')),
-                    observed_user=observed_user,
-                    user=user,
-                )
-            )
-        return result
+        return await self._select_insta_subscriptions(filters, params, 'o.username')
+
+    async def list_insta_subscriptions_page(self, before_id: int | None = None, limit: int = 30) -> list[InstaSubscription]:
+        filters, params = [], []
+        if before_id:
+            filters.append('s.id < ?')
+            params.append(before_id)
+        return await self._select_insta_subscriptions(filters, params, 's.id DESC', limit, OWNER_LABEL_FIELDS)
 
     async def get_insta_subscription(self, subscription_id: int, user_telegram_id: int | None = None) -> InstaSubscription | None:
-        for subscription in await self.list_insta_subscriptions(user_telegram_id):
-            if subscription.id == subscription_id:
-                return subscription
-        return None
+        filters, params = ['s.id = ?'], [subscription_id]
+        if user_telegram_id:
+            filters.append(f's.{await self._insta_sub_user_column()} = ?')
+            params.append(user_telegram_id)
+        subscriptions = await self._select_insta_subscriptions(filters, params, 's.id')
+        return subscriptions[0] if subscriptions else None
 
     async def toggle_insta_subscription(self, subscription_id: int, user_telegram_id: int | None = None) -> InstaSubscription:
         subscription = await self.get_insta_subscription(subscription_id, user_telegram_id)
@@ -806,17 +1340,19 @@ class Database:
         media_type: str,
         file_name: str,
         url: str,
+        outbox: list[OutboxMessage] = (),
     ) -> InstaContent:
-        await self._backend.execute(
-            f"""
-            INSERT INTO insta_content(observed_user_id, content_type, media_type, file_name, url, created_at)
-            VALUES (?, ?, ?, ?, ?, {self._now_sql()})
-            """,
-            (observed_user_id, content_type, media_type, file_name, url),
-        )
-        await self._backend.commit()
+        async with self._backend.transaction():
+            content_id = await self._backend.execute(
+                f"""
+                INSERT INTO insta_content(observed_user_id, content_type, media_type, file_name, url, created_at)
+                VALUES (?, ?, ?, ?, ?, {self._now_sql()})
+                """,
+                (observed_user_id, content_type, media_type, file_name, url),
+            )
+            await self._insert_outbox(outbox)
         return InstaContent(
-            id=self._backend.lastrowid,
+            id=content_id,
             observed_user_id=observed_user_id,
             content_type=content_type,
             media_type=media_type,
@@ -842,6 +1378,376 @@ class Database:
             for row in rows
         ]
 
+    async def _insert_outbox(self, messages: list[OutboxMessage]) -> None:
+        if not messages:
+            return
+        now = self._now_sql()
+        await self._backend.executemany(
+            f"""
+            INSERT INTO notification_outbox(
+                dedup_key, chat_id, kind, payload, group_key, status, attempts, available_at, created_at
+            )
+            VALUES (?, ?, ?, ?, ?, 'pending', 0, {self._now_plus_sql()}, {now})
+            ON CONFLICT(dedup_key) DO NOTHING
+            """,
+            [
+                (
+                    message.dedup_key,
+                    message.chat_id,
+                    message.kind,
+                    json.dumps(message.payload, ensure_ascii=False),
+                    message.group_key,
+                    self._seconds(message.delay_seconds),
+                )
+                for message in messages
+            ],
+        )
+
+    async def enqueue_outbox(self, messages: list[OutboxMessage]) -> None:
+        async with self._backend.transaction():
+            await self._insert_outbox(messages)
+
+    async def claim_outbox(self, limit: int, lease_seconds: float) -> list[OutboxMessage]:
+        # claimed messages stay 'sending' until the lease runs out and are then claimed again,
+        # so a crash between sending and mark_outbox_sent delivers twice rather than never
+        due = "status IN ('pending', 'sending') AND available_at <= {now}"
+        # a due digest takes along the rest of its group, even if their window is still open
+        waiting_in_group = "status = 'pending' AND available_at > {now} AND group_key IN ({keys})"
+        claim = f"UPDATE notification_outbox SET status = 'sending', available_at = {self._now_plus_sql()} WHERE id = ?"
+        async with self._backend.transaction():
+            if self.settings.use_sqlite:
+                rows = await self._backend.fetchall(
+                    f'SELECT * FROM notification_outbox WHERE {due.format(now="CURRENT_TIMESTAMP")} ORDER BY id LIMIT ?',
+                    (limit,),
+                )
+                group_keys = sorted({row['group_key'] for row in rows if row['group_key']})
+                if group_keys:
+                    rows += await self._backend.fetchall(
+                        'SELECT * FROM notification_outbox WHERE '
+                        + waiting_in_group.format(now='CURRENT_TIMESTAMP', keys=', '.join('?' * len(group_keys))),
+                        tuple(group_keys),
+                    )
+                await self._backend.executemany(claim, [(self._seconds(lease_seconds), row['id']) for row in rows])
+            else:
+                rows = await self._backend.fetchall(
+                    f"""
+                    UPDATE notification_outbox SET status = 'sending', available_at = {self._now_plus_sql()}
+                    WHERE id IN (
+                        SELECT id FROM notification_outbox WHERE {due.format(now='NOW()')}
+                        ORDER BY id LIMIT ?
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING *
+                    """,
+                    (self._seconds(lease_seconds), limit),
+                )
+                group_keys = sorted({row['group_key'] for row in rows if row['group_key']})
+                if group_keys:
+                    rows += await self._backend.fetchall(
+                        f"""
+                        UPDATE notification_outbox SET status = 'sending', available_at = {self._now_plus_sql()}
+                        WHERE id IN (
+                            SELECT id FROM notification_outbox
+                            WHERE {waiting_in_group.format(now='NOW()', keys='SELECT unnest(?::text[])')}
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING *
+                        """,
+                        (self._seconds(lease_seconds), group_keys),
+                    )
+        return sorted((_row_outbox(row) for row in rows), key=lambda message: message.id)
+
+    async def mark_outbox_sent(self, message_ids: list[int]) -> None:
+        if not message_ids:
+            return
+        async with self._backend.transaction():
+            await self._backend.executemany(
+                f"UPDATE notification_outbox SET status = 'sent', sent_at = {self._now_sql()} WHERE id = ?",
+                [(message_id,) for message_id in message_ids],
+            )
+
+    async def retry_outbox(self, message_ids: list[int], delay_seconds: float, max_attempts: int) -> None:
+        if not message_ids:
+            return
+        async with self._backend.transaction():
+            await self._backend.executemany(
+                f"""
+                UPDATE notification_outbox
+                SET attempts = attempts + 1,
+                    status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,
+                    available_at = {self._now_plus_sql()}
+                WHERE id = ?
+                """,
+                [(max_attempts, self._seconds(delay_seconds), message_id) for message_id in message_ids],
+            )
+
+    async def purge_outbox(self, older_than_days: int) -> None:
+        await self._backend.execute(
+            f"DELETE FROM notification_outbox WHERE status IN ('sent', 'failed') AND created_at < {self._now_plus_sql()}",
+            (self._seconds(-older_than_days * 86400),),
+        )
+        await self._backend.commit()
+
+    async def sync_check_leases(
+        self,
+        owner: str,
+        keys: list[str],
+        ttl_seconds: float,
+        busy: set[str] = frozenset(),
+    ) -> set[str]:
+        # every live worker keeps a 'worker:<owner>' heartbeat row and holds about
+        # len(keys) / workers partition leases; expired leases are free for anyone.
+        # leases in busy (checks still running here) are renewed and never handed over.
+        # 'run:' rows are manual run requests, see request_check_runs
+        now = 'CURRENT_TIMESTAMP' if self.settings.use_sqlite else 'NOW()'
+        expires = self._now_plus_sql()
+        ttl = self._seconds(ttl_seconds)
+        expired = self._seconds(-1)
+        wanted = set(keys)
+        async with self._backend.transaction():
+            await self._backend.execute(
+                f"""
+                INSERT INTO check_lease(lease_key, owner, expires_at) VALUES (?, ?, {expires})
+                ON CONFLICT(lease_key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                """,
+                (f'worker:{owner}', owner, ttl),
+            )
+            rows = await self._backend.fetchall(
+                f"SELECT lease_key, owner, expires_at >= {now} AS is_live FROM check_lease"
+            )
+            workers = sum(1 for row in rows if row['lease_key'].startswith('worker:') and row['is_live'])
+            existing = {row['lease_key'] for row in rows if not row['lease_key'].startswith(('worker:', 'run:'))}
+            stale = [
+                row['lease_key'] for row in rows
+                if not row['is_live'] and (row['lease_key'].startswith('worker:') or row['lease_key'] not in wanted)
+            ]
+            await self._backend.executemany(
+                'DELETE FROM check_lease WHERE lease_key = ?',
+                [(lease_key,) for lease_key in stale],
+            )
+            await self._backend.executemany(
+                f'INSERT INTO check_lease(lease_key, owner, expires_at) VALUES (?, NULL, {expires}) ON CONFLICT(lease_key) DO NOTHING',
+                [(lease_key, expired) for lease_key in sorted(wanted - existing)],
+            )
+
+            share = -(-len(wanted) // max(workers, 1))
+            held = [
+                row['lease_key'] for row in rows
+                if row['owner'] == owner and row['is_live'] and (row['lease_key'] in wanted or row['lease_key'] in busy)
+            ]
+            running = sorted(lease_key for lease_key in held if lease_key in busy)
+            idle = sorted(lease_key for lease_key in held if lease_key not in busy)
+            free_slots = max(share - len(running), 0)
+            kept, released = running + idle[:free_slots], idle[free_slots:]
+            await self._backend.executemany(
+                f'UPDATE check_lease SET expires_at = {expires} WHERE lease_key = ? AND owner = ?',
+                [(ttl, lease_key, owner) for lease_key in kept],
+            )
+            await self._backend.executemany(
+                f'UPDATE check_lease SET owner = NULL, expires_at = {expires} WHERE lease_key = ? AND owner = ?',
+                [(expired, lease_key, owner) for lease_key in released],
+            )
+
+            missing = share - len(kept)
+            if missing > 0:
+                lock = '' if self.settings.use_sqlite else 'FOR UPDATE SKIP LOCKED'
+                free_rows = await self._backend.fetchall(
+                    f"""
+                    SELECT lease_key FROM check_lease
+                    WHERE lease_key NOT LIKE 'worker:%' AND lease_key NOT LIKE 'run:%' AND expires_at < {now}
+                    ORDER BY lease_key LIMIT ?
+                    {lock}
+                    """,
+                    (missing,),
+                )
+                # the expiry condition is repeated so a row taken by another worker meanwhile is left alone
+                await self._backend.executemany(
+                    f'UPDATE check_lease SET owner = ?, expires_at = {expires} WHERE lease_key = ? AND expires_at < {now}',
+                    [(owner, ttl, row['lease_key']) for row in free_rows if row['lease_key'] in wanted],
+                )
+
+            owned = await self._backend.fetchall(
+                f"SELECT lease_key FROM check_lease WHERE owner = ? AND expires_at >= {now} AND lease_key NOT LIKE 'worker:%'",
+                (owner,),
+            )
+        return {row['lease_key'] for row in owned} & wanted
+
+    async def release_check_leases(self, owner: str) -> None:
+        await self._backend.execute(
+            f'UPDATE check_lease SET owner = NULL, expires_at = {self._now_plus_sql()} WHERE owner = ?',
+            (self._seconds(-1), owner),
+        )
+        await self._backend.commit()
+
+    async def request_check_runs(self, run_prefix: str, ttl_seconds: float) -> list[str]:
+        # one '<run_prefix><owner>' row per live worker; each worker deletes its own row once its
+        # checks have run, the requester keeps the rows alive while it waits
+        async with self._backend.transaction():
+            rows = await self._backend.fetchall(
+                f"SELECT owner FROM check_lease WHERE lease_key LIKE 'worker:%' AND expires_at >= {self._now_sql()}"
+            )
+            owners = sorted(row['owner'] for row in rows if row['owner'])
+            await self._backend.executemany(
+                f"""
+                INSERT INTO check_lease(lease_key, owner, expires_at) VALUES (?, ?, {self._now_plus_sql()})
+                ON CONFLICT(lease_key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                """,
+                [(f'{run_prefix}{owner}', owner, self._seconds(ttl_seconds)) for owner in owners],
+            )
+        return owners
+
+    async def renew_check_runs(self, run_prefix: str, ttl_seconds: float) -> int:
+        # returns how many requested runs are still pending on live workers
+        async with self._backend.transaction():
+            await self._backend.execute(
+                f'UPDATE check_lease SET expires_at = {self._now_plus_sql()} WHERE lease_key LIKE ?',
+                (self._seconds(ttl_seconds), f'{run_prefix}%'),
+            )
+            row = await self._backend.fetchone(
+                f"""
+                SELECT COUNT(*) AS cnt
+                FROM check_lease AS run
+                JOIN check_lease AS worker ON worker.lease_key = 'worker:' || run.owner
+                WHERE run.lease_key LIKE ? AND worker.expires_at >= {self._now_sql()}
+                """,
+                (f'{run_prefix}%',),
+            )
+        return row['cnt']
+
+    async def list_check_runs(self, owner: str) -> list[str]:
+        rows = await self._backend.fetchall(
+            "SELECT lease_key FROM check_lease WHERE lease_key LIKE 'run:%' AND owner = ?",
+            (owner,),
+        )
+        return [row['lease_key'] for row in rows]
+
+    async def finish_check_run(self, lease_key: str) -> None:
+        await self._backend.execute('DELETE FROM check_lease WHERE lease_key = ?', (lease_key,))
+        await self._backend.commit()
+
+    async def cancel_check_runs(self, run_prefix: str) -> None:
+        await self._backend.execute('DELETE FROM check_lease WHERE lease_key LIKE ?', (f'{run_prefix}%',))
+        await self._backend.commit()
+
+    async def enqueue_job(self, job: Job) -> tuple[Job, bool]:
+        # a job with the same dedup_key that is still queued or running is returned instead
+        active = "SELECT * FROM job_queue WHERE dedup_key = ? AND status IN ('queued', 'running') ORDER BY id LIMIT 1"
+        async with self._backend.transaction():
+            row = await self._backend.fetchone(active, (job.dedup_key,))
+            if row:
+                return _row_job(row), False
+            await self._backend.execute(
+                f"""
+                INSERT INTO job_queue(kind, dedup_key, payload, priority, status, attempts, available_at, created_at)
+                VALUES (?, ?, ?, ?, 'queued', 0, {self._now_sql()}, {self._now_sql()})
+                ON CONFLICT(dedup_key) WHERE status IN ('queued', 'running') DO NOTHING
+                """,
+                (job.kind, job.dedup_key, json.dumps(job.payload, ensure_ascii=False), job.priority),
+            )
+            row = await self._backend.fetchone(active, (job.dedup_key,))
+        return _row_job(row), True
+
+    async def count_jobs_ahead(self, job: Job) -> int:
+        row = await self._backend.fetchone(
+            """
+            SELECT COUNT(*) AS cnt FROM job_queue
+            WHERE status = 'queued' AND kind = ? AND (priority < ? OR (priority = ? AND id < ?))
+            """,
+            (job.kind, job.priority, job.priority, job.id),
+        )
+        return row['cnt'] or 0
+
+    async def claim_job(self, owner: str, kinds: list[str], lease_seconds: float, max_attempts: int) -> Job | None:
+        # a running job whose lease ran out belongs to a crashed process and is claimed again
+        now = self._now_sql()
+        kinds_sql = ', '.join('?' * len(kinds))
+        claimable = f"kind IN ({kinds_sql}) AND (status = 'queued' OR (status = 'running' AND available_at < {now}))"
+        claim = f"""
+            UPDATE job_queue
+            SET status = 'running', owner = ?, attempts = attempts + 1, started_at = {now},
+                available_at = {self._now_plus_sql()}
+            """
+        async with self._backend.transaction():
+            await self._backend.execute(
+                f"""
+                UPDATE job_queue SET status = 'failed', error = 'lease expired', finished_at = {now}
+                WHERE status = 'running' AND available_at < {now} AND attempts >= ?
+                """,
+                (max_attempts,),
+            )
+            if self.settings.use_sqlite:
+                row = await self._backend.fetchone(
+                    f'SELECT id FROM job_queue WHERE {claimable} ORDER BY priority, id LIMIT 1',
+                    tuple(kinds),
+                )
+                if not row:
+                    return None
+                await self._backend.execute(
+                    f'{claim} WHERE id = ? AND ({claimable})',
+                    (owner, self._seconds(lease_seconds), row['id'], *kinds),
+                )
+                row = await self._backend.fetchone(
+                    "SELECT * FROM job_queue WHERE id = ? AND owner = ? AND status = 'running'",
+                    (row['id'], owner),
+                )
+            else:
+                row = await self._backend.fetchone(
+                    f"""
+                    {claim}
+                    WHERE id = (
+                        SELECT id FROM job_queue WHERE {claimable}
+                        ORDER BY priority, id LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING *
+                    """,
+                    (owner, self._seconds(lease_seconds), *kinds),
+                )
+        return _row_job(row) if row else None
+
+    async def renew_jobs(self, owner: str, job_ids: list[int], lease_seconds: float) -> None:
+        if not job_ids:
+            return
+        async with self._backend.transaction():
+            await self._backend.executemany(
+                f"UPDATE job_queue SET available_at = {self._now_plus_sql()} WHERE id = ? AND owner = ? AND status = 'running'",
+                [(self._seconds(lease_seconds), job_id, owner) for job_id in job_ids],
+            )
+
+    async def finish_job(self, job_id: int, owner: str, error: str | None = None) -> None:
+        await self._backend.execute(
+            f"""
+            UPDATE job_queue SET status = ?, error = ?, finished_at = {self._now_sql()}
+            WHERE id = ? AND owner = ? AND status = 'running'
+            """,
+            ('failed' if error else 'done', error, job_id, owner),
+        )
+        await self._backend.commit()
+
+    async def release_jobs(self, owner: str) -> None:
+        # jobs interrupted by a shutdown go back to the queue for the next process
+        await self._backend.execute(
+            f"UPDATE job_queue SET status = 'queued', owner = NULL, available_at = {self._now_sql()} WHERE owner = ? AND status = 'running'",
+            (owner,),
+        )
+        await self._backend.commit()
+
+    async def count_active_jobs(self) -> dict[str, dict[str, int]]:
+        rows = await self._backend.fetchall(
+            "SELECT kind, status, COUNT(*) AS cnt FROM job_queue WHERE status IN ('queued', 'running') GROUP BY kind, status"
+        )
+        counts: dict[str, dict[str, int]] = {}
+        for row in rows:
+            counts.setdefault(row['kind'], {})[row['status']] = row['cnt']
+        return counts
+
+    async def purge_jobs(self, older_than_days: int) -> None:
+        await self._backend.execute(
+            f"DELETE FROM job_queue WHERE status IN ('done', 'failed') AND created_at < {self._now_plus_sql()}",
+            (self._seconds(-older_than_days * 86400),),
+        )
+        await self._backend.commit()
+
     async def dashboard_stats(self) -> dict[str, int]:
         row = await self._backend.fetchone(
             f"""
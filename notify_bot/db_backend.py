@@ -1,9 +1,19 @@
+import asyncio
 import re
-from typing import Any
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Iterable
 
 import aiosqlite
 
+_pg_tx_conn: ContextVar = ContextVar('pg_tx_conn', default=None)
+_sqlite_in_tx: ContextVar = ContextVar('sqlite_in_tx', default=False)
 
+
+# the SQL texts are the f-string templates in database.py, so the set stays small
+@lru_cache(maxsize=1024)
 def _pg_sql(sql: str) -> str:
     index = 0
 
@@ -15,28 +25,98 @@ def _pg_sql(sql: str) -> str:
     return re.sub(r'\?', repl, sql)
 
 
-class SqliteBackend:
+@lru_cache(maxsize=1024)
+def _insert_table(pg_sql: str) -> str | None:
+    match = re.match(r'\s*INSERT\s+INTO\s+(\w+)', pg_sql, re.IGNORECASE)
+    if match is None or re.search(r'\bRETURNING\b', pg_sql, re.IGNORECASE):
+        return None
+    return match.group(1).lower()
+
+
+class _SchemaCache(ABC):
+    # tables and columns are read once at connect and kept current by the DDL helpers below,
+    # so table_exists/column_exists probes on hot paths cost nothing
+    _schema: dict[str, set[str]]
+
+    @abstractmethod
+    async def _read_schema(self) -> dict[str, set[str]]:
+        ...
+
+    async def load_schema(self) -> None:
+        self._schema = await self._read_schema()
+
+    async def table_exists(self, table_name: str) -> bool:
+        return table_name in self._schema
+
+    async def column_exists(self, table_name: str, column_name: str) -> bool:
+        return column_name in self._schema.get(table_name, ())
+
+    async def add_column_if_missing(self, table_name: str, column_name: str, definition: str) -> None:
+        if not await self.column_exists(table_name, column_name):
+            await self.execute(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}')
+            await self.commit()
+            self._schema.setdefault(table_name, set()).add(column_name)
+
+
+class SqliteBackend(_SchemaCache):
     def __init__(self, path: str):
         self.path = path
         self._conn: aiosqlite.Connection | None = None
-        self.lastrowid: int | None = None
+        self._tx_lock = asyncio.Lock()
+        self._schema = {}
 
     async def connect(self) -> None:
-        self._conn = await aiosqlite.connect(self.path)
+        self._conn = await aiosqlite.connect(self.path, cached_statements=512)
         self._conn.row_factory = aiosqlite.Row
+        await self.load_schema()
 
     async def close(self) -> None:
         if self._conn:
             await self._conn.close()
             self._conn = None
 
-    async def executescript(self, sql: str) -> None:
-        await self._conn.executescript(sql)
-        await self._conn.commit()
+    # one connection is shared by every task: outside transaction() each write takes the lock and
+    # commits on its own, so it can neither commit nor be rolled back with another task's transaction
+    @asynccontextmanager
+    async def _write(self):
+        if _sqlite_in_tx.get():
+            yield
+            return
+        async with self._tx_lock:
+            yield
+            await self._conn.commit()
 
-    async def execute(self, sql: str, params: tuple[Any, ...] = ()) -> None:
-        cursor = await self._conn.execute(sql, params)
-        self.lastrowid = cursor.lastrowid
+    async def executescript(self, sql: str) -> None:
+        async with self._write():
+            await self._conn.executescript(sql)
+        await self.load_schema()
+
+    async def execute(self, sql: str, params: tuple[Any, ...] = ()) -> int | None:
+        # returns the id of an inserted row; it is never kept on the backend, which every task shares
+        async with self._write():
+            cursor = await self._conn.execute(sql, params)
+        return cursor.lastrowid
+
+    async def executemany(self, sql: str, params_seq: Iterable[tuple[Any, ...]]) -> None:
+        async with self._write():
+            await self._conn.executemany(sql, params_seq)
+
+    @asynccontextmanager
+    async def transaction(self):
+        if _sqlite_in_tx.get():
+            yield self
+            return
+        async with self._tx_lock:
+            token = _sqlite_in_tx.set(True)
+            try:
+                yield self
+            except BaseException:
+                await self._conn.rollback()
+                raise
+            else:
+                await self._conn.commit()
+            finally:
+                _sqlite_in_tx.reset(token)
 
     async def fetchone(self, sql: str, params: tuple[Any, ...] = ()) -> dict | None:
         cursor = await self._conn.execute(sql, params)
@@ -49,34 +129,28 @@ class SqliteBackend:
         return [dict(row) for row in rows]
 
     async def commit(self) -> None:
-        await self._conn.commit()
-
-    async def table_exists(self, table_name: str) -> bool:
-        row = await self.fetchone(
-            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
-            (table_name,),
-        )
-        return row is not None
-
-    async def column_exists(self, table_name: str, column_name: str) -> bool:
-        rows = await self.fetchall(f'PRAGMA table_info({table_name})')
-        return any(row['name'] == column_name for row in rows)
+        # writes outside transaction() are already committed
+        return None
 
-    async def add_column_if_missing(self, table_name: str, column_name: str, definition: str) -> None:
-        if not await self.column_exists(table_name, column_name):
-            await self.execute(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}')
-            await self.commit()
+    async def _read_schema(self) -> dict[str, set[str]]:
+        tables = await self.fetchall("SELECT name FROM sqlite_master WHERE type='table'")
+        schema = {}
+        for table in tables:
+            columns = await self.fetchall(f'PRAGMA table_info({table["name"]})')
+            schema[table['name']] = {column['name'] for column in columns}
+        return schema
 
 
-class PostgresBackend:
-    def __init__(self, host: str, database: str, user: str, password: str, port: int):
+class PostgresBackend(_SchemaCache):
+    def __init__(self, host: str, database: str, user: str, password: str, port: int, statement_cache_size: int = 512):
         self.host = host
         self.database = database
         self.user = user
         self.password = password
         self.port = port
+        self.statement_cache_size = statement_cache_size
         self._pool = None
-        self.lastrowid: int | None = None
+        self._schema = {}
 
     async def connect(self) -> None:
         import asyncpg
@@ -89,7 +163,10 @@ class PostgresBackend:
             port=self.port,
             min_size=1,
             max_size=3,
+            # queries with parameters are prepared once per connection and reused from this cache
+            statement_cache_size=self.statement_cache_size,
         )
+        await self.load_schema()
 
     async def close(self) -> None:
         if self._pool:
@@ -100,67 +177,68 @@ class PostgresBackend:
         statements = [part.strip() for part in sql.split(';') if part.strip()]
         for statement in statements:
             await self.execute(statement)
+        await self.load_schema()
+
+    @asynccontextmanager
+    async def _acquire(self):
+        conn = _pg_tx_conn.get()
+        if conn is not None:
+            yield conn
+            return
+        async with self._pool.acquire() as conn:
+            yield conn
 
-    async def execute(self, sql: str, params: tuple[Any, ...] = ()) -> None:
-        pg_sql = _pg_sql(sql)
-        returning = self._insert_returning(pg_sql)
+    @asynccontextmanager
+    async def transaction(self):
         async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                token = _pg_tx_conn.set(conn)
+                try:
+                    yield self
+                finally:
+                    _pg_tx_conn.reset(token)
+
+    async def execute(self, sql: str, params: tuple[Any, ...] = ()) -> int | None:
+        pg_sql = _pg_sql(sql)
+        table = _insert_table(pg_sql)
+        # tables with natural primary keys (telegram_user, check_lease, ...) have no serial id to return
+        returning = table is not None and await self.column_exists(table, 'id')
+        async with self._acquire() as conn:
             if returning:
-                row = await conn.fetchrow(pg_sql + returning, *params)
-                self.lastrowid = row['id'] if row else None
-            else:
-                await conn.execute(pg_sql, *params)
-                self.lastrowid = None
-
-    @staticmethod
-    def _insert_returning(pg_sql: str) -> str:
-        upper = pg_sql.strip().upper()
-        if not upper.startswith('INSERT') or 'RETURNING' in upper:
-            return ''
-        # telegram_user uses user_telegram_id as PK, no serial id column
-        if 'INTO TELEGRAM_USER' in upper:
-            return ''
-        return ' RETURNING id'
+                row = await conn.fetchrow(pg_sql + ' RETURNING id', *params)
+                return row['id'] if row else None
+            await conn.execute(pg_sql, *params)
+            return None
+
+    async def executemany(self, sql: str, params_seq: Iterable[tuple[Any, ...]]) -> None:
+        async with self._acquire() as conn:
+            await conn.executemany(_pg_sql(sql), params_seq)
 
     async def fetchone(self, sql: str, params: tuple[Any, ...] = ()) -> dict | None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             row = await conn.fetchrow(_pg_sql(sql), *params)
             return dict(row) if row else None
 
     async def fetchall(self, sql: str, params: tuple[Any, ...] = ()) -> list[dict]:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             rows = await conn.fetch(_pg_sql(sql), *params)
             return [dict(row) for row in rows]
 
     async def commit(self) -> None:
         return None
 
-    async def table_exists(self, table_name: str) -> bool:
-        row = await self.fetchone(
-            """
-            SELECT 1
-            FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = ?
-            """,
-            (table_name,),
-        )
-        return row is not None
-
-    async def column_exists(self, table_name: str, column_name: str) -> bool:
-        row = await self.fetchone(
+    async def _read_schema(self) -> dict[str, set[str]]:
+        rows = await self.fetchall(
             """
-            SELECT 1
+            SELECT table_name, column_name
             FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = ? AND column_name = ?
-            """,
-            (table_name, column_name),
+            WHERE table_schema = 'public'
+            """
         )
-        return row is not None
-
-    async def add_column_if_missing(self, table_name: str, column_name: str, definition: str) -> None:
-        if not await self.column_exists(table_name, column_name):
-            await self.execute(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}')
-            await self.commit()
+        schema: dict[str, set[str]] = {}
+        for row in rows:
+            schema.setdefault(row['table_name'], set()).add(row['column_name'])
+        return schema
 
 
 async def create_backend(settings) -> SqliteBackend | PostgresBackend:
@@ -175,6 +253,7 @@ async def create_backend(settings) -> SqliteBackend | PostgresBackend:
             user=settings.db_user,
             password=settings.db_password,
             port=settings.db_port,
+            statement_cache_size=settings.pg_statement_cache_size,
         )
     await backend.connect()
     return backend
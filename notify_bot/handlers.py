@@ -1,4 +1,3 @@
-import asyncio
 import logging
 
 from aiogram import F, Router, html
@@ -20,8 +19,8 @@ from notify_bot.keyboards import (
     get_rieltor_menu_keyboard,
     get_start_keyboard,
 )
+from notify_bot.jobs import JOB_INITIAL_PARSE, JOB_PRIORITY_HIGH
 from notify_bot.services import MonitorService
-from notify_bot.tasks import initialize_query_ads
 
 logger = logging.getLogger(__name__)
 user_router = Router(name='user')
@@ -175,7 +174,33 @@ async def command_query_edit_handler(callback: CallbackQuery) -> None:
     status = '✅' if checker_query.is_active else '🚫'
     await callback.message.answer(
         f'{html.bold("Назва моніторингу:")} "{checker_query.query_name}" ({status})',
-        reply_markup=get_query_edit_inline_keyboard(query_id, checker_query.is_active, checker_query.source),
+        reply_markup=get_query_edit_inline_keyboard(
+            query_id,
+            checker_query.is_active,
+            checker_query.source,
+            checker_query.digest_minutes,
+        ),
+    )
+
+
+@user_router.callback_query(F.data.startswith('query_digest'))
+async def command_query_digest_handler(callback: CallbackQuery) -> None:
+    ctx = get_context(callback)
+    query_id = int(callback.data.split('_')[-1])
+    checker_query = await ctx.monitor_service.cycle_query_digest(query_id)
+    if checker_query.digest_minutes is None:
+        await callback.answer('Кожне нове оголошення надсилатиметься окремо')
+    elif checker_query.digest_minutes == 0:
+        await callback.answer('Нові оголошення надсилатимуться одним дайджестом після перевірки')
+    else:
+        await callback.answer(f'Нові оголошення збиратимуться в дайджест раз на {checker_query.digest_minutes} хв')
+    await callback.message.edit_reply_markup(
+        reply_markup=get_query_edit_inline_keyboard(
+            query_id,
+            checker_query.is_active,
+            checker_query.source,
+            checker_query.digest_minutes,
+        ),
     )
 
 
@@ -259,13 +284,21 @@ async def add_query_by_url_step3(message: Message, state: FSMContext):
         return
 
     query = await ctx.monitor_service.create_query(message.from_user.id, data['query_name'], query_url, False)
-    asyncio.create_task(initialize_query_ads(ctx.bot, ctx.db, ctx.monitor_service, query.id))
+    initial_parse_status = await _queue_initial_parse(ctx, query.id)
     await message.answer(
         f'Додано моніторинг: {html.bold(data["query_name"])}\n'
-        f'Первинна перевірка запущена у фоні.\nURL запиту: {query_url}'
+        f'{initial_parse_status}\nURL запиту: {query_url}'
     )
 
 
+async def _queue_initial_parse(ctx: AppContext, query_id: int) -> str:
+    job, _ = await ctx.jobs.submit(JOB_INITIAL_PARSE, f'initial_parse:{query_id}', {'query_id': query_id}, JOB_PRIORITY_HIGH)
+    ahead = await ctx.jobs.jobs_ahead(job) if job.status == 'queued' else 0
+    if ahead:
+        return f'Первинна перевірка в черзі, перед нею {ahead} запит(ів).'
+    return 'Первинна перевірка запущена у фоні.'
+
+
 @user_router.callback_query(F.data == 'query_by_text')
 async def add_query_by_text_step1(callback: CallbackQuery, state: FSMContext):
     await callback.answer('')
@@ -289,10 +322,10 @@ async def add_query_by_text_step2(message: Message, state: FSMContext):
         return
 
     query = await ctx.monitor_service.create_query(message.from_user.id, query_text, query_url, False)
-    asyncio.create_task(initialize_query_ads(ctx.bot, ctx.db, ctx.monitor_service, query.id))
+    initial_parse_status = await _queue_initial_parse(ctx, query.id)
     await message.answer(
         f'Додано моніторинг: {html.bold(query_text)}\n'
-        f'Первинна перевірка запущена у фоні.\nURL запиту: {query_url}'
+        f'{initial_parse_status}\nURL запиту: {query_url}'
     )
 
 
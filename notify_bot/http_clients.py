@@ -0,0 +1,64 @@
+import importlib.util
+import logging
+from urllib.parse import urlsplit
+
+import httpx
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from notify_bot.config import Settings
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+class HttpClients:
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        # one client per search host (only a few olx.ua ones), media from CDN hosts goes through _media_client
+        self._httpx_clients: dict[str, httpx.AsyncClient] = {}
+        self._media_client: httpx.AsyncClient | None = None
+        self._aiohttp_session: ClientSession | None = None
+
+    def httpx_client(self, url: str) -> httpx.AsyncClient:
+        host = urlsplit(url).netloc.lower()
+        client = self._httpx_clients.get(host)
+        if client is None:
+            client = self._new_httpx_client()
+            self._httpx_clients[host] = client
+            logger.info('HTTP clients: opened httpx client for %s (http2=%s)', host, HTTP2_AVAILABLE)
+        return client
+
+    def media_client(self) -> httpx.AsyncClient:
+        # Instagram media comes from many rotating CDN hosts, a client per host would pile up
+        if self._media_client is None:
+            self._media_client = self._new_httpx_client()
+        return self._media_client
+
+    def _new_httpx_client(self) -> httpx.AsyncClient:
+        limit = self.settings.http_connections_per_host
+        return httpx.AsyncClient(
+            follow_redirects=True,
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(self.settings.http_timeout_seconds),
+            limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+        )
+
+    def aiohttp_session(self) -> ClientSession:
+        if self._aiohttp_session is None or self._aiohttp_session.closed:
+            self._aiohttp_session = ClientSession(
+                connector=TCPConnector(limit_per_host=self.settings.http_connections_per_host),
+                timeout=ClientTimeout(total=self.settings.http_timeout_seconds),
+            )
+        return self._aiohttp_session
+
+    async def close(self) -> None:
+        for client in self._httpx_clients.values():
+            await client.aclose()
+        self._httpx_clients.clear()
+        if self._media_client is not None:
+            await self._media_client.aclose()
+            self._media_client = None
+        if self._aiohttp_session is not None:
+            await self._aiohttp_session.close()
+            self._aiohttp_session = None
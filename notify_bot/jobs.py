@@ -0,0 +1,296 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from notify_bot.database import Database
+from notify_bot.models import Job
+from notify_bot.tasks import initialize_query_ads
+
+logger = logging.getLogger(__name__)
+
+JOB_INITIAL_PARSE = 'initial_parse'
+JOB_CHECK_ADS = 'check_ads'
+JOB_CHECK_INSTA = 'check_insta'
+JOB_LOG_ROLLUP = 'job_log_rollup'
+
+JOB_PRIORITY_HIGH = 0
+JOB_PRIORITY_NORMAL = 10
+JOB_PRIORITY_LOW = 20
+
+JOB_RETENTION_DAYS = 7
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class DbJobStore:
+    def __init__(self, db: Database, owner: str):
+        self.db = db
+        self.owner = owner
+        self.lease_seconds = db.settings.job_lease_seconds
+        self.max_attempts = max(db.settings.job_max_attempts, 1)
+
+    async def enqueue(self, job: Job) -> tuple[Job, bool]:
+        return await self.db.enqueue_job(job)
+
+    async def jobs_ahead(self, job: Job) -> int:
+        return await self.db.count_jobs_ahead(job)
+
+    async def claim(self, kinds: list[str]) -> Job | None:
+        return await self.db.claim_job(self.owner, kinds, self.lease_seconds, self.max_attempts)
+
+    async def renew(self, job_ids: list[int]) -> None:
+        await self.db.renew_jobs(self.owner, job_ids, self.lease_seconds)
+
+    async def finish(self, job: Job, error: str | None = None) -> None:
+        await self.db.finish_job(job.id, self.owner, error)
+
+    async def release(self) -> None:
+        await self.db.release_jobs(self.owner)
+
+    async def counts(self) -> dict[str, dict[str, int]]:
+        return await self.db.count_active_jobs()
+
+    async def purge(self) -> None:
+        await self.db.purge_jobs(JOB_RETENTION_DAYS)
+
+
+class LocalJobStore:
+    # keeps jobs in this process only: nothing survives a restart and workers never see them
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._jobs: dict[int, Job] = {}
+        self._active: dict[str, int] = {}
+        self._queue: list[tuple[int, int]] = []
+
+    async def enqueue(self, job: Job) -> tuple[Job, bool]:
+        active_id = self._active.get(job.dedup_key)
+        if active_id is not None:
+            return self._jobs[active_id], False
+        job.id = next(self._ids)
+        job.status = 'queued'
+        self._jobs[job.id] = job
+        self._active[job.dedup_key] = job.id
+        self._queue.append((job.priority, job.id))
+        return job, True
+
+    async def jobs_ahead(self, job: Job) -> int:
+        return sum(
+            1 for priority, job_id in self._queue
+            if self._jobs[job_id].kind == job.kind and (priority, job_id) < (job.priority, job.id)
+        )
+
+    async def claim(self, kinds: list[str]) -> Job | None:
+        candidates = [entry for entry in self._queue if self._jobs[entry[1]].kind in kinds]
+        if not candidates:
+            return None
+        entry = min(candidates)
+        self._queue.remove(entry)
+        job = self._jobs[entry[1]]
+        job.status = 'running'
+        job.attempts += 1
+        return job
+
+    async def renew(self, job_ids: list[int]) -> None:
+        pass
+
+    async def finish(self, job: Job, error: str | None = None) -> None:
+        job.status = 'failed' if error else 'done'
+        job.error = error
+        self._active.pop(job.dedup_key, None)
+        del self._jobs[job.id]
+
+    async def release(self) -> None:
+        pass
+
+    async def counts(self) -> dict[str, dict[str, int]]:
+        counts: dict[str, dict[str, int]] = {}
+        for job in self._jobs.values():
+            kind_counts = counts.setdefault(job.kind, {})
+            kind_counts[job.status] = kind_counts.get(job.status, 0) + 1
+        return counts
+
+    async def purge(self) -> None:
+        pass
+
+
+class JobQueue:
+    def __init__(self, bot, db: Database, store, monitor_service, http_clients=None):
+        self.bot = bot
+        self.db = db
+        self.store = store
+        self.monitor_service = monitor_service
+        self.http_clients = http_clients
+        settings = db.settings
+        self.poll_seconds = settings.job_poll_seconds
+        self.renew_seconds = max(settings.job_lease_seconds / 3, self.poll_seconds)
+        # per-kind caps keep a burst of new subscriptions from taking over the scrapers
+        self.limits = {
+            JOB_INITIAL_PARSE: max(settings.job_initial_parse_concurrency, 1),
+            JOB_CHECK_ADS: 1,
+            JOB_CHECK_INSTA: 1,
+            JOB_LOG_ROLLUP: 1,
+        }
+        self._handlers = {
+            JOB_INITIAL_PARSE: self._initial_parse,
+            JOB_CHECK_ADS: self._check_ads,
+            JOB_CHECK_INSTA: self._check_insta,
+            JOB_LOG_ROLLUP: self._rollup_logs,
+        }
+        # set by run_scheduler while this process runs scheduled checks
+        self.scheduler = None
+        self._running: dict[int, tuple[Job, asyncio.Task]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._renewed_at = 0.0
+        self._purged_at = 0.0
+
+    async def submit(
+        self,
+        kind: str,
+        dedup_key: str,
+        payload: dict | None = None,
+        priority: int = JOB_PRIORITY_NORMAL,
+    ) -> tuple[Job, bool]:
+        job = Job(kind=kind, dedup_key=dedup_key, payload=payload or {}, priority=priority)
+        job, created = await self.store.enqueue(job)
+        if created:
+            logger.info('Jobs: queued %s (id=%s, key=%s)', kind, job.id, dedup_key)
+            self._wakeup.set()
+        return job, created
+
+    async def jobs_ahead(self, job: Job) -> int:
+        return await self.store.jobs_ahead(job)
+
+    async def counts(self) -> dict[str, dict[str, int]]:
+        return await self.store.counts()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info('Jobs: runner started, limits %s', self.limits)
+
+    async def close(self) -> None:
+        tasks = [task for _, task in self._running.values()]
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        try:
+            await self.store.release()
+        except Exception:
+            logger.exception('Jobs: failed to release running jobs')
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._claim_free_slots()
+                await self._maintain()
+            except Exception:
+                logger.exception('Jobs: runner iteration failed')
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim_free_slots(self) -> None:
+        while True:
+            running_by_kind = {}
+            for job, _ in self._running.values():
+                running_by_kind[job.kind] = running_by_kind.get(job.kind, 0) + 1
+            kinds = [kind for kind, limit in self.limits.items() if running_by_kind.get(kind, 0) < limit]
+            if not kinds:
+                return
+            job = await self.store.claim(kinds)
+            if job is None:
+                return
+            task = asyncio.create_task(self._execute(job))
+            self._running[job.id] = (job, task)
+
+    async def _maintain(self) -> None:
+        now = time.monotonic()
+        if self._running and now - self._renewed_at >= self.renew_seconds:
+            self._renewed_at = now
+            await self.store.renew(list(self._running))
+        if now - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            self._purged_at = now
+            await self.store.purge()
+            # every runner asks for it, the dedup key leaves a single one queued
+            await self.submit(JOB_LOG_ROLLUP, JOB_LOG_ROLLUP, priority=JOB_PRIORITY_LOW)
+
+    async def _execute(self, job: Job) -> None:
+        started_at = time.monotonic()
+        error = None
+        try:
+            await self._handlers[job.kind](job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception('Jobs: %s (id=%s) failed', job.kind, job.id)
+            error = repr(exc)[:500]
+        try:
+            await self.store.finish(job, error)
+            logger.info(
+                'Jobs: %s (id=%s) %s in %.1f sec',
+                job.kind,
+                job.id,
+                'failed' if error else 'done',
+                time.monotonic() - started_at,
+            )
+        finally:
+            self._running.pop(job.id, None)
+            self._wakeup.set()
+
+    async def _initial_parse(self, job: Job) -> None:
+        await initialize_query_ads(self.bot, self.db, self.monitor_service, job.payload['query_id'])
+
+    async def _check_ads(self, job: Job) -> None:
+        await self._run_checks_now(job, 'ads')
+
+    async def _check_insta(self, job: Job) -> None:
+        await self._run_checks_now(job, 'insta')
+
+    async def _run_checks_now(self, job: Job, kind: str) -> None:
+        # the checks themselves stay with the schedulers, which hold the leases and keep
+        # runs of one search from overlapping; the job is done once every worker has run its share
+        scheduler = self.scheduler
+        if scheduler is None:
+            raise RuntimeError('no scheduled checks run in this process')
+        leases = scheduler.leases
+        if leases is None:
+            ran = await scheduler.serve_run(kind)
+            logger.info('Jobs: %s (id=%s) ran %s %s check(s)', job.kind, job.id, ran, kind)
+            return
+        workers = await leases.request_runs(kind, job.id)
+        try:
+            # other workers pick the request up on their next scheduler refresh
+            ran = await scheduler.serve_run(kind, leases.own_run_key(kind, job.id))
+            while await leases.pending_runs(kind, job.id):
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            # rows of workers that died meanwhile
+            await leases.cancel_runs(kind, job.id)
+        logger.info(
+            'Jobs: %s (id=%s) ran %s %s check(s) here, %s worker(s) asked',
+            job.kind,
+            job.id,
+            ran,
+            kind,
+            len(workers),
+        )
+
+    async def _rollup_logs(self, job: Job) -> None:
+        retention_days = self.db.settings.job_log_retention_days
+        rolled = await self.db.rollup_job_logs(retention_days)
+        if rolled:
+            logger.info('Jobs: rolled %s job_log rows older than %s days into hourly counts', rolled, retention_days)
+
+
+def create_job_queue(bot, db: Database, monitor_service, http_clients=None, owner: str = '') -> JobQueue:
+    if db.settings.job_queue_backend == 'local':
+        store = LocalJobStore()
+    else:
+        store = DbJobStore(db, owner)
+    return JobQueue(bot, db, store, monitor_service, http_clients)
@@ -67,16 +67,23 @@ def get_edit_menu_inline_keyboard(checker_queries, source: str):
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_query_edit_inline_keyboard(query_id, is_active, source: str):
+def get_query_edit_inline_keyboard(query_id, is_active, source: str, digest_minutes: int | None = None):
     activate = '✅ Активувати'
     deactivate = '🚫 Деактивувати'
     delete = '❌ Видалити'
+    if digest_minutes is None:
+        digest = '🔔 Кожне оголошення окремо'
+    elif digest_minutes == 0:
+        digest = '📦 Дайджест після кожної перевірки'
+    else:
+        digest = f'📦 Дайджест раз на {digest_minutes} хв'
     edit_callback = f'edit_queries_{source}'
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=activate if not is_active else deactivate,
             callback_data=f'query_activate_{query_id}',
         )],
+        [InlineKeyboardButton(text=digest, callback_data=f'query_digest_{query_id}')],
         [InlineKeyboardButton(text=delete, callback_data=f'query_delete_{query_id}')],
         [InlineKeyboardButton(text='⬅️ До списку', callback_data=edit_callback)],
     ])
@@ -138,19 +145,42 @@ def get_admin_users_keyboard(users):
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_admin_logs_keyboard(page: int, total_pages: int):
-    buttons = []
-    nav = []
-    if page > 0:
-        nav.append(InlineKeyboardButton(text='◀️ Назад', callback_data=f'admin_logs_page_{page - 1}'))
-    nav.append(InlineKeyboardButton(text=f'{page + 1}/{total_pages}', callback_data='admin_logs_noop'))
-    if page < total_pages - 1:
-        nav.append(InlineKeyboardButton(text='Вперед ▶️', callback_data=f'admin_logs_page_{page + 1}'))
-    buttons.append(nav)
+def get_admin_next_pages_keyboard(pages: list[tuple[str, str]]):
+    buttons = [[InlineKeyboardButton(text=text, callback_data=callback_data)] for text, callback_data in pages]
     buttons.append([InlineKeyboardButton(text='⬅️ Адмін-панель', callback_data='admin_menu')])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def get_admin_logs_keyboard(
+    level: str,
+    job_name: str,
+    levels: tuple[str, ...],
+    job_names: tuple[str, ...],
+    newer_id: int | None,
+    older_id: int | None,
+    total: int,
+):
+    # callback data carries the filters and the id cursor: admin_logs:<level>:<job>:<a|b><id>
+    def filter_button(value: str, selected: str, data: str, all_text: str):
+        text = value or all_text
+        return InlineKeyboardButton(text=f'• {text}' if value == selected else text, callback_data=data)
+
+    nav = []
+    if newer_id is not None:
+        nav.append(InlineKeyboardButton(text='◀️ Новіші', callback_data=f'admin_logs:{level}:{job_name}:a{newer_id}'))
+    nav.append(InlineKeyboardButton(text=f'≈{total}', callback_data='admin_logs_noop'))
+    if older_id is not None:
+        nav.append(InlineKeyboardButton(text='Старіші ▶️', callback_data=f'admin_logs:{level}:{job_name}:b{older_id}'))
+    buttons = [
+        nav,
+        [filter_button(value, level, f'admin_logs:{value}:{job_name}:', 'Всі рівні') for value in levels],
+        [filter_button(value, job_name, f'admin_logs:{level}:{value}:', 'Всі задачі') for value in job_names[:2]],
+        [filter_button(value, job_name, f'admin_logs:{level}:{value}:', 'Всі задачі') for value in job_names[2:]],
+        [InlineKeyboardButton(text='⬅️ Адмін-панель', callback_data='admin_menu')],
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[row for row in buttons if row])
+
+
 def get_admin_user_edit_keyboard(user_telegram_id: int, is_active: bool, is_admin: bool):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
@@ -0,0 +1,216 @@
+import array
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+
+from notify_bot.database import Database
+
+logger = logging.getLogger(__name__)
+
+# searches nobody checked for this long (deleted, paused, leased to another worker) are dropped
+UNUSED_SECONDS = 86400
+
+
+def url_hash(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+class QueryAds:
+    # saved ads of one search as parallel arrays sorted by url hash, plus ids and hashes sorted
+    # by id for lookups by id: 33 bytes an ad instead of a FoundAd with its strings and datetime
+    __slots__ = ('hashes', 'ids', 'active', 'id_order', 'id_hashes', 'max_id', 'used_at')
+
+    def __init__(self, rows=()):
+        entries = sorted((url_hash(url), ad_id, bool(is_active)) for ad_id, url, is_active in rows)
+        self.hashes = array.array('q', [entry[0] for entry in entries])
+        self.ids = array.array('q', [entry[1] for entry in entries])
+        self.active = bytearray(entry[2] for entry in entries)
+        by_id = sorted(zip(self.ids, self.hashes))
+        self.id_order = array.array('q', [ad_id for ad_id, _ in by_id])
+        self.id_hashes = array.array('q', [hash_value for _, hash_value in by_id])
+        self.max_id = max(self.ids, default=0)
+        self.used_at = time.monotonic()
+
+    @classmethod
+    def from_ads(cls, ads) -> 'QueryAds':
+        return cls((ad.id, ad.ad_url, ad.is_active) for ad in ads)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, url: str) -> bool:
+        return self._position(url_hash(url)) is not None
+
+    def _position(self, hash_value: int) -> int | None:
+        position = bisect.bisect_left(self.hashes, hash_value)
+        if position < len(self.hashes) and self.hashes[position] == hash_value:
+            return position
+        return None
+
+    def _position_of_id(self, ad_id: int) -> int | None:
+        index = bisect.bisect_left(self.id_order, ad_id)
+        if index < len(self.id_order) and self.id_order[index] == ad_id:
+            return self._position(self.id_hashes[index])
+        return None
+
+    def find(self, url: str) -> tuple[int, bool] | None:
+        position = self._position(url_hash(url))
+        if position is None:
+            return None
+        return self.ids[position], bool(self.active[position])
+
+    def active_ids_missing(self, urls) -> list[int]:
+        seen = {url_hash(url) for url in urls}
+        return [
+            ad_id
+            for hash_value, ad_id, is_active in zip(self.hashes, self.ids, self.active)
+            if is_active and hash_value not in seen
+        ]
+
+    def checksum(self) -> tuple[int, int, int]:
+        # the id sum catches one ad switched off and another switched on, which the counts miss
+        active_id_sum = sum(ad_id for ad_id, is_active in zip(self.ids, self.active) if is_active)
+        return len(self.ids), self.active.count(1), active_id_sum
+
+    def add(self, ad_id: int, url: str, is_active: bool = True) -> None:
+        hash_value = url_hash(url)
+        position = bisect.bisect_left(self.hashes, hash_value)
+        if position < len(self.hashes) and self.hashes[position] == hash_value:
+            if self.ids[position] != ad_id:
+                self._unindex_id(self.ids[position])
+                self._index_id(ad_id, hash_value)
+            self.ids[position] = ad_id
+            self.active[position] = is_active
+        else:
+            self.hashes.insert(position, hash_value)
+            self.ids.insert(position, ad_id)
+            self.active.insert(position, is_active)
+            self._index_id(ad_id, hash_value)
+        self.max_id = max(self.max_id, ad_id)
+
+    def _index_id(self, ad_id: int, hash_value: int) -> None:
+        # new ads have the highest ids, so this is nearly always an append
+        index = bisect.bisect_left(self.id_order, ad_id)
+        self.id_order.insert(index, ad_id)
+        self.id_hashes.insert(index, hash_value)
+
+    def _unindex_id(self, ad_id: int) -> None:
+        index = bisect.bisect_left(self.id_order, ad_id)
+        if index < len(self.id_order) and self.id_order[index] == ad_id:
+            del self.id_order[index]
+            del self.id_hashes[index]
+
+    def set_active(self, ad_ids, is_active: bool) -> None:
+        for ad_id in ad_ids:
+            position = self._position_of_id(ad_id)
+            if position is not None:
+                self.active[position] = is_active
+
+
+class KnownAllOf:
+    # known_urls for a group of searches sharing one listing: known only if every one has it
+    def __init__(self, saved_ads: list[QueryAds]):
+        self.saved_ads = saved_ads
+
+    def __contains__(self, url: str) -> bool:
+        return all(url in ads for ads in self.saved_ads)
+
+
+class KnownAdsIndex:
+    def __init__(self, db: Database):
+        self.db = db
+        self.verify_seconds = max(db.settings.known_ads_verify_minutes, 1) * 60
+        self._queries: dict[int, QueryAds] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self.db.ad_index = self
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self.db.ad_index is self:
+            self.db.ad_index = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def get(self, query_id: int) -> QueryAds:
+        ads = self._queries.get(query_id)
+        if ads is None:
+            ads = await self._load(query_id)
+        else:
+            # rows added by another process since, e.g. an initial parse; is_active changes made
+            # elsewhere are caught by forget() on lease handover and by verify()
+            for ad_id, url, is_active in await self.db.list_found_ad_keys(query_id, after_id=ads.max_id):
+                ads.add(ad_id, url, is_active)
+        ads.used_at = time.monotonic()
+        return ads
+
+    def apply(self, query_id: int, created, reactivated_ids=(), deactivated_ids=()) -> None:
+        ads = self._queries.get(query_id)
+        if ads is None:
+            return
+        for ad in created:
+            ads.add(ad.id, ad.ad_url, ad.is_active)
+        ads.set_active(reactivated_ids, True)
+        ads.set_active(deactivated_ids, False)
+
+    def forget(self, query_id: int) -> None:
+        self._queries.pop(query_id, None)
+
+    def set_active(self, ad_ids: list[int], is_active: bool) -> None:
+        for ads in self._queries.values():
+            ads.set_active(ad_ids, is_active)
+
+    async def warm_up(self) -> None:
+        started_at = time.monotonic()
+        for query in await self.db.list_active_queries():
+            if query.id not in self._queries:
+                await self._load(query.id)
+        logger.info(
+            'Known ads: loaded %s ads of %s searches in %.1f sec',
+            sum(len(ads) for ads in self._queries.values()),
+            len(self._queries),
+            time.monotonic() - started_at,
+        )
+
+    async def verify(self) -> None:
+        now = time.monotonic()
+        for query_id in [query_id for query_id, ads in self._queries.items() if now - ads.used_at > UNUSED_SECONDS]:
+            del self._queries[query_id]
+        checksums = await self.db.found_ad_checksums_by_query()
+        stale = [
+            query_id for query_id, ads in self._queries.items()
+            if checksums.get(query_id, (0, 0, 0)) != ads.checksum()
+        ]
+        for query_id in stale:
+            await self._load(query_id)
+        if stale:
+            logger.warning('Known ads: %s of %s searches differed from found_ad and were reloaded', len(stale), len(self._queries))
+
+    async def _load(self, query_id: int) -> QueryAds:
+        ads = QueryAds(await self.db.list_found_ad_keys(query_id))
+        self._queries[query_id] = ads
+        return ads
+
+    async def _run(self) -> None:
+        try:
+            await self.warm_up()
+        except Exception:
+            logger.exception('Known ads: warm-up failed, searches load on their first check')
+        while True:
+            await asyncio.sleep(self.verify_seconds)
+            try:
+                await self.verify()
+            except Exception:
+                logger.exception('Known ads: verification failed')
+
+
+async def saved_ads_for_query(db: Database, query_id: int) -> QueryAds:
+    if db.ad_index is not None:
+        return await db.ad_index.get(query_id)
+    return QueryAds.from_ads(await db.list_found_ads_for_query(query_id))
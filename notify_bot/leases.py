@@ -0,0 +1,62 @@
+import logging
+import os
+import secrets
+import socket
+
+from notify_bot.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name(role: str) -> str:
+    return f'{role}:{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}'
+
+
+def run_prefix(kind: str, run_id: int) -> str:
+    return f'run:{kind}:{run_id}:'
+
+
+def run_kind(run_key: str) -> str:
+    return run_key.split(':', 3)[1]
+
+
+class CheckLeases:
+    def __init__(self, db: Database, owner: str):
+        self.db = db
+        self.owner = owner
+        # a lease outlives a couple of missed refreshes before other workers take it over
+        self.ttl_seconds = max(db.settings.lease_ttl_seconds, db.settings.scheduler_refresh_seconds * 2)
+        self.owned: set[str] = set()
+
+    async def sync(self, keys: list[str], busy: set[str] = frozenset()) -> set[str]:
+        owned = await self.db.sync_check_leases(self.owner, keys, self.ttl_seconds, busy)
+        if owned != self.owned:
+            logger.info('Leases: %s holds %s of %s check(s)', self.owner, len(owned), len(keys))
+        self.owned = owned
+        return owned
+
+    async def request_runs(self, kind: str, run_id: int) -> list[str]:
+        # asks every live worker, this one included, to run its share of the checks of this kind now
+        return await self.db.request_check_runs(run_prefix(kind, run_id), self.ttl_seconds)
+
+    async def pending_runs(self, kind: str, run_id: int) -> int:
+        return await self.db.renew_check_runs(run_prefix(kind, run_id), self.ttl_seconds)
+
+    async def cancel_runs(self, kind: str, run_id: int) -> None:
+        await self.db.cancel_check_runs(run_prefix(kind, run_id))
+
+    def own_run_key(self, kind: str, run_id: int) -> str:
+        return f'{run_prefix(kind, run_id)}{self.owner}'
+
+    async def requested_runs(self) -> list[str]:
+        return await self.db.list_check_runs(self.owner)
+
+    async def finish_run(self, run_key: str) -> None:
+        await self.db.finish_check_run(run_key)
+
+    async def release(self) -> None:
+        try:
+            await self.db.release_check_leases(self.owner)
+        except Exception:
+            logger.exception('Leases: failed to release leases of %s', self.owner)
+        self.owned = set()
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from notify_bot.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class JobLogSink:
+    def __init__(self, db: Database):
+        self.db = db
+        settings = db.settings
+        self.flush_seconds = settings.job_log_flush_seconds
+        self.batch_size = max(settings.job_log_batch_size, 1)
+        # when the database is down for long the oldest records are dropped, never the process memory
+        self._buffer: deque = deque(maxlen=max(settings.job_log_buffer_size, self.batch_size))
+        self._dropped = 0
+        self._handler = JobLogHandler(self, settings.job_log_handler_level)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def add(self, level: str, message: str, source: str = 'system', job_name: str = '', created: float | None = None) -> None:
+        # safe to call from any thread, never waits for the database
+        if len(self._buffer) == self._buffer.maxlen:
+            self._dropped += 1
+        self._buffer.append((level, source, message, job_name or '', created or time.time()))
+        if len(self._buffer) >= self.batch_size and self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+            self.db.log_sink = self
+            logging.getLogger().addHandler(self._handler)
+
+    async def close(self) -> None:
+        logging.getLogger().removeHandler(self._handler)
+        if self.db.log_sink is self:
+            self.db.log_sink = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        written = 0
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            now = time.time()
+            try:
+                await self.db.insert_job_logs([
+                    (level, source, message, job_name, max(now - created, 0.0))
+                    for level, source, message, job_name, created in batch
+                ])
+            except Exception:
+                logger.exception('Job log: failed to write %s record(s), retrying later', len(batch))
+                self._buffer.extendleft(reversed(batch))
+                break
+            written += len(batch)
+        if self._dropped:
+            logger.warning('Job log: buffer was full, %s record(s) dropped', self._dropped)
+            self._dropped = 0
+        return written
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+
+class JobLogHandler(logging.Handler):
+    # forwards records logged with extra={'job_name': ...} to job_log, everything else is left alone
+    def __init__(self, sink: JobLogSink, level: int | str = logging.INFO):
+        super().__init__(level)
+        self.sink = sink
+
+    def emit(self, record: logging.LogRecord) -> None:
+        job_name = getattr(record, 'job_name', None)
+        if not job_name:
+            return
+        try:
+            message = record.getMessage()
+            if record.exc_info and record.exc_info[1] is not None:
+                message = f'{message}: {record.exc_info[1]!r}'
+            self.sink.add(record.levelname, message, record.name, job_name, record.created)
+        except Exception:
+            self.handleError(record)
@@ -0,0 +1,78 @@
+import hashlib
+import logging
+import os
+
+import httpx
+from aiogram.types import BufferedInputFile, FSInputFile, InputFile
+
+logger = logging.getLogger(__name__)
+
+_directory: str | None = None
+_max_bytes = 0
+
+
+def start(directory: str, max_megabytes: int) -> None:
+    global _directory, _max_bytes
+    if not directory or max_megabytes <= 0:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+    _max_bytes = max_megabytes * 1024 * 1024
+    _evict()
+    logger.info('Media cache: using %s (limit %s MB)', directory, max_megabytes)
+
+
+def shutdown() -> None:
+    global _directory
+    _directory = None
+
+
+async def download(url: str, filename: str, client: httpx.AsyncClient) -> InputFile:
+    if not _directory:
+        response = await client.get(url, timeout=120)
+        response.raise_for_status()
+        return BufferedInputFile(response.content, filename=filename)
+
+    path = os.path.join(_directory, _cache_name(url, filename))
+    if os.path.exists(path):
+        os.utime(path)
+        return FSInputFile(path, filename=filename)
+
+    tmp_path = f'{path}.part'
+    try:
+        async with client.stream('GET', url, timeout=120) as response:
+            response.raise_for_status()
+            with open(tmp_path, 'wb') as media_file:
+                async for chunk in response.aiter_bytes():
+                    media_file.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _evict(keep=path)
+    return FSInputFile(path, filename=filename)
+
+
+def _cache_name(url: str, filename: str) -> str:
+    extension = os.path.splitext(filename)[1][:10]
+    return hashlib.sha1(url.encode('utf-8')).hexdigest() + extension
+
+
+def _evict(keep: str | None = None) -> None:
+    files = []
+    for entry in os.scandir(_directory):
+        if entry.is_file() and not entry.name.endswith('.part'):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= _max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            logger.warning('Media cache: failed to remove %s', path)
+            continue
+        total -= size
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 
 
@@ -25,6 +25,8 @@ class CheckerQuery:
     is_deleted: bool
     created_at: datetime | None = None
     user: TelegramUser | None = None
+    digest_minutes: int | None = None
+    check_interval_minutes: int | None = None
 
 
 @dataclass
@@ -80,3 +82,31 @@ class JobLog:
     message: str
     job_name: str
     created_at: datetime | None = None
+
+
+@dataclass
+class OutboxMessage:
+    dedup_key: str
+    chat_id: int
+    kind: str
+    payload: dict
+    id: int | None = None
+    attempts: int = 0
+    group_key: str | None = None
+    delay_seconds: float = 0
+    created_at: datetime | None = None
+
+
+@dataclass
+class Job:
+    kind: str
+    dedup_key: str
+    payload: dict = field(default_factory=dict)
+    priority: int = 10
+    id: int | None = None
+    status: str = 'queued'
+    attempts: int = 0
+    error: str | None = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
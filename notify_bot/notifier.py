@@ -0,0 +1,122 @@
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from notify_bot.config import Settings
+from scrapers.throttle import Throttle
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+
+@dataclass(order=True)
+class _Notification:
+    priority: int
+    sequence: int
+    chat_id: int = field(compare=False)
+    send: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+class NotificationDispatcher:
+    def __init__(self, settings: Settings):
+        self.senders_number = max(settings.notify_senders, 1)
+        self.chat_interval_seconds = settings.notify_chat_interval_seconds
+        self.max_attempts = max(settings.notify_max_attempts, 1)
+        self._global_throttle = Throttle(1 / settings.notify_global_per_second if settings.notify_global_per_second > 0 else 0)
+        self._queue: asyncio.PriorityQueue[_Notification] = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._chat_ready_at: dict[int, float] = {}
+        self._delayed = 0
+        self._senders: list[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self) -> None:
+        if self._senders:
+            return
+        self._senders = [asyncio.create_task(self._sender()) for _ in range(self.senders_number)]
+        logger.info('Notification dispatcher started with %s sender(s)', self.senders_number)
+
+    def enqueue(self, chat_id: int, send: Callable[[], Awaitable[Any]], priority: int = PRIORITY_NORMAL) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Notification(priority, next(self._sequence), chat_id, send, future))
+        return future
+
+    def pending(self) -> int:
+        return self._queue.qsize() + self._delayed
+
+    async def close(self, drain_timeout_seconds: float = 10) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + drain_timeout_seconds
+        while self._senders and self.pending() and loop.time() < deadline:
+            await asyncio.sleep(0.2)
+        for sender in self._senders:
+            sender.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        self._senders = []
+        logger.info(
+            'Notification dispatcher stopped: sent=%s, failed=%s, retried=%s, unsent=%s',
+            self.sent,
+            self.failed,
+            self.retried,
+            self.pending(),
+        )
+
+    async def _sender(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            notification = await self._queue.get()
+            now = loop.time()
+            ready_at = self._chat_ready_at.get(notification.chat_id, 0.0)
+            if ready_at > now:
+                self._delay(notification, ready_at - now)
+                continue
+            self._chat_ready_at[notification.chat_id] = now + self.chat_interval_seconds
+            if len(self._chat_ready_at) > 10_000:
+                self._chat_ready_at = {chat_id: at for chat_id, at in self._chat_ready_at.items() if at > now}
+
+            await self._global_throttle.wait()
+            try:
+                result = await notification.send()
+            except TelegramRetryAfter as error:
+                self.retried += 1
+                logger.warning('Telegram asked to retry chat %s after %s sec', notification.chat_id, error.retry_after)
+                self._chat_ready_at[notification.chat_id] = loop.time() + error.retry_after
+                self._delay(notification, error.retry_after)
+            except (TelegramNetworkError, TelegramServerError):
+                notification.attempts += 1
+                if notification.attempts >= self.max_attempts:
+                    self._fail(notification)
+                else:
+                    self.retried += 1
+                    self._delay(notification, 2 ** notification.attempts)
+            except Exception:
+                self._fail(notification)
+            else:
+                self.sent += 1
+                if not notification.future.done():
+                    notification.future.set_result(result)
+
+    def _delay(self, notification: _Notification, delay: float) -> None:
+        self._delayed += 1
+        asyncio.get_running_loop().call_later(delay, self._requeue, notification)
+
+    def _requeue(self, notification: _Notification) -> None:
+        self._delayed -= 1
+        self._queue.put_nowait(notification)
+
+    def _fail(self, notification: _Notification) -> None:
+        self.failed += 1
+        logger.exception('Failed to send notification to chat %s', notification.chat_id)
+        if not notification.future.done():
+            notification.future.set_result(None)
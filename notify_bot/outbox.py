@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from notify_bot.database import Database
+from notify_bot.models import OutboxMessage
+from notify_bot.tasks import (
+    send_insta_notifications,
+    send_new_ad_notification,
+    send_new_ads_digest,
+    send_text_notification,
+)
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class OutboxDrainer:
+    def __init__(self, bot, db: Database, http_clients=None):
+        self.bot = bot
+        self.db = db
+        self.http_clients = http_clients
+        settings = db.settings
+        self.batch_size = max(settings.outbox_batch_size, 1)
+        self.poll_seconds = settings.outbox_poll_seconds
+        self.lease_seconds = settings.outbox_lease_seconds
+        self.max_attempts = max(settings.outbox_max_attempts, 1)
+        self.retention_days = settings.outbox_retention_days
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._purged_at = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                claimed = await self.drain_once()
+                await self._purge_if_due()
+            except Exception:
+                logger.exception('Outbox: drain failed')
+                claimed = 0
+            if claimed >= self.batch_size:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain_once(self) -> int:
+        messages = await self.db.claim_outbox(self.batch_size, self.lease_seconds)
+        if not messages:
+            return 0
+        delivered = await self._deliver(messages)
+
+        sent_ids = [message.id for message in messages if delivered.get(message.id)]
+        retry_ids_by_delay = defaultdict(list)
+        for message in messages:
+            if not delivered.get(message.id):
+                retry_ids_by_delay[min(60 * 2 ** message.attempts, 3600)].append(message.id)
+        await self.db.mark_outbox_sent(sent_ids)
+        for delay, message_ids in retry_ids_by_delay.items():
+            await self.db.retry_outbox(message_ids, delay, self.max_attempts)
+        logger.info(
+            'Outbox: delivered %s of %s notification(s)',
+            len(sent_ids),
+            len(messages),
+        )
+        return len(messages)
+
+    async def _deliver(self, messages: list[OutboxMessage]) -> dict[int, bool]:
+        ad_messages = []
+        text_messages = []
+        digest_messages = defaultdict(list)
+        insta_messages = defaultdict(list)
+        for message in messages:
+            if message.kind == 'new_ad' and message.group_key:
+                digest_messages[(message.chat_id, message.group_key)].append(message)
+            elif message.kind == 'new_ad':
+                ad_messages.append(message)
+            elif message.kind == 'message':
+                text_messages.append(message)
+            elif message.kind == 'insta':
+                insta_messages[message.payload['url']].append(message)
+            else:
+                logger.warning('Outbox: unknown notification kind "%s" (id=%s)', message.kind, message.id)
+
+        ad_futures = [send_new_ad_notification(self.bot, message.chat_id, message.payload) for message in ad_messages]
+        text_futures = [send_text_notification(self.bot, message.chat_id, message.payload) for message in text_messages]
+        digest_groups = list(digest_messages.values())
+        digest_futures = [
+            send_new_ads_digest(self.bot, group[0].chat_id, [message.payload for message in group])
+            for group in digest_groups
+        ]
+        insta_groups = list(insta_messages.values())
+        insta_results = await asyncio.gather(*(
+            send_insta_notifications(self.bot, group[0].payload, [message.chat_id for message in group], self.http_clients)
+            for group in insta_groups
+        ))
+
+        delivered = {}
+        for message, result in zip(ad_messages, await asyncio.gather(*ad_futures)):
+            delivered[message.id] = result is not None
+        for message, result in zip(text_messages, await asyncio.gather(*text_futures)):
+            delivered[message.id] = result is not None
+        for group, futures in zip(digest_groups, digest_futures):
+            group_delivered = all(result is not None for result in await asyncio.gather(*futures))
+            for message in group:
+                delivered[message.id] = group_delivered
+        for group, results in zip(insta_groups, insta_results):
+            for message in group:
+                delivered[message.id] = results.get(message.chat_id, False)
+        return delivered
+
+    async def _purge_if_due(self) -> None:
+        if self.retention_days <= 0 or time.monotonic() - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = time.monotonic()
+        await self.db.purge_outbox(self.retention_days)
@@ -0,0 +1,49 @@
+import math
+from datetime import datetime, timezone
+
+# keeps quiet searches in the budget instead of giving them zero weight
+RATE_PRIOR_PER_HOUR = 0.05
+# the initial parse saves the whole listing at once, those ads are not arrivals
+INITIAL_PARSE_MINUTES = 10
+
+
+def arrival_rate(new_ads_count: int, query_created_at: datetime | None, window_hours: float) -> float:
+    observed_hours = window_hours
+    if query_created_at is not None:
+        if query_created_at.tzinfo is None:
+            query_created_at = query_created_at.replace(tzinfo=timezone.utc)
+        age_hours = (datetime.now(timezone.utc) - query_created_at).total_seconds() / 3600
+        observed_hours = min(window_hours, age_hours - INITIAL_PARSE_MINUTES / 60)
+    return new_ads_count / max(observed_hours, 1.0)
+
+
+def allocate_intervals(
+    rates: dict,
+    base_interval_seconds: float,
+    min_interval_seconds: float,
+    max_interval_seconds: float,
+) -> dict:
+    # the same number of requests as polling everything every base interval, split in
+    # proportion to sqrt(rate), which minimises the mean delay for Poisson arrivals
+    if not rates:
+        return {}
+    max_frequency = 1 / max(min_interval_seconds, 1)
+    min_frequency = 1 / max(max_interval_seconds, min_interval_seconds, 1)
+    remaining = len(rates) / base_interval_seconds
+    free = {key: math.sqrt(rate + RATE_PRIOR_PER_HOUR) for key, rate in rates.items()}
+    frequencies = {}
+    while free:
+        total_weight = sum(free.values())
+        shares = {key: remaining * weight / total_weight for key, weight in free.items()}
+        # cap the hottest first: what they give back may lift the quiet ones above the floor
+        clamped = {key: max_frequency for key, share in shares.items() if share > max_frequency}
+        if not clamped:
+            clamped = {key: min_frequency for key, share in shares.items() if share < min_frequency}
+        if not clamped:
+            frequencies.update((key, remaining * weight / total_weight) for key, weight in free.items())
+            break
+        for key, frequency in clamped.items():
+            frequencies[key] = frequency
+            remaining = max(remaining - frequency, 0.0)
+            del free[key]
+    return {key: 1 / frequency for key, frequency in frequencies.items()}
@@ -1,40 +1,310 @@
 import asyncio
+import heapq
+import itertools
 import logging
+import random
+from dataclasses import dataclass, field
 
-from notify_bot.tasks import check_new_ads_async, check_new_insta_content_async
+from notify_bot.leases import CheckLeases, run_kind
+from notify_bot.polling_policy import INITIAL_PARSE_MINUTES, allocate_intervals, arrival_rate
+from notify_bot.tasks import build_fetch_plan, check_insta_username, check_query_group
+from scrapers import browser_pool, http_cache
 
 logger = logging.getLogger(__name__)
 
 
-async def run_scheduler(bot, db, request_interval_minutes: int, insta_interval_minutes: int):
-    ads_interval = max(request_interval_minutes, 1) * 60
-    insta_interval = max(insta_interval_minutes, 1) * 60
-    ads_elapsed = ads_interval
-    insta_elapsed = insta_interval
+@dataclass
+class _ScheduledCheck:
+    kind: str
+    key: str
+    interval_seconds: float
+    queries: list = field(default_factory=list)
+    next_run_at: float = 0.0
+    running: bool = False
+    # futures of manual runs, resolved when the next run of this check is over
+    waiters: list = field(default_factory=list)
 
+
+class CheckScheduler:
+    def __init__(
+        self,
+        bot,
+        db,
+        request_interval_minutes: int,
+        insta_interval_minutes: int,
+        http_clients=None,
+        leases: CheckLeases | None = None,
+    ):
+        self.bot = bot
+        self.db = db
+        self.http_clients = http_clients
+        self.leases = leases
+        self.ads_interval_seconds = max(request_interval_minutes, 1) * 60
+        self.insta_interval_seconds = max(insta_interval_minutes, 1) * 60
+        self.jitter = min(max(db.settings.scheduler_jitter, 0.0), 0.9)
+        self.refresh_seconds = max(db.settings.scheduler_refresh_seconds, 1)
+        self.adaptive = db.settings.adaptive_polling
+        self._new_ads_counts: dict[int, int] = {}
+        self._counted_at: float | None = None
+        self._checks: dict[tuple[str, str], _ScheduledCheck] = {}
+        self._heap: list[tuple[float, int, tuple[str, str]]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._running_tasks: set[asyncio.Task] = set()
+        # keys with a check task still running, even if the check was dropped and re-added meanwhile
+        self._in_flight: set[tuple[str, str]] = set()
+        self._refreshed = False
+        self._served_runs: dict[str, asyncio.Task] = {}
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        refresh_at = 0.0
+        try:
+            while True:
+                if loop.time() >= refresh_at:
+                    try:
+                        await self.refresh()
+                    except Exception:
+                        logger.exception('Scheduler: failed to refresh the check list')
+                    http_cache.save()
+                    refresh_at = loop.time() + self.refresh_seconds
+
+                self._start_due_checks(loop.time())
+                wake_at = min(refresh_at, self._heap[0][0]) if self._heap else refresh_at
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(wake_at - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            tasks = list(self._running_tasks)
+            for task in tasks:
+                task.cancel()
+            # their leases are released by run_scheduler only after they have stopped
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def refresh(self) -> None:
+        queries = await self.db.list_active_queries()
+        fetch_plan = build_fetch_plan(queries)
+        intervals = await self._ads_intervals(fetch_plan)
+        wanted = {
+            ('ads', url_key): (intervals[url_key], group_queries)
+            for url_key, group_queries in fetch_plan.items()
+        }
+        for username in await self.db.get_active_insta_usernames():
+            wanted[('insta', username)] = (self.insta_interval_seconds, [])
+        if self.leases is not None:
+            # other workers check what this one does not hold
+            # a running check keeps its lease until it is done, even past this worker's share
+            busy = {f'{kind}:{key}' for kind, key in self._in_flight}
+            owned = await self.leases.sync([f'{kind}:{key}' for kind, key in wanted], busy)
+            wanted = {(kind, key): value for (kind, key), value in wanted.items() if f'{kind}:{key}' in owned}
+
+        removed = [key for key in self._checks if key not in wanted]
+        for key in removed:
+            # a manual run waiting on a check handed to another worker is left to that worker
+            _resolve(self._checks.pop(key).waiters)
+            if key[0] == 'ads':
+                http_cache.forget_listing(key[1])
+
+        now = asyncio.get_running_loop().time()
+        added = 0
+        for (kind, key), (interval_seconds, group_queries) in wanted.items():
+            check = self._checks.get((kind, key))
+            if check is None:
+                check = _ScheduledCheck(kind, key, interval_seconds, group_queries)
+                self._checks[(kind, key)] = check
+                # spread new checks over one interval instead of starting them all at once
+                self._schedule(check, now + random.uniform(0, interval_seconds))
+                added += 1
+                if kind == 'ads':
+                    # the fingerprint on file may come from the worker that held this check before
+                    http_cache.forget_listing(key)
+                if kind == 'ads' and self._refreshed and self.db.ad_index is not None:
+                    # taken over from another worker, whose writes the resident index has not seen
+                    for query in group_queries:
+                        self.db.ad_index.forget(query.id)
+                continue
+            check.queries = group_queries
+            if interval_seconds != check.interval_seconds:
+                check.interval_seconds = interval_seconds
+                if not check.running and check.next_run_at > now + interval_seconds:
+                    self._schedule(check, now + random.uniform(0, interval_seconds))
+
+        self._refreshed = True
+        if self.leases is not None:
+            run_keys = await self.leases.requested_runs()
+            for run_key in run_keys:
+                self.serve_run(run_kind(run_key), run_key)
+            self._served_runs = {
+                run_key: task for run_key, task in self._served_runs.items() if run_key in run_keys or not task.done()
+            }
+        if added or removed:
+            logger.info(
+                'Scheduler: %s checks scheduled (%s added, %s removed), %s running',
+                len(self._checks),
+                added,
+                len(removed),
+                sum(check.running for check in self._checks.values()),
+            )
+
+    async def _ads_intervals(self, fetch_plan: dict[str, list]) -> dict[str, float]:
+        intervals = {}
+        for url_key, group_queries in fetch_plan.items():
+            pinned = [query.check_interval_minutes * 60 for query in group_queries if query.check_interval_minutes]
+            if pinned or not self.adaptive:
+                intervals[url_key] = min(pinned, default=self.ads_interval_seconds)
+        adaptive_groups = {url_key: queries for url_key, queries in fetch_plan.items() if url_key not in intervals}
+        if not adaptive_groups:
+            return intervals
+
+        settings = self.db.settings
+        window_hours = settings.adaptive_window_hours
+        now = asyncio.get_running_loop().time()
+        if self._counted_at is None or now - self._counted_at >= settings.adaptive_recount_minutes * 60:
+            self._new_ads_counts = await self.db.count_new_ads_by_query(window_hours * 3600, INITIAL_PARSE_MINUTES)
+            self._counted_at = now
+        rates = {
+            url_key: max(
+                arrival_rate(self._new_ads_counts.get(query.id, 0), query.created_at, window_hours)
+                for query in queries
+            )
+            for url_key, queries in adaptive_groups.items()
+        }
+        adaptive_intervals = allocate_intervals(
+            rates,
+            self.ads_interval_seconds,
+            settings.adaptive_min_interval_minutes * 60,
+            settings.adaptive_max_interval_minutes * 60,
+        )
+        if self._counted_at == now:
+            ordered = sorted(adaptive_intervals.values())
+            logger.info(
+                'Scheduler: adaptive intervals for %s searches: min %.1f, median %.1f, max %.1f minutes',
+                len(ordered),
+                ordered[0] / 60,
+                ordered[len(ordered) // 2] / 60,
+                ordered[-1] / 60,
+            )
+        intervals.update(adaptive_intervals)
+        return intervals
+
+    def run_now(self, kind: str) -> list[asyncio.Future]:
+        # manual runs only pull this process's own checks forward, so they keep to the leases
+        # and never overlap a run that is already going: a running check goes again once it is done
+        loop = asyncio.get_running_loop()
+        futures = []
+        for check in self._checks.values():
+            if check.kind != kind:
+                continue
+            future = loop.create_future()
+            check.waiters.append(future)
+            futures.append(future)
+            if not check.running:
+                self._schedule(check, loop.time())
+        return futures
+
+    def serve_run(self, kind: str, run_key: str | None = None) -> asyncio.Task:
+        # the task returns the number of checks run; run_key is this worker's 'run:' lease row
+        task = self._served_runs.get(run_key) if run_key else None
+        if task is None:
+            task = asyncio.create_task(self._serve_run(kind, run_key))
+            self._running_tasks.add(task)
+            task.add_done_callback(self._running_tasks.discard)
+            if run_key:
+                self._served_runs[run_key] = task
+        return task
+
+    async def _serve_run(self, kind: str, run_key: str | None) -> int:
+        futures = self.run_now(kind)
+        await asyncio.gather(*futures)
+        if run_key:
+            await self.leases.finish_run(run_key)
+        logger.info('Scheduler: manual %s run finished, %s check(s)', kind, len(futures))
+        return len(futures)
+
+    def _schedule(self, check: _ScheduledCheck, run_at: float) -> None:
+        check.next_run_at = run_at
+        heapq.heappush(self._heap, (run_at, next(self._counter), (check.kind, check.key)))
+        self._wakeup.set()
+
+    def _start_due_checks(self, now: float) -> None:
+        while self._heap and self._heap[0][0] <= now:
+            run_at, _, key = heapq.heappop(self._heap)
+            check = self._checks.get(key)
+            # entries of removed or rescheduled checks stay in the heap until they come up
+            if check is None or check.running or check.next_run_at != run_at:
+                continue
+            if key in self._in_flight:
+                # started again by the old task's finally block once it is done
+                continue
+            check.running = True
+            self._in_flight.add(key)
+            waiters, check.waiters = check.waiters, []
+            task = asyncio.create_task(self._run_check(check, waiters))
+            self._running_tasks.add(task)
+            task.add_done_callback(self._running_tasks.discard)
+
+    async def _run_check(self, check: _ScheduledCheck, waiters: list) -> None:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        try:
+            if check.kind == 'ads':
+                await check_query_group(self.bot, self.db, check.key, check.queries, self.http_clients)
+            else:
+                await check_insta_username(self.bot, self.db, check.key, self.http_clients)
+                logger.debug('Scheduler: browser pool %s', browser_pool.metrics())
+        except Exception:
+            logger.exception('Scheduled %s check failed for %s', check.kind, check.key)
+            job_name = 'check_new_ads' if check.kind == 'ads' else 'check_insta'
+            await self.db.add_job_log('ERROR', f'Scheduled check failed for {check.key}', job_name=job_name)
+        finally:
+            check.running = False
+            _resolve(waiters)
+            key = (check.kind, check.key)
+            self._in_flight.discard(key)
+            current = self._checks.get(key)
+            if current is check:
+                # a check that overran its interval, or got a manual run meanwhile, runs again right away,
+                # never in parallel with itself
+                next_run_at = started_at + check.interval_seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+                if check.waiters:
+                    next_run_at = loop.time()
+                self._schedule(check, max(next_run_at, loop.time()))
+            elif current is not None and not current.running and current.next_run_at <= loop.time():
+                # re-added while this run was going and already due
+                self._schedule(current, loop.time())
+
+
+def _resolve(waiters: list) -> None:
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+async def run_scheduler(
+    bot,
+    db,
+    request_interval_minutes: int,
+    insta_interval_minutes: int,
+    http_clients=None,
+    leases: CheckLeases | None = None,
+    jobs=None,
+):
     logger.info(
-        'Scheduler started: ads every %s min, instagram every %s min',
+        'Scheduler started: ads every %s min, instagram every %s min (per check, jitter %s%%)%s',
         request_interval_minutes,
         insta_interval_minutes,
+        round(db.settings.scheduler_jitter * 100),
+        f', leases as {leases.owner}' if leases is not None else '',
     )
-
-    while True:
-        await asyncio.sleep(30)
-        ads_elapsed += 30
-        insta_elapsed += 30
-
-        if ads_elapsed >= ads_interval:
-            ads_elapsed = 0
-            try:
-                await check_new_ads_async(bot, db)
-            except Exception:
-                logger.exception('Scheduled ads check failed')
-                await db.add_job_log('ERROR', 'Scheduled ads check failed', job_name='check_new_ads')
-
-        if insta_elapsed >= insta_interval:
-            insta_elapsed = 0
-            try:
-                await check_new_insta_content_async(bot, db)
-            except Exception:
-                logger.exception('Scheduled Instagram check failed')
-                await db.add_job_log('ERROR', 'Scheduled Instagram check failed', job_name='check_insta')
+    scheduler = CheckScheduler(bot, db, request_interval_minutes, insta_interval_minutes, http_clients, leases)
+    if jobs is not None:
+        jobs.scheduler = scheduler
+    try:
+        await scheduler.run()
+    finally:
+        if jobs is not None:
+            jobs.scheduler = None
+        if leases is not None:
+            await leases.release()
@@ -1,4 +1,5 @@
 import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from scrapers import parser_olx
 from scrapers.parser_rieltor import parse_rieltor
@@ -18,9 +19,18 @@ def detect_source(query_url: str) -> str:
     return 'olx'
 
 
+def canonical_query_url(query_url: str) -> str:
+    parts = urlsplit(query_url.strip())
+    netloc = parts.netloc.lower().removeprefix('www.')
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit(('https', netloc, path, query, ''))
+
+
 class MonitorService:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, http_clients=None):
         self.db = db
+        self.http_clients = http_clients
 
     async def register_telegram_user(self, telegram_user, is_admin: bool = False):
         return await self.db.upsert_telegram_user(telegram_user, is_admin=is_admin)
@@ -40,6 +50,18 @@ class MonitorService:
     async def toggle_query_active(self, query_id: int):
         return await self.db.toggle_query_active(query_id)
 
+    async def cycle_query_digest(self, query_id: int):
+        query = await self.db.get_query(query_id)
+        window_minutes = self.db.settings.digest_window_minutes
+        # separate messages -> digest per check -> digest per window -> separate messages
+        if query.digest_minutes is None:
+            digest_minutes = 0
+        elif query.digest_minutes == 0 and window_minutes > 0:
+            digest_minutes = window_minutes
+        else:
+            digest_minutes = None
+        return await self.db.set_query_digest_minutes(query_id, digest_minutes)
+
     async def soft_delete_query(self, query_id: int):
         return await self.db.soft_delete_query(query_id)
 
@@ -72,8 +94,10 @@ class MonitorService:
     async def parse_ads_for_url(self, query_url: str):
         source = detect_source(query_url)
         if source == 'rieltor':
-            return await parse_rieltor(query_url)
-        parsed = await parser_olx.get_parsed_ads({1: query_url})
+            session = self.http_clients.aiohttp_session() if self.http_clients else None
+            return await parse_rieltor(query_url, session=session)
+        client = self.http_clients.httpx_client(query_url) if self.http_clients else None
+        parsed = await parser_olx.get_parsed_ads({1: query_url}, client=client)
         return parsed.get(1, [])
 
     async def create_query(self, user_id: int, query_name: str, query_url: str, is_active: bool = True):
@@ -1,17 +1,32 @@
+import asyncio
 import logging
+import time
+from contextlib import nullcontext
+from functools import partial
 
 import httpx
 from aiogram import html
 from aiogram.enums import ParseMode
-from aiogram.types import BufferedInputFile
 
+from notify_bot import media_cache
 from notify_bot.database import Database
-from scrapers import parser_olx
+from notify_bot.known_ads import KnownAllOf, QueryAds, saved_ads_for_query
+from notify_bot.models import OutboxMessage
+from notify_bot.notifier import PRIORITY_HIGH, PRIORITY_LOW
+from notify_bot.services import canonical_query_url
+from scrapers import browser_pool, http_cache, parser_olx
 from scrapers.insta_parser_anonyig_com import get_parsed_content
 from scrapers.parser_rieltor import parse_rieltor
+from scrapers.throttle import Throttle
 
 logger = logging.getLogger(__name__)
 
+TELEGRAM_MESSAGE_LIMIT = 4096
+DIGEST_DESCRIPTION_LIMIT = 200
+
+_source_limits: dict[str, tuple[asyncio.Semaphore, Throttle]] = {}
+_last_full_crawl_at: dict[str, float] = {}
+
 
 def _normalize_price(value):
     if value in (None, '', 'без ціни'):
@@ -22,65 +37,225 @@ def _normalize_price(value):
         return 0.0
 
 
-async def check_new_ads_async(bot, db: Database, source: str | None = None):
+def _query_source(query) -> str | None:
+    if query.source == 'olx' or 'olx.ua/' in query.query_url:
+        return 'olx'
+    if query.source == 'rieltor' or 'rieltor.ua/' in query.query_url:
+        return 'rieltor'
+    return None
+
+
+def build_fetch_plan(queries) -> dict[str, list]:
+    fetch_plan = {}
+    for query in queries:
+        fetch_plan.setdefault(canonical_query_url(query.query_url), []).append(query)
+    return fetch_plan
+
+
+async def check_new_ads_async(bot, db: Database, source: str | None = None, http_clients=None):
     active_queries = await db.list_active_queries()
     if source:
         active_queries = [query for query in active_queries if query.source == source]
+    fetch_plan = build_fetch_plan(active_queries)
     logger.info(
-        'Ads check: loaded %s active monitor queries%s',
+        'Ads check: loaded %s active monitor queries (%s distinct search URLs)%s',
         len(active_queries),
+        len(fetch_plan),
         f' for source={source}' if source else '',
     )
     await db.add_job_log('INFO', f'Ads check started for {len(active_queries)} queries', job_name='check_new_ads')
 
-    olx_queries = {
-        query.id: query.query_url
-        for query in active_queries
-        if query.source == 'olx' or 'olx.ua/' in query.query_url
-    }
-    all_olx_parsed_ads = await parser_olx.get_parsed_ads(olx_queries) if olx_queries else {}
+    results = await asyncio.gather(
+        *(check_query_group(bot, db, url_key, queries, http_clients) for url_key, queries in fetch_plan.items()),
+        return_exceptions=True,
+    )
+    failed = [result for result in results if isinstance(result, Exception)]
+    for error in failed:
+        logger.error('Ads check: query group failed', exc_info=error)
+    if failed:
+        await db.add_job_log('ERROR', f'Ads check: {len(failed)} search(es) failed', job_name='check_new_ads')
+    http_cache.save()
 
-    for query in active_queries:
-        saved_ads = await db.list_found_ads_for_query(query.id)
-        saved_urls = {ad.ad_url for ad in saved_ads}
-        deactivated_map = {ad.ad_url: ad for ad in saved_ads if not ad.is_active}
 
-        if query.source == 'olx' or 'olx.ua/' in query.query_url:
-            parsed_ads = all_olx_parsed_ads.get(query.id, [])
-        elif query.source == 'rieltor' or 'rieltor.ua/' in query.query_url:
-            parsed_ads = await parse_rieltor(query.query_url) or []
-        else:
-            parsed_ads = []
-
-        parsed_urls = {ad['ad_url'] for ad in parsed_ads}
-        for parsed_ad in parsed_ads:
-            if parsed_ad['ad_url'] not in saved_urls:
-                await db.create_found_ad(query.id, {
-                    **parsed_ad,
-                    'ad_price': _normalize_price(parsed_ad.get('ad_price', 0)),
-                })
-                if bot:
-                    await send_new_ad_notification(bot, parsed_ad, query)
-            elif parsed_ad['ad_url'] in deactivated_map:
-                await db.set_found_ad_active(deactivated_map[parsed_ad['ad_url']].id, True)
-
-        for ad in saved_ads:
-            if ad.ad_url not in parsed_urls and ad.is_active:
-                await db.set_found_ad_active(ad.id, False)
-
-
-async def send_new_ad_notification(bot, parsed_ad, query):
-    await bot.send_message(
-        query.user_telegram_id,
-        f"{html.bold('Додане нове оголошення!')}\n"
-        f"{html.bold('Запит: ')}{query.query_name}\n"
-        f"{html.bold('Опис: ')}{parsed_ad['ad_description']}\n"
-        f"{html.bold('Ціна: ')}{parsed_ad['ad_price']} {parsed_ad['currency']}\n"
-        f"{html.bold('URL: ')}{parsed_ad['ad_url']}",
-        parse_mode=ParseMode.HTML,
+def _get_source_limits(settings, source: str) -> tuple[asyncio.Semaphore, Throttle]:
+    if source not in _source_limits:
+        _source_limits[source] = (
+            asyncio.Semaphore(max(getattr(settings, f'{source}_concurrency'), 1)),
+            Throttle(getattr(settings, f'{source}_request_delay_seconds')),
+        )
+    return _source_limits[source]
+
+
+async def _fetch_source_ads(
+    source: str,
+    query,
+    throttle: Throttle,
+    known_urls,
+    http_clients=None,
+) -> list[dict]:
+    if source == 'olx':
+        parsed = await parser_olx.get_parsed_ads(
+            {query.id: query.query_url},
+            throttle=throttle,
+            known_urls={query.id: known_urls} if known_urls is not None else None,
+            client=http_clients.httpx_client(query.query_url) if http_clients else None,
+        )
+        return parsed.get(query.id, [])
+    return await parse_rieltor(
+        query.query_url,
+        throttle=throttle,
+        known_urls=known_urls,
+        session=http_clients.aiohttp_session() if http_clients else None,
+    ) or []
+
+
+def _is_full_crawl_due(settings, url_key: str) -> bool:
+    last_full_crawl_at = _last_full_crawl_at.get(url_key)
+    if last_full_crawl_at is None:
+        return True
+    return time.monotonic() - last_full_crawl_at >= settings.full_crawl_interval_minutes * 60
+
+
+async def check_query_group(bot, db: Database, url_key: str, queries, http_clients=None):
+    source = _query_source(queries[0])
+    if not source:
+        return
+    saved_ads_by_query = {query.id: await saved_ads_for_query(db, query.id) for query in queries}
+    full_crawl = _is_full_crawl_due(db.settings, url_key)
+    known_urls = None
+    if not full_crawl:
+        # stop paginating only when no subscriber can get anything new
+        saved_ads = list(saved_ads_by_query.values())
+        known_urls = saved_ads[0] if len(saved_ads) == 1 else KnownAllOf(saved_ads)
+
+    semaphore, throttle = _get_source_limits(db.settings, source)
+    async with semaphore:
+        parsed_ads = await _fetch_source_ads(source, queries[0], throttle, known_urls, http_clients)
+    if full_crawl:
+        _last_full_crawl_at[url_key] = time.monotonic()
+
+    # the pages are parsed by now either way (only a 304 saves that), this skips the reconciliation
+    if not http_cache.listing_changed(url_key, _listing_fingerprint(full_crawl, saved_ads_by_query, parsed_ads)):
+        logger.info('Ads check: listing and saved ads unchanged since previous check, skipping %s', url_key)
+        return
+    for query in queries:
+        await _reconcile_query_ads(bot, db, query, parsed_ads, saved_ads_by_query[query.id], full_crawl)
+    http_cache.remember_listing(url_key, _listing_fingerprint(full_crawl, saved_ads_by_query, parsed_ads))
+
+
+def _listing_fingerprint(full_crawl: bool, saved_ads_by_query: dict[int, QueryAds], parsed_ads) -> str:
+    # the saved ads are part of it, so changes made elsewhere (another worker, an admin toggle)
+    # are reconciled even when the listing itself is the same
+    saved_state = sorted((query_id, saved_ads.checksum()) for query_id, saved_ads in saved_ads_by_query.items())
+    return http_cache.fingerprint(full_crawl, saved_state, parsed_ads)
+
+
+async def _reconcile_query_ads(bot, db: Database, query, parsed_ads, saved_ads: QueryAds, full_crawl: bool = True):
+    new_ads = {}
+    reactivated_ids = []
+    for parsed_ad in parsed_ads:
+        saved_ad = saved_ads.find(parsed_ad['ad_url'])
+        if saved_ad is None:
+            new_ads.setdefault(parsed_ad['ad_url'], parsed_ad)
+        elif not saved_ad[1]:
+            reactivated_ids.append(saved_ad[0])
+    # an incremental crawl sees only the newest pages, so it can't tell which ads are gone
+    deactivated_ids = saved_ads.active_ids_missing(ad['ad_url'] for ad in parsed_ads) if full_crawl else []
+
+    outbox = [
+        OutboxMessage(
+            dedup_key=f'ad:{query.id}:{url}',
+            chat_id=query.user_telegram_id,
+            kind='new_ad',
+            payload={
+                'query_name': query.query_name,
+                'ad_description': parsed_ad['ad_description'],
+                'ad_price': parsed_ad['ad_price'],
+                'currency': parsed_ad['currency'],
+                'ad_url': url,
+            },
+            group_key=f'digest:{query.id}' if query.digest_minutes is not None else None,
+            delay_seconds=(query.digest_minutes or 0) * 60,
+        )
+        for url, parsed_ad in new_ads.items()
+    ]
+    created = await db.apply_ad_diff(
+        query.id,
+        [{**ad, 'ad_price': _normalize_price(ad.get('ad_price', 0))} for ad in new_ads.values()],
+        reactivated_ids,
+        deactivated_ids,
+        outbox,
+    )
+    if db.ad_index is None:
+        # a one-off snapshot, kept in step so the remembered listing fingerprint matches found_ad
+        for ad in created:
+            saved_ads.add(ad.id, ad.ad_url, ad.is_active)
+        saved_ads.set_active(reactivated_ids, True)
+        saved_ads.set_active(deactivated_ids, False)
+    if bot and outbox:
+        bot.app_context.outbox.wake()
+
+
+def send_new_ad_notification(bot, chat_id: int, payload: dict) -> asyncio.Future:
+    return bot.app_context.notifier.enqueue(
+        chat_id,
+        partial(
+            bot.send_message,
+            chat_id,
+            f"{html.bold('Додане нове оголошення!')}\n"
+            f"{html.bold('Запит: ')}{payload['query_name']}\n"
+            f"{html.bold('Опис: ')}{payload['ad_description']}\n"
+            f"{html.bold('Ціна: ')}{payload['ad_price']} {payload['currency']}\n"
+            f"{html.bold('URL: ')}{payload['ad_url']}",
+            parse_mode=ParseMode.HTML,
+        ),
+    )
+
+
+def send_text_notification(bot, chat_id: int, payload: dict) -> asyncio.Future:
+    return bot.app_context.notifier.enqueue(
+        chat_id,
+        partial(bot.send_message, chat_id, payload['text'], parse_mode=ParseMode.HTML),
+        PRIORITY_HIGH,
     )
 
 
+def send_new_ads_digest(bot, chat_id: int, payloads: list[dict]) -> list[asyncio.Future]:
+    return [
+        bot.app_context.notifier.enqueue(chat_id, partial(bot.send_message, chat_id, page, parse_mode=ParseMode.HTML))
+        for page in build_digest_pages(payloads[0]['query_name'], payloads)
+    ]
+
+
+def build_digest_pages(query_name: str, payloads: list[dict], limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    entries = []
+    for number, payload in enumerate(payloads, start=1):
+        description = payload['ad_description']
+        if len(description) > DIGEST_DESCRIPTION_LIMIT:
+            description = description[:DIGEST_DESCRIPTION_LIMIT - 1] + '…'
+        price = html.bold(f"{payload['ad_price']} {payload['currency']}")
+        entries.append(f"{number}. {html.quote(description)}\n{price} {html.quote(payload['ad_url'])}")
+
+    # the header with the page counter is added afterwards, so leave room for it
+    body_limit = limit - len(query_name) - 100
+    pages = [[]]
+    page_length = 0
+    for entry in entries:
+        if pages[-1] and page_length + len(entry) + 2 > body_limit:
+            pages.append([])
+            page_length = 0
+        pages[-1].append(entry)
+        page_length += len(entry) + 2
+
+    title = html.bold(f'Нові оголошення ({len(payloads)})')
+    query_line = f"{html.bold('Запит: ')}{query_name}"
+    messages = []
+    for index, page in enumerate(pages, start=1):
+        counter = f' [{index}/{len(pages)}]' if len(pages) > 1 else ''
+        messages.append(f'{title}{counter}\n{query_line}\n\n' + '\n\n'.join(page))
+    return messages
+
+
 async def initialize_query_ads(bot, db: Database, monitor_service, query_id: int):
     query = await db.get_query(query_id)
     if not query:
@@ -101,16 +276,24 @@ async def initialize_query_ads(bot, db: Database, monitor_service, query_id: int
             f'Initial parse for "{query.query_name}": parsed={len(parsed_ads)}, saved={saved_count}',
             job_name='initialize_query_ads',
         )
-        if bot:
-            await bot.send_message(
-                query.user_telegram_id,
-                f'Первинна перевірка завершена для "{html.bold(query.query_name)}". '
-                f'Знайдено {len(parsed_ads)} оголошень.',
-                parse_mode=ParseMode.HTML,
+        # goes through the outbox because the parse may run in a worker without a bot
+        await db.enqueue_outbox([
+            OutboxMessage(
+                dedup_key=f'initial_parse:{query.id}',
+                chat_id=query.user_telegram_id,
+                kind='message',
+                payload={
+                    'text': f'Первинна перевірка завершена для "{html.bold(query.query_name)}". '
+                    f'Знайдено {len(parsed_ads)} оголошень.',
+                },
             )
+        ])
+        if bot:
+            bot.app_context.outbox.wake()
     except Exception:
         logger.exception('Initial monitor parse failed for query_id=%s', query_id)
         await db.add_job_log('ERROR', f'Initial parse failed for query_id={query_id}', job_name='initialize_query_ads')
+        raise
 
 
 def _map_content_type(value: str) -> str:
@@ -121,46 +304,62 @@ def _map_media_type(value: str) -> str:
     return 'video' if value.lower() == 'video' else 'photo'
 
 
-async def check_new_insta_content_async(bot, db: Database):
+async def check_new_insta_content_async(bot, db: Database, http_clients=None):
     usernames = await db.get_active_insta_usernames()
     logger.info('Instagram check: loaded %s active usernames', len(usernames))
     await db.add_job_log('INFO', f'Instagram check started for {len(usernames)} usernames', job_name='check_insta')
 
-    for username in usernames:
-        observed_user = await db.get_or_create_insta_user(username)
-        try:
+    results = await asyncio.gather(
+        *(check_insta_username(bot, db, username, http_clients) for username in usernames),
+        return_exceptions=True,
+    )
+    failed = [
+        (username, result) for username, result in zip(usernames, results) if isinstance(result, Exception)
+    ]
+    for username, error in failed:
+        logger.error('Instagram check: @%s failed', username, exc_info=error)
+    if failed:
+        await db.add_job_log('ERROR', f'Instagram check: {len(failed)} username(s) failed', job_name='check_insta')
+    logger.info('Instagram check: browser pool %s', browser_pool.metrics())
+
+
+async def check_insta_username(bot, db: Database, username: str, http_clients=None):
+    semaphore, throttle = _get_source_limits(db.settings, 'insta')
+    observed_user = await db.get_or_create_insta_user(username)
+    try:
+        async with semaphore:
+            await throttle.wait()
             content_items = await get_parsed_content(username, observed_user.id)
-        except Exception:
-            logger.exception('Instagram check: failed to parse @%s', username)
-            await db.add_job_log('ERROR', f'Failed to parse @{username}', job_name='check_insta')
+    except Exception:
+        logger.exception('Instagram check: failed to parse @%s', username)
+        await db.add_job_log('ERROR', f'Failed to parse @{username}', job_name='check_insta')
+        return
+
+    subscriber_ids = await db.get_insta_subscriber_ids(observed_user.id)
+    for item in content_items:
+        content_type = _map_content_type(item['content_type'])
+        media_type = _map_media_type(item['media_type'])
+        if await db.insta_content_exists(observed_user.id, content_type, media_type, item['file_name']):
             continue
+        content_key = f"insta:{observed_user.id}:{content_type}:{media_type}:{item['file_name']}"
+        await db.save_insta_content(
+            observed_user.id,
+            content_type,
+            media_type,
+            item['file_name'],
+            item['url'],
+            [
+                OutboxMessage(dedup_key=f'{content_key}:{subscriber_id}', chat_id=subscriber_id, kind='insta', payload=item)
+                for subscriber_id in subscriber_ids
+            ],
+        )
+        if bot and subscriber_ids:
+            bot.app_context.outbox.wake()
 
-        for item in content_items:
-            content_type = _map_content_type(item['content_type'])
-            media_type = _map_media_type(item['media_type'])
-            if await db.insta_content_exists(observed_user.id, content_type, media_type, item['file_name']):
-                continue
-            await db.save_insta_content(
-                observed_user.id,
-                content_type,
-                media_type,
-                item['file_name'],
-                item['url'],
-            )
-            if bot:
-                subscriber_ids = await db.get_insta_subscriber_ids(observed_user.id)
-                for subscriber_id in subscriber_ids:
-                    try:
-                        await send_insta_notification(bot, item, subscriber_id)
-                    except Exception:
-                        logger.exception(
-                            'Instagram check: failed to notify user %s about @%s',
-                            subscriber_id,
-                            username,
-                        )
-
-
-async def send_insta_notification(bot, content_item, receiver_id):
+
+async def send_insta_notifications(bot, content_item, receiver_ids, http_clients=None) -> dict[int, bool]:
+    if not receiver_ids:
+        return {}
     description = (
         f"{content_item['username']} add new "
         f"{content_item['content_type']} {content_item['media_type']}!"
@@ -171,19 +370,62 @@ async def send_insta_notification(bot, content_item, receiver_id):
     filename = content_item.get('file_name') or ('video.mp4' if is_video else 'photo.jpg')
 
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=120) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            media_file = BufferedInputFile(response.content, filename=filename)
+        client = http_clients.media_client() if http_clients else None
+        async with nullcontext(client) if client else httpx.AsyncClient(follow_redirects=True) as client:
+            media = await media_cache.download(url, filename, client)
+    except Exception:
+        logger.exception('Failed to download Instagram media %s, sending links instead', url)
+        media = None
+
+    notifier = bot.app_context.notifier
+    delivered = {}
+    pending_ids = list(receiver_ids) if media is not None else []
+    failed_ids = [] if media is not None else list(receiver_ids)
+    # upload to one receiver at a time until Telegram returns a file_id, then reuse it for the rest
+    while pending_ids and not isinstance(media, str):
+        receiver_id = pending_ids.pop(0)
+        message = await notifier.enqueue(
+            receiver_id,
+            _insta_media_sender(bot, receiver_id, media, is_video, caption),
+            PRIORITY_LOW,
+        )
+        if message is None:
+            failed_ids.append(receiver_id)
+            continue
+        delivered[receiver_id] = True
+        if is_video and message.video:
+            media = message.video.file_id
+        elif not is_video and message.photo:
+            media = message.photo[-1].file_id
 
-        if is_video:
-            await bot.send_video(chat_id=receiver_id, video=media_file, caption=caption, parse_mode=ParseMode.HTML)
+    futures = {
+        receiver_id: notifier.enqueue(
+            receiver_id,
+            _insta_media_sender(bot, receiver_id, media, is_video, caption),
+            PRIORITY_LOW,
+        )
+        for receiver_id in pending_ids
+    }
+    for receiver_id, future in futures.items():
+        if await future is None:
+            failed_ids.append(receiver_id)
         else:
-            await bot.send_photo(chat_id=receiver_id, photo=media_file, caption=caption, parse_mode=ParseMode.HTML)
-    except Exception:
-        logger.exception('Failed to send Instagram media to %s, sending link instead', receiver_id)
-        await bot.send_message(
+            delivered[receiver_id] = True
+
+    link_futures = {
+        receiver_id: notifier.enqueue(
             receiver_id,
-            f"{caption}\n{html.link('Open media', url)}",
-            parse_mode=ParseMode.HTML,
+            partial(bot.send_message, receiver_id, f"{caption}\n{html.link('Open media', url)}", parse_mode=ParseMode.HTML),
+            PRIORITY_LOW,
         )
+        for receiver_id in failed_ids
+    }
+    for receiver_id, future in link_futures.items():
+        delivered[receiver_id] = await future is not None
+    return delivered
+
+
+def _insta_media_sender(bot, receiver_id, media, is_video: bool, caption: str):
+    if is_video:
+        return partial(bot.send_video, chat_id=receiver_id, video=media, caption=caption, parse_mode=ParseMode.HTML)
+    return partial(bot.send_photo, chat_id=receiver_id, photo=media, caption=caption, parse_mode=ParseMode.HTML)
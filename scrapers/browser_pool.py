@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager, suppress
+
+from playwright.async_api import Browser, BrowserContext, Page, async_playwright
+
+logger = logging.getLogger(__name__)
+
+COMMON_CHROME_PATHS = (
+    '/usr/bin/chromium-browser',
+    '/usr/bin/chromium',
+    '/snap/bin/chromium',
+    '/usr/bin/google-chrome-stable',
+)
+CONTEXT_OPTIONS = {
+    'ignore_https_errors': True,
+    'viewport': {'width': 1365, 'height': 1600},
+}
+PAGE_DEFAULT_TIMEOUT_MS = 60_000
+
+
+class BrowserPool:
+    def __init__(self, contexts: int, pages_per_context: int, max_page_uses: int):
+        self.contexts_number = max(contexts, 1)
+        self.pages_per_context = max(pages_per_context, 1)
+        self.max_page_uses = max(max_page_uses, 1)
+        self._slots = asyncio.Semaphore(self.contexts_number * self.pages_per_context)
+        self._launch_lock = asyncio.Lock()
+        self._playwright = None
+        self._browser: Browser | None = None
+        self._generation = 0
+        self._contexts: list[BrowserContext | None] = []
+        self._context_pages: list[int] = []
+        self._idle_pages: list[Page] = []
+        self._page_state: dict[Page, list[int]] = {}
+        self._launches = 0
+        self._restarts = 0
+        self._pages_in_use = 0
+        self._pages_recycled = 0
+        self._acquires = 0
+        self._acquire_wait_total = 0.0
+
+    @asynccontextmanager
+    async def page(self):
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        async with self._slots:
+            page = await self._checkout()
+            self._acquires += 1
+            self._acquire_wait_total += loop.time() - started_at
+            self._pages_in_use += 1
+            succeeded = False
+            try:
+                yield page
+                succeeded = True
+            finally:
+                self._pages_in_use -= 1
+                await self._checkin(page, succeeded)
+
+    def metrics(self) -> dict:
+        return {
+            'launches': self._launches,
+            'restarts': self._restarts,
+            'pages_open': len(self._page_state),
+            'pages_in_use': self._pages_in_use,
+            'pages_recycled': self._pages_recycled,
+            'acquires': self._acquires,
+            'avg_acquire_wait_ms': round(self._acquire_wait_total / self._acquires * 1000, 1) if self._acquires else 0.0,
+        }
+
+    async def close(self) -> None:
+        async with self._launch_lock:
+            await self._close_browser()
+
+    async def _checkout(self) -> Page:
+        await self._ensure_browser()
+        while self._idle_pages:
+            page = self._idle_pages.pop()
+            if not page.is_closed():
+                return page
+            self._forget_page(page)
+
+        context_index = min(range(self.contexts_number), key=lambda index: self._context_pages[index])
+        context = self._contexts[context_index]
+        if context is None:
+            context = await self._browser.new_context(**CONTEXT_OPTIONS)
+            self._contexts[context_index] = context
+        page = await context.new_page()
+        page.set_default_timeout(PAGE_DEFAULT_TIMEOUT_MS)
+        self._context_pages[context_index] += 1
+        self._page_state[page] = [self._generation, context_index, 0]
+        return page
+
+    async def _checkin(self, page: Page, succeeded: bool) -> None:
+        state = self._page_state.get(page)
+        if state is None:
+            return
+        state[2] += 1
+        stale = state[0] != self._generation or not self._browser or not self._browser.is_connected()
+        if succeeded and not stale and not page.is_closed() and state[2] < self.max_page_uses:
+            self._idle_pages.append(page)
+            return
+        self._forget_page(page)
+        self._pages_recycled += 1
+        with suppress(Exception):
+            await page.close()
+
+    def _forget_page(self, page: Page) -> None:
+        generation, context_index, _ = self._page_state.pop(page)
+        if generation == self._generation:
+            self._context_pages[context_index] -= 1
+
+    async def _ensure_browser(self) -> None:
+        if self._browser and self._browser.is_connected():
+            return
+        async with self._launch_lock:
+            if self._browser and self._browser.is_connected():
+                return
+            if self._browser is not None:
+                self._restarts += 1
+                logger.warning('Browser pool: browser disconnected, relaunching')
+            await self._close_browser()
+            self._playwright = await async_playwright().start()
+            self._browser = await launch_browser(self._playwright)
+            self._launches += 1
+            self._generation += 1
+            self._contexts = [None] * self.contexts_number
+            self._context_pages = [0] * self.contexts_number
+
+    async def _close_browser(self) -> None:
+        for page in self._idle_pages:
+            self._page_state.pop(page, None)
+        self._idle_pages.clear()
+        if self._browser is not None:
+            with suppress(Exception):
+                await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            with suppress(Exception):
+                await self._playwright.stop()
+            self._playwright = None
+
+
+_pool: BrowserPool | None = None
+
+
+def start(contexts: int, pages_per_context: int, max_page_uses: int) -> None:
+    global _pool
+    if _pool is not None:
+        return
+    _pool = BrowserPool(contexts, pages_per_context, max_page_uses)
+    logger.info(
+        'Browser pool configured: %s context(s) x %s page(s), pages recycled after %s uses',
+        _pool.contexts_number,
+        _pool.pages_per_context,
+        _pool.max_page_uses,
+    )
+
+
+async def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        logger.info('Browser pool metrics: %s', _pool.metrics())
+        await _pool.close()
+        _pool = None
+
+
+def metrics() -> dict:
+    return _pool.metrics() if _pool else {}
+
+
+@asynccontextmanager
+async def page():
+    if _pool is not None:
+        async with _pool.page() as pooled_page:
+            yield pooled_page
+        return
+
+    one_off_pool = BrowserPool(1, 1, 1)
+    try:
+        async with one_off_pool.page() as one_off_page:
+            yield one_off_page
+    finally:
+        await one_off_pool.close()
+
+
+async def launch_browser(playwright):
+    args = [
+        '--no-sandbox',
+        '--disable-dev-shm-usage',
+        '--disable-gpu',
+        '--ignore-certificate-errors',
+    ]
+    for chrome_bin in _iter_chrome_bins():
+        try:
+            logger.info('Browser pool: using Chrome at %s', chrome_bin)
+            return await playwright.chromium.launch(headless=True, executable_path=chrome_bin, args=args)
+        except Exception as error:
+            if _is_missing_executable_error(error):
+                logger.warning('Browser pool: Chrome not found at %s', chrome_bin)
+                continue
+            raise
+
+    logger.info('Browser pool: using Playwright bundled Chromium')
+    try:
+        return await playwright.chromium.launch(headless=True, args=args)
+    except Exception as error:
+        if not _is_missing_executable_error(error):
+            raise
+        raise RuntimeError(
+            'No Chromium found. Run as bot user: playwright install chromium'
+        ) from error
+
+
+def _iter_chrome_bins():
+    seen = set()
+    explicit = os.getenv('CHROME_BIN', '').strip()
+    if explicit:
+        yield explicit
+        seen.add(explicit)
+    for path in COMMON_CHROME_PATHS:
+        if path not in seen:
+            yield path
+            seen.add(path)
+
+
+def _is_missing_executable_error(error: Exception) -> bool:
+    message = str(error)
+    return "Executable doesn't exist" in message or "Failed to launch chromium because executable doesn't exist" in message
@@ -0,0 +1,46 @@
+import os
+from functools import cache
+
+HTML_PARSER = os.getenv('HTML_PARSER', 'bs4').strip().lower()
+BACKENDS = ('bs4', 'lxml')
+
+
+def resolve_backend(backend: str | None = None) -> str:
+    backend = backend or HTML_PARSER
+    if backend not in BACKENDS:
+        raise ValueError(f'Unsupported HTML_PARSER "{backend}", expected one of: {", ".join(BACKENDS)}')
+    return backend
+
+
+def lxml_document(response_text: str):
+    from lxml import html as lxml_html
+
+    if not response_text.strip():
+        return lxml_html.document_fromstring('<html></html>')
+    return lxml_html.document_fromstring(response_text)
+
+
+@cache
+def xpath(expression: str):
+    from lxml import etree
+
+    return etree.XPath(expression)
+
+
+def has_class(class_name: str) -> str:
+    return f'contains(concat(" ", normalize-space(@class), " "), " {class_name} ")'
+
+
+def first(expression: str, element):
+    found = xpath(expression)(element)
+    return found[0] if found else None
+
+
+def text(element) -> str:
+    # same as BeautifulSoup's element.text
+    return ''.join(xpath('.//text()')(element))
+
+
+def stripped_text(element, separator: str = '') -> str:
+    # same as BeautifulSoup's element.get_text(separator, strip=True)
+    return separator.join(part.strip() for part in xpath('.//text()')(element) if part.strip())
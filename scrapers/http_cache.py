@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+NOT_MODIFIED = object()
+
+_path: str | None = None
+_max_entries = 0
+_entries: OrderedDict[str, dict] = OrderedDict()
+# keys written since the last save; only these are merged into the shared file
+_changed: set[str] = set()
+
+
+def start(path: str, max_entries: int) -> None:
+    global _path, _max_entries
+    if not path or max_entries <= 0:
+        return
+    _path = path
+    _max_entries = max_entries
+    _entries.clear()
+    _changed.clear()
+    _entries.update(_read(path))
+    _evict()
+    logger.info('HTTP cache: loaded %s entries from %s', len(_entries), path)
+
+
+def shutdown() -> None:
+    global _path
+    save()
+    _path = None
+    _entries.clear()
+
+
+def save() -> None:
+    # the bot and the workers on one host share the file: each one merges only its own
+    # changes into what is on disk, under a lock and through its own temp file
+    if not _path or not _changed:
+        return
+    with _file_lock(f'{_path}.lock'):
+        merged = OrderedDict(_read(_path))
+        for key in _changed:
+            if key in _entries:
+                merged[key] = _entries[key]
+                merged.move_to_end(key)
+        while len(merged) > _max_entries:
+            merged.popitem(last=False)
+        tmp_path = f'{_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(merged, cache_file, ensure_ascii=False)
+        os.replace(tmp_path, _path)
+    _changed.clear()
+
+
+def _read(path: str) -> dict:
+    try:
+        with open(path, encoding='utf-8') as cache_file:
+            return json.load(cache_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        logger.warning('HTTP cache: failed to load %s, starting empty', path)
+        return {}
+
+
+@contextmanager
+def _file_lock(lock_path: str):
+    try:
+        import fcntl
+    except ImportError:
+        # no flock on Windows, where the bot runs as a single process anyway
+        yield
+        return
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def conditional_headers(url: str) -> dict:
+    entry = _get(url)
+    if not entry:
+        return {}
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def cached_result(url: str):
+    entry = _get(url)
+    return entry['result'] if entry else None
+
+
+def store(url: str, response_headers, result) -> None:
+    if not _path:
+        return
+    etag = response_headers.get('etag')
+    last_modified = response_headers.get('last-modified')
+    if not etag and not last_modified:
+        return
+    _put(url, {'etag': etag, 'last_modified': last_modified, 'result': result})
+
+
+def fingerprint(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def listing_changed(key: str, listing_fingerprint: str) -> bool:
+    entry = _get(f'listing:{key}')
+    return not entry or entry['fingerprint'] != listing_fingerprint
+
+
+def remember_listing(key: str, listing_fingerprint: str) -> None:
+    if _path:
+        _put(f'listing:{key}', {'fingerprint': listing_fingerprint})
+
+
+def forget_listing(key: str) -> None:
+    _entries.pop(f'listing:{key}', None)
+
+
+def _get(key: str) -> dict | None:
+    if not _path or key not in _entries:
+        return None
+    _entries.move_to_end(key)
+    return _entries[key]
+
+
+def _put(key: str, entry: dict) -> None:
+    _entries[key] = entry
+    _entries.move_to_end(key)
+    _evict()
+    _changed.add(key)
+
+
+def _evict() -> None:
+    while len(_entries) > _max_entries:
+        _entries.popitem(last=False)
@@ -5,101 +5,91 @@ import time
 from typing import Dict, List, Optional
 from urllib.parse import parse_qs, urlparse
 
-from playwright.async_api import Locator, Page, TimeoutError as PlaywrightTimeoutError, async_playwright
+from playwright.async_api import Locator, Page, TimeoutError as PlaywrightTimeoutError
+
+from scrapers import browser_pool
 
 logger = logging.getLogger(__name__)
 
+INSTA_FAST_SCRAPE = os.getenv('INSTA_FAST_SCRAPE', 'true').strip().lower() in {'1', 'true', 'yes', 'on'}
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+BLOCKED_HOST_PARTS = (
+    'google-analytics.com',
+    'googletagmanager.com',
+    'googlesyndication.com',
+    'doubleclick.net',
+    'facebook.net',
+    'yandex.ru',
+)
+MEDIA_ITEM_SELECTOR = 'ul.profile-media-list li.profile-media-list__item'
+DOWNLOAD_BUTTON_SELECTOR = 'a.button.button--filled.button__download'
+MEDIA_QUIET_MS = 1_500
+
+SCROLL_AND_WAIT_FOR_ITEMS_JS = '''
+([selector, previousCount, quietMs]) => new Promise(resolve => {
+    const count = () => document.querySelectorAll(selector).length;
+    let timer;
+    const observer = new MutationObserver(() => {
+        if (count() > previousCount) {
+            finish();
+        }
+    });
+    const finish = () => {
+        observer.disconnect();
+        clearTimeout(timer);
+        resolve(count());
+    };
+    observer.observe(document.body, {childList: true, subtree: true});
+    timer = setTimeout(finish, quietMs);
+    window.scrollBy(0, window.innerHeight * 2);
+    if (count() > previousCount) {
+        finish();
+    }
+})
+'''
+READ_DOWNLOAD_URLS_JS = '''
+([itemSelector, buttonSelector]) => Array.from(
+    document.querySelectorAll(itemSelector),
+    item => item.querySelector(buttonSelector)?.getAttribute('href') || null,
+)
+'''
+
 
 async def get_parsed_content(username: str, user_id: int) -> List[Dict]:
     parsed_content: List[Dict] = []
     logger.info('Instagram scraper: opening anonyig.com for @%s', username)
 
-    async with async_playwright() as playwright:
-        browser = await _launch_browser(playwright)
+    async with browser_pool.page() as page:
+        if INSTA_FAST_SCRAPE:
+            await page.route('**/*', _block_non_essential_requests)
         try:
-            context = await browser.new_context(
-                ignore_https_errors=True,
-                viewport={'width': 1365, 'height': 1600},
-            )
-            page = await context.new_page()
-            page.set_default_timeout(60_000)
             await page.goto('https://anonyig.com/en/', wait_until='domcontentloaded')
             await _search_username(page, username)
 
             try:
                 await page.wait_for_selector('li.profile-media-list__item', timeout=5_000)
-                media_items = await _collect_media_items(page, max_items=30, max_seconds=10, pause_seconds=2)
-                parsed_content.extend(await _extract_items(media_items, 'Post', user_id, username))
+                parsed_content.extend(await _read_tab_items(
+                    page, 'Post', user_id, username, max_items=30, max_seconds=10, pause_seconds=2,
+                ))
             except PlaywrightTimeoutError:
                 logger.info('Instagram scraper: @%s posts tab did not load within 5 sec', username)
 
             if await _switch_to_stories_tab(page):
                 try:
                     await page.wait_for_selector('li.profile-media-list__item', timeout=5_000)
-                    media_items = await _collect_media_items(page, stop_when_stable=True, pause_seconds=3)
-                    parsed_content.extend(await _extract_items(media_items, 'Story', user_id, username))
+                    parsed_content.extend(await _read_tab_items(
+                        page, 'Story', user_id, username, stop_when_stable=True, pause_seconds=3,
+                    ))
                 except PlaywrightTimeoutError:
                     logger.info('Instagram scraper: @%s stories tab did not load within 5 sec', username)
         finally:
-            await browser.close()
+            if INSTA_FAST_SCRAPE and not page.is_closed():
+                await page.unroute('**/*', _block_non_essential_requests)
 
     logger.info('Instagram scraper: finished @%s, total downloadable items=%s', username, len(parsed_content))
     return parsed_content
 
 
-COMMON_CHROME_PATHS = (
-    '/usr/bin/chromium-browser',
-    '/usr/bin/chromium',
-    '/snap/bin/chromium',
-    '/usr/bin/google-chrome-stable',
-)
-
-
-async def _launch_browser(playwright):
-    args = [
-        '--no-sandbox',
-        '--disable-dev-shm-usage',
-        '--disable-gpu',
-        '--ignore-certificate-errors',
-    ]
-    for chrome_bin in _iter_chrome_bins():
-        try:
-            logger.info('Instagram scraper: using Chrome at %s', chrome_bin)
-            return await playwright.chromium.launch(headless=True, executable_path=chrome_bin, args=args)
-        except Exception as error:
-            if _is_missing_executable_error(error):
-                logger.warning('Instagram scraper: Chrome not found at %s', chrome_bin)
-                continue
-            raise
-
-    logger.info('Instagram scraper: using Playwright bundled Chromium')
-    try:
-        return await playwright.chromium.launch(headless=True, args=args)
-    except Exception as error:
-        if not _is_missing_executable_error(error):
-            raise
-        raise RuntimeError(
-            'No Chromium found. Run as bot user: playwright install chromium'
-        ) from error
-
-
-def _iter_chrome_bins():
-    seen = set()
-    explicit = os.getenv('CHROME_BIN', '').strip()
-    if explicit:
-        yield explicit
-        seen.add(explicit)
-    for path in COMMON_CHROME_PATHS:
-        if path not in seen:
-            yield path
-            seen.add(path)
-
-
-def _is_missing_executable_error(error: Exception) -> bool:
-    message = str(error)
-    return "Executable doesn't exist" in message or "Failed to launch chromium because executable doesn't exist" in message
-
-
 async def _search_username(page: Page, username: str) -> None:
     await page.wait_for_selector('body')
     search_input = await _find_search_input(page)
@@ -143,6 +133,45 @@ async def _click_search_button(page: Page) -> bool:
     return False
 
 
+async def _block_non_essential_requests(route) -> None:
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(part in request.url for part in BLOCKED_HOST_PARTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _read_tab_items(
+    page: Page,
+    content_type: str,
+    user_id: int,
+    username: str,
+    max_items: Optional[int] = None,
+    max_seconds: int = 20,
+    pause_seconds: int = 2,
+    stop_when_stable: bool = False,
+) -> List[Dict]:
+    if INSTA_FAST_SCRAPE:
+        await _scroll_until_stable(page, max_items, max_seconds)
+        urls = await page.evaluate(READ_DOWNLOAD_URLS_JS, [MEDIA_ITEM_SELECTOR, DOWNLOAD_BUTTON_SELECTOR])
+        return [_content_item(url, content_type, user_id, username) for url in urls if url]
+
+    media_items = await _collect_media_items(page, max_items, max_seconds, pause_seconds, stop_when_stable)
+    return await _extract_items(media_items, content_type, user_id, username)
+
+
+async def _scroll_until_stable(page: Page, max_items: Optional[int] = None, max_seconds: int = 20) -> None:
+    start_time = time.time()
+    count = 0
+    while time.time() - start_time < max_seconds:
+        new_count = await page.evaluate(SCROLL_AND_WAIT_FOR_ITEMS_JS, [MEDIA_ITEM_SELECTOR, count, MEDIA_QUIET_MS])
+        if max_items and new_count >= max_items:
+            break
+        if new_count <= count:
+            break
+        count = new_count
+
+
 async def _collect_media_items(
     page: Page,
     max_items: Optional[int] = None,
@@ -152,7 +181,7 @@ async def _collect_media_items(
 ) -> Locator:
     start_time = time.time()
     previous_count = -1
-    locator = page.locator('ul.profile-media-list li.profile-media-list__item')
+    locator = page.locator(MEDIA_ITEM_SELECTOR)
     while time.time() - start_time < max_seconds:
         count = await locator.count()
         if max_items and count >= max_items:
@@ -186,23 +215,27 @@ async def _extract_items(media_items: Locator, content_type: str, user_id: int,
     items: List[Dict] = []
     for index in range(await media_items.count()):
         item = media_items.nth(index)
-        download_btn = item.locator('a.button.button--filled.button__download').first
+        download_btn = item.locator(DOWNLOAD_BUTTON_SELECTOR).first
         if await download_btn.count() == 0:
             continue
         url = await download_btn.get_attribute('href')
         if not url:
             continue
-        items.append({
-            'content_type': content_type,
-            'media_type': 'Video' if '.mp4' in url else 'Photo',
-            'username': username,
-            'user_id': user_id,
-            'file_name': extract_filename_from_url(url),
-            'url': url,
-        })
+        items.append(_content_item(url, content_type, user_id, username))
     return items
 
 
+def _content_item(url: str, content_type: str, user_id: int, username: str) -> Dict:
+    return {
+        'content_type': content_type,
+        'media_type': 'Video' if '.mp4' in url else 'Photo',
+        'username': username,
+        'user_id': user_id,
+        'file_name': extract_filename_from_url(url),
+        'url': url,
+    }
+
+
 def extract_filename_from_url(url: str) -> str:
     parsed_url = urlparse(url)
     filename = parse_qs(parsed_url.query).get('filename', [None])[0]
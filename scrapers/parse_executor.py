@@ -0,0 +1,33 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def start(workers: int) -> None:
+    global _executor
+    if workers <= 0 or _executor is not None:
+        return
+    _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    logger.info('Parse executor started with %s worker process(es)', workers)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run(func, *args):
+    if _executor is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def map_pages(func, pages):
+    return await asyncio.gather(*(run(func, page) for page in pages))
@@ -1,6 +1,7 @@
 import asyncio
 import logging
-from typing import Dict, List, Tuple
+from contextlib import nullcontext
+from typing import Dict, List, Set, Tuple
 from urllib.parse import parse_qs, urljoin, urlparse
 
 import os
@@ -9,6 +10,10 @@ import httpx
 import requests
 from bs4 import BeautifulSoup
 
+from scrapers import html_backend, http_cache, parse_executor
+from scrapers.html_backend import first, xpath
+from scrapers.throttle import Throttle
+
 logger = logging.getLogger(__name__)
 
 USE_ASYNC_MODE = os.getenv('USE_ASYNC_MODE', 'true').strip().lower() in {'1', 'true', 'yes', 'on'}
@@ -24,7 +29,12 @@ HEADERS = {
 HOST = 'https://www.olx.ua'
 
 
-async def get_parsed_ads(olx_checker_queries: Dict[int, str]) -> Dict[int, List[Dict]]:
+async def get_parsed_ads(
+    olx_checker_queries: Dict[int, str],
+    throttle: Throttle | None = None,
+    known_urls: Dict[int, Set[str]] | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> Dict[int, List[Dict]]:
     logger.info(
         'OLX scraper: starting fetch for %s queries. Async mode=%s, workers=%s',
         len(olx_checker_queries),
@@ -33,10 +43,13 @@ async def get_parsed_ads(olx_checker_queries: Dict[int, str]) -> Dict[int, List[
         extra={'job_name': 'check_new_ads'},
     )
     if USE_ASYNC_MODE:
-        queries_with_responses_text = await get_responses_text_with_async_mode(olx_checker_queries)
+        queries_with_pages_ads = await get_pages_ads_with_async_mode(olx_checker_queries, throttle, known_urls, client)
     else:
-        queries_with_responses_text = get_responses_text_with_sync_mode(olx_checker_queries)
-    parsed_ads = extract_ads(queries_with_responses_text)
+        queries_with_pages_ads = get_pages_ads_with_sync_mode(olx_checker_queries, known_urls)
+    parsed_ads = {
+        query_id: merge_unique_ads(pages_ads)
+        for query_id, pages_ads in queries_with_pages_ads.items()
+    }
     logger.info(
         'OLX scraper: finished. Parsed %s ads from %s queries',
         sum(len(ads) for ads in parsed_ads.values()),
@@ -46,43 +59,53 @@ async def get_parsed_ads(olx_checker_queries: Dict[int, str]) -> Dict[int, List[
     return parsed_ads
 
 
-async def get_responses_text_with_async_mode(olx_checker_queries: Dict[int, str]) -> Dict[int, List[str]]:
+async def get_pages_ads_with_async_mode(
+    olx_checker_queries: Dict[int, str],
+    throttle: Throttle | None = None,
+    known_urls: Dict[int, Set[str]] | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> Dict[int, List[List[Dict]]]:
     queue = asyncio.Queue()
-    queries_with_responses_text = {}
+    queries_with_pages_ads = {}
     queued_urls = {}
 
     for query_id, query_url in olx_checker_queries.items():
         queued_urls[query_id] = {query_url}
         await queue.put((query_id, query_url, 1))
 
-    async with httpx.AsyncClient(headers=HEADERS, follow_redirects=True) as client:
+    async with nullcontext(client) if client else httpx.AsyncClient(follow_redirects=True) as client:
         workers = [
-            asyncio.create_task(worker(queue, client, queries_with_responses_text, queued_urls))
+            asyncio.create_task(worker(queue, client, queries_with_pages_ads, queued_urls, throttle, known_urls))
             for _ in range(WORKERS_NUMBER)
         ]
         await queue.join()
         for _ in range(WORKERS_NUMBER):
             await queue.put(None)
         await asyncio.gather(*workers)
-    return queries_with_responses_text
+    return queries_with_pages_ads
 
 
-async def worker(queue, client, queries_with_responses_text, queued_urls):
+async def worker(queue, client, queries_with_pages_ads, queued_urls, throttle=None, known_urls=None):
     while True:
         query = await queue.get()
         if query is None:
             break
-        await fetch_url_with_async_mode(client, query, queue, queries_with_responses_text, queued_urls)
+        if throttle:
+            await throttle.wait()
+        await fetch_url_with_async_mode(client, query, queue, queries_with_pages_ads, queued_urls, known_urls)
         queue.task_done()
 
 
-async def fetch_url_with_async_mode(client, query, queue, queries_with_responses_text, queued_urls):
+async def fetch_url_with_async_mode(client, query, queue, queries_with_pages_ads, queued_urls, known_urls=None):
     query_id = query[0]
     url = query[1]
     page_number = query[2]
     try:
-        response = await client.get(url)
-        if response.status_code != 200:
+        cached = http_cache.cached_result(url)
+        response = await client.get(url, headers={**HEADERS, **http_cache.conditional_headers(url)})
+        if response.status_code == 304 and cached is not None:
+            pagination_page_urls, page_ads = cached
+        elif response.status_code != 200:
             logger.warning(
                 'OLX scraper: received HTTP %s for query_id=%s page=%s %s',
                 response.status_code,
@@ -92,8 +115,10 @@ async def fetch_url_with_async_mode(client, query, queue, queries_with_responses
                 extra={'job_name': 'check_new_ads'},
             )
             return
-
-        queries_with_responses_text.setdefault(query_id, []).append(response.text)
+        else:
+            pagination_page_urls, page_ads = await parse_executor.run(process_page, response.text)
+            http_cache.store(url, response.headers, [pagination_page_urls, page_ads])
+        queries_with_pages_ads.setdefault(query_id, []).append(page_ads)
         logger.info(
             'OLX scraper: fetched query_id=%s page=%s successfully: %s',
             query_id,
@@ -101,7 +126,11 @@ async def fetch_url_with_async_mode(client, query, queue, queries_with_responses
             url,
             extra={'job_name': 'check_new_ads'},
         )
-        for pagination_page_number, pagination_url in get_pagination_page_urls(response.text):
+        if known_urls is not None:
+            pagination_page_urls = _incremental_pagination(
+                query_id, page_number, page_ads, pagination_page_urls, known_urls.get(query_id, set())
+            )
+        for pagination_page_number, pagination_url in pagination_page_urls:
             if pagination_url in queued_urls.setdefault(query_id, set()):
                 continue
             queued_urls[query_id].add(pagination_url)
@@ -124,17 +153,23 @@ async def fetch_url_with_async_mode(client, query, queue, queries_with_responses
         )
 
 
-def get_responses_text_with_sync_mode(olx_checker_queries: Dict[int, str]) -> Dict[int, List[str]]:
-    queries_with_responses_text = {}
+def get_pages_ads_with_sync_mode(
+    olx_checker_queries: Dict[int, str],
+    known_urls: Dict[int, Set[str]] | None = None,
+) -> Dict[int, List[List[Dict]]]:
+    queries_with_pages_ads = {}
     for query_id, query_url in olx_checker_queries.items():
-        current = fetch_url_with_sync_mode((query_id, query_url))
+        current = fetch_url_with_sync_mode(
+            (query_id, query_url),
+            known_urls.get(query_id, set()) if known_urls is not None else None,
+        )
         if current:
-            queries_with_responses_text.setdefault(query_id, []).extend(current[query_id])
-    return queries_with_responses_text
+            queries_with_pages_ads.setdefault(query_id, []).extend(current[query_id])
+    return queries_with_pages_ads
 
 
-def fetch_url_with_sync_mode(query: Tuple[int, str]):
-    queries_with_responses_text = {}
+def fetch_url_with_sync_mode(query: Tuple[int, str], known_urls: Set[str] | None = None):
+    queries_with_pages_ads = {}
     query_id = query[0]
     queued_pages = [(1, query[1])]
     queued_urls = {query[1]}
@@ -144,8 +179,13 @@ def fetch_url_with_sync_mode(query: Tuple[int, str]):
         if current_url in processed_urls:
             continue
         processed_urls.add(current_url)
-        response = requests.get(current_url, headers=HEADERS, timeout=30)
-        if response.status_code == 200:
+        cached = http_cache.cached_result(current_url)
+        response = requests.get(
+            current_url,
+            headers={**HEADERS, **http_cache.conditional_headers(current_url)},
+            timeout=30,
+        )
+        if response.status_code == 200 or (response.status_code == 304 and cached is not None):
             logger.info(
                 'OLX scraper: fetched query_id=%s page=%s successfully: %s',
                 query_id,
@@ -153,8 +193,17 @@ def fetch_url_with_sync_mode(query: Tuple[int, str]):
                 current_url,
                 extra={'job_name': 'check_new_ads'},
             )
-            queries_with_responses_text.setdefault(query_id, []).append(response.text)
-            for pagination_page_number, pagination_url in get_pagination_page_urls(response.text):
+            if response.status_code == 304:
+                pagination_page_urls, page_ads = cached
+            else:
+                pagination_page_urls, page_ads = process_page(response.text)
+                http_cache.store(current_url, response.headers, [pagination_page_urls, page_ads])
+            queries_with_pages_ads.setdefault(query_id, []).append(page_ads)
+            if known_urls is not None:
+                pagination_page_urls = _incremental_pagination(
+                    query_id, page_number, page_ads, pagination_page_urls, known_urls
+                )
+            for pagination_page_number, pagination_url in pagination_page_urls:
                 if pagination_url in queued_urls:
                     continue
                 queued_urls.add(pagination_url)
@@ -176,11 +225,40 @@ def fetch_url_with_sync_mode(query: Tuple[int, str]):
                 extra={'job_name': 'check_new_ads'},
             )
             return None
-    return queries_with_responses_text
+    return queries_with_pages_ads
+
+
+def _incremental_pagination(
+    query_id: int,
+    page_number: int,
+    page_ads: List[Dict],
+    pagination_page_urls: List[Tuple[int, str]],
+    known_urls: Set[str],
+) -> List[Tuple[int, str]]:
+    if all(ad['ad_url'] in known_urls for ad in page_ads):
+        logger.info(
+            'OLX scraper: query_id=%s page=%s has no new ads, stopping incremental crawl',
+            query_id,
+            page_number,
+            extra={'job_name': 'check_new_ads'},
+        )
+        return []
+    return [
+        (pagination_page_number, pagination_url)
+        for pagination_page_number, pagination_url in pagination_page_urls
+        if pagination_page_number == page_number + 1
+    ]
 
 
-def get_pagination_page_urls(response_text: str) -> List[Tuple[int, str]]:
+def process_page(response_text: str, backend: str | None = None) -> Tuple[List[Tuple[int, str]], List[Dict]]:
+    if html_backend.resolve_backend(backend) == 'lxml':
+        document = html_backend.lxml_document(response_text)
+        return _get_pagination_page_urls_lxml(document), _extract_page_ads_lxml(document)
     soup = BeautifulSoup(response_text, 'html.parser')
+    return get_pagination_page_urls(soup), extract_page_ads(soup)
+
+
+def get_pagination_page_urls(soup: BeautifulSoup) -> List[Tuple[int, str]]:
     listing_grid = soup.find_all('div', {'data-testid': 'listing-grid'})
     if len(listing_grid) > 1:
         return []
@@ -188,14 +266,7 @@ def get_pagination_page_urls(response_text: str) -> List[Tuple[int, str]]:
     pagination_urls = {}
     for link in soup.find_all('a', href=True):
         href = link['href']
-        data_cy = link.get('data-cy', '')
-        data_testid = link.get('data-testid', '')
-        is_pagination_link = (
-            'page=' in href
-            or 'pagination' in data_cy
-            or 'pagination' in data_testid
-        )
-        if not is_pagination_link:
+        if not _is_pagination_link(href, link.get('data-cy', ''), link.get('data-testid', '')):
             continue
 
         page_url = urljoin(HOST, href)
@@ -204,6 +275,33 @@ def get_pagination_page_urls(response_text: str) -> List[Tuple[int, str]]:
             continue
         pagination_urls[page_url] = page_number
 
+    return _sorted_page_urls(pagination_urls)
+
+
+def _get_pagination_page_urls_lxml(document) -> List[Tuple[int, str]]:
+    if len(xpath('//div[@data-testid="listing-grid"]')(document)) > 1:
+        return []
+
+    pagination_urls = {}
+    for link in xpath('//a[@href]')(document):
+        href = link.get('href')
+        if not _is_pagination_link(href, link.get('data-cy', ''), link.get('data-testid', '')):
+            continue
+
+        page_url = urljoin(HOST, href)
+        page_number = _get_page_number(page_url, html_backend.stripped_text(link))
+        if not page_number:
+            continue
+        pagination_urls[page_url] = page_number
+
+    return _sorted_page_urls(pagination_urls)
+
+
+def _is_pagination_link(href: str, data_cy: str, data_testid: str) -> bool:
+    return 'page=' in href or 'pagination' in data_cy or 'pagination' in data_testid
+
+
+def _sorted_page_urls(pagination_urls: Dict[str, int]) -> List[Tuple[int, str]]:
     return sorted(
         ((page_number, page_url) for page_url, page_number in pagination_urls.items()),
         key=lambda item: item[0],
@@ -218,40 +316,73 @@ def _get_page_number(page_url: str, fallback_text: str = '') -> int | None:
     return int(fallback_text) if fallback_text.isdigit() else None
 
 
-def extract_ads(queries_with_responses_text: Dict[int, List[str]]) -> Dict[int, List[Dict]]:
-    queries_with_unique_ads = {}
-    if not queries_with_responses_text:
-        return queries_with_unique_ads
+def extract_page_ads(soup: BeautifulSoup) -> List[Dict]:
+    page_ads = []
+    unique_urls = set()
+    listing_grid = soup.find('div', {'data-testid': 'listing-grid'})
+    if not listing_grid:
+        return page_ads
+    for link in listing_grid.find_all('div', {'data-cy': 'l-card'}):
+        ad_card_title = link.find('div', {'data-cy': 'ad-card-title'})
+        if not ad_card_title:
+            continue
+        a_tag = ad_card_title.find('a')
+        if not a_tag:
+            continue
+        url = HOST + a_tag['href']
+        if url in unique_urls or 'olx.ua/d/obyavlenie' in url:
+            continue
+        unique_urls.add(url)
+        price_tag = ad_card_title.find('p', {'data-testid': 'ad-price'})
+        page_ads.append(_ad_info(url, a_tag.find('h4').text, price_tag.text if price_tag else None))
+    return page_ads
+
+
+def _extract_page_ads_lxml(document) -> List[Dict]:
+    page_ads = []
+    unique_urls = set()
+    listing_grid = first('//div[@data-testid="listing-grid"]', document)
+    if listing_grid is None:
+        return page_ads
+    for link in xpath('.//div[@data-cy="l-card"]')(listing_grid):
+        ad_card_title = first('.//div[@data-cy="ad-card-title"]', link)
+        if ad_card_title is None:
+            continue
+        a_tag = first('.//a', ad_card_title)
+        if a_tag is None:
+            continue
+        url = HOST + a_tag.attrib['href']
+        if url in unique_urls or 'olx.ua/d/obyavlenie' in url:
+            continue
+        unique_urls.add(url)
+        price_tag = first('.//p[@data-testid="ad-price"]', ad_card_title)
+        page_ads.append(_ad_info(
+            url,
+            html_backend.text(first('.//h4', a_tag)),
+            html_backend.text(price_tag) if price_tag is not None else None,
+        ))
+    return page_ads
+
+
+def _ad_info(url: str, description: str, price_text: str | None) -> Dict:
+    ad_info = {'ad_url': url, 'ad_description': description}
+    if price_text is not None:
+        ad_info['ad_price'], ad_info['currency'] = split_price(price_text)
+    else:
+        ad_info['ad_price'], ad_info['currency'] = 0, 'без ціни'
+    return ad_info
+
 
-    for query_id, responses_text in queries_with_responses_text.items():
-        unique_urls = []
-        queries_with_unique_ads[query_id] = []
-        for response_text in responses_text:
-            soup = BeautifulSoup(response_text, 'html.parser')
-            listing_grid = soup.find('div', {'data-testid': 'listing-grid'})
-            if not listing_grid:
+def merge_unique_ads(pages_ads) -> List[Dict]:
+    unique_ads = []
+    unique_urls = set()
+    for page_ads in pages_ads:
+        for ad_info in page_ads:
+            if ad_info['ad_url'] in unique_urls:
                 continue
-            for link in listing_grid.find_all('div', {'data-cy': 'l-card'}):
-                ad_info = {}
-                ad_card_title = link.find('div', {'data-cy': 'ad-card-title'})
-                if not ad_card_title:
-                    continue
-                a_tag = ad_card_title.find('a')
-                if not a_tag:
-                    continue
-                url = HOST + a_tag['href']
-                if url in unique_urls or 'olx.ua/d/obyavlenie' in url:
-                    continue
-                unique_urls.append(url)
-                ad_info['ad_url'] = url
-                ad_info['ad_description'] = a_tag.find('h4').text
-                price_tag = ad_card_title.find('p', {'data-testid': 'ad-price'})
-                if price_tag:
-                    ad_info['ad_price'], ad_info['currency'] = split_price(price_tag.text)
-                else:
-                    ad_info['ad_price'], ad_info['currency'] = 0, 'без ціни'
-                queries_with_unique_ads[query_id].append(ad_info)
-    return queries_with_unique_ads
+            unique_urls.add(ad_info['ad_url'])
+            unique_ads.append(ad_info)
+    return unique_ads
 
 
 def split_price(undivided_price: str) -> Tuple:
@@ -1,10 +1,15 @@
 import asyncio
 import logging
+from contextlib import nullcontext
 from urllib.parse import urljoin
 
 from aiohttp import ClientSession
 from bs4 import BeautifulSoup
 
+from scrapers import html_backend, http_cache, parse_executor
+from scrapers.html_backend import first, has_class, xpath
+from scrapers.throttle import Throttle
+
 logger = logging.getLogger(__name__)
 
 MAX_RETRIES = 2
@@ -18,10 +23,15 @@ HEADERS = {
 HOST = 'https://rieltor.ua'
 
 
-async def parse_rieltor(url):
+async def parse_rieltor(
+    url,
+    throttle: Throttle | None = None,
+    known_urls: set[str] | None = None,
+    session: ClientSession | None = None,
+):
     logger.info('Rieltor scraper: starting fetch for %s', url, extra={'job_name': 'check_new_ads'})
-    responses_text_list = await get_responses_text_list(url)
-    ads = extract_ads(responses_text_list)
+    pages_ads = await get_pages_ads(url, throttle or Throttle(REQUEST_DELAY_SECONDS), known_urls, session)
+    ads = merge_unique_ads(pages_ads)
     logger.info(
         'Rieltor scraper: finished %s. Parsed %s ads',
         url,
@@ -31,47 +41,67 @@ async def parse_rieltor(url):
     return ads
 
 
-async def get_responses_text_list(url):
-    responses_text_list = []
+async def get_pages_ads(
+    url,
+    throttle: Throttle,
+    known_urls: set[str] | None = None,
+    session: ClientSession | None = None,
+):
+    pages_ads = []
     current_url = url
     page_number = 1
-    async with ClientSession() as session:
+    async with nullcontext(session) if session else ClientSession() as session:
         while True:
-            responses_text = await _fetch_page(session, current_url, page_number)
-            if responses_text is None:
-                if responses_text_list:
+            await throttle.wait()
+            page = await _fetch_page(session, current_url, page_number)
+            if page is None:
+                if pages_ads:
                     logger.warning(
                         'Rieltor scraper: stopped pagination at page=%s %s after %s fetched page(s). '
                         'Using ads collected before the failed page.',
                         page_number,
                         current_url,
-                        len(responses_text_list),
+                        len(pages_ads),
                         extra={'job_name': 'check_new_ads'},
                     )
-                    return responses_text_list
+                    return pages_ads
                 return []
 
-            responses_text_list.append(responses_text)
+            forward_page_url, page_ads = page
+            pages_ads.append(page_ads)
             logger.info(
                 'Rieltor scraper: fetched page=%s successfully: %s',
                 page_number,
                 current_url,
                 extra={'job_name': 'check_new_ads'},
             )
-            forward_page_url = get_pagination_forward_page_url_if_exist(responses_text)
+            if known_urls is not None and all(ad['ad_url'] in known_urls for ad in page_ads):
+                logger.info(
+                    'Rieltor scraper: page=%s has no new ads, stopping incremental crawl: %s',
+                    page_number,
+                    current_url,
+                    extra={'job_name': 'check_new_ads'},
+                )
+                return pages_ads
             if forward_page_url:
                 current_url = forward_page_url
                 page_number += 1
-                await asyncio.sleep(REQUEST_DELAY_SECONDS)
             else:
-                return responses_text_list
+                return pages_ads
 
 
 async def _fetch_page(session, current_url, page_number):
+    cached = http_cache.cached_result(current_url)
+    headers = {**HEADERS, **http_cache.conditional_headers(current_url)}
     for attempt in range(MAX_RETRIES + 1):
-        async with session.get(current_url, headers=HEADERS) as response:
+        async with session.get(current_url, headers=headers) as response:
+            if response.status == 304 and cached is not None:
+                return cached
             if response.status == 200:
-                return await response.text()
+                responses_text = await response.text()
+                page = await parse_executor.run(process_page, responses_text)
+                http_cache.store(current_url, response.headers, list(page))
+                return page
 
             if response.status == 429 and attempt < MAX_RETRIES:
                 delay_seconds = RETRY_DELAY_SECONDS * (attempt + 1)
@@ -100,8 +130,15 @@ async def _fetch_page(session, current_url, page_number):
     return None
 
 
-def get_pagination_forward_page_url_if_exist(responses_text):
+def process_page(responses_text, backend: str | None = None):
+    if html_backend.resolve_backend(backend) == 'lxml':
+        document = html_backend.lxml_document(responses_text)
+        return _get_pagination_forward_page_url_lxml(document), _extract_page_ads_lxml(document)
     soup = BeautifulSoup(responses_text, 'html.parser')
+    return get_pagination_forward_page_url_if_exist(soup), extract_page_ads(soup)
+
+
+def get_pagination_forward_page_url_if_exist(soup):
     try:
         pagination_elements = soup.find('ul', class_='pagination_custom')
         if not pagination_elements:
@@ -117,35 +154,93 @@ def get_pagination_forward_page_url_if_exist(responses_text):
         return None
 
 
-def extract_ads(responses_text_list):
+def _get_pagination_forward_page_url_lxml(document):
+    pagination_elements = first(f'//ul[{has_class("pagination_custom")}]', document)
+    if pagination_elements is None:
+        return None
+    find_next_page_url = False
+    for li in xpath('.//li')(pagination_elements):
+        if find_next_page_url:
+            pager_button = first(f'.//a[{has_class("pager-btn")}]', li)
+            if pager_button is None or 'href' not in pager_button.attrib:
+                return None
+            return urljoin(HOST, pager_button.get('href'))
+        if 'active' in (li.get('class') or '').split():
+            find_next_page_url = True
+    return None
+
+
+def extract_page_ads(soup):
+    page_ads = []
+    unique_urls = set()
+    for card in soup.find_all('div', class_='catalog-card'):
+        a_tag = card.find('a', class_='catalog-card-media')
+        if not a_tag:
+            continue
+        url = urljoin(HOST, a_tag['href'])
+        if url in unique_urls:
+            continue
+        unique_urls.add(url)
+        price = _get_text(card, 'div.catalog-card-price') or card.get('data-label', '')
+        region_tag = card.find('div', class_='catalog-card-region')
+        region_details = region_tag.find_all('a', {'data-analytics-event': 'card-click-region'}) if region_tag else []
+        page_ads.append(_ad_info(
+            url,
+            price,
+            [region.text.strip() for region in region_details],
+            _get_text(card, 'div.catalog-card-address'),
+        ))
+    return page_ads
+
+
+def _extract_page_ads_lxml(document):
+    page_ads = []
+    unique_urls = set()
+    for card in xpath(f'//div[{has_class("catalog-card")}]')(document):
+        a_tag = first(f'.//a[{has_class("catalog-card-media")}]', card)
+        if a_tag is None:
+            continue
+        url = urljoin(HOST, a_tag.attrib['href'])
+        if url in unique_urls:
+            continue
+        unique_urls.add(url)
+        price_tag = first(f'.//div[{has_class("catalog-card-price")}]', card)
+        price = (html_backend.stripped_text(price_tag, ' ') if price_tag is not None else '') or card.get('data-label', '')
+        region_tag = first(f'.//div[{has_class("catalog-card-region")}]', card)
+        region_details = (
+            xpath('.//a[@data-analytics-event="card-click-region"]')(region_tag) if region_tag is not None else []
+        )
+        address_tag = first(f'.//div[{has_class("catalog-card-address")}]', card)
+        page_ads.append(_ad_info(
+            url,
+            price,
+            [html_backend.text(region).strip() for region in region_details],
+            html_backend.stripped_text(address_tag, ' ') if address_tag is not None else '',
+        ))
+    return page_ads
+
+
+def _ad_info(url, price, regions, address):
+    ad_price, currency = split_price(price)
+    city = regions[0] if regions else ''
+    district = regions[1] if len(regions) == 2 else ''
+    return {
+        'ad_url': url,
+        'ad_description': f'{city}, {district}, {address}'.strip(', '),
+        'ad_price': ad_price,
+        'currency': currency,
+    }
+
+
+def merge_unique_ads(pages_ads):
     unique_ads = []
-    unique_urls = []
-    if not responses_text_list:
-        return unique_ads
-
-    for responses_text in responses_text_list:
-        soup = BeautifulSoup(responses_text, 'html.parser')
-        for card in soup.find_all('div', class_='catalog-card'):
-            a_tag = card.find('a', class_='catalog-card-media')
-            if not a_tag:
-                continue
-            url = urljoin(HOST, a_tag['href'])
-            if url in unique_urls:
+    unique_urls = set()
+    for page_ads in pages_ads:
+        for ad in page_ads:
+            if ad['ad_url'] in unique_urls:
                 continue
-            unique_urls.append(url)
-            price = _get_text(card, 'div.catalog-card-price') or card.get('data-label', '')
-            ad_price, currency = split_price(price)
-            region_tag = card.find('div', class_='catalog-card-region')
-            region_details = region_tag.find_all('a', {'data-analytics-event': 'card-click-region'}) if region_tag else []
-            city = region_details[0].text.strip() if region_details else ''
-            district = region_details[1].text.strip() if len(region_details) == 2 else ''
-            address = _get_text(card, 'div.catalog-card-address')
-            unique_ads.append({
-                'ad_url': url,
-                'ad_description': f'{city}, {district}, {address}'.strip(', '),
-                'ad_price': ad_price,
-                'currency': currency,
-            })
+            unique_urls.add(ad['ad_url'])
+            unique_ads.append(ad)
     return unique_ads
 
 
@@ -0,0 +1,46 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scrapers import parser_olx, parser_rieltor  # noqa: E402
+from scrapers.html_backend import BACKENDS  # noqa: E402
+
+PARSERS = {'olx': parser_olx, 'rieltor': parser_rieltor}
+# trimmed search pages with the awkward cases: promoted and duplicate cards, missing prices, nested markup
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+FIXTURES = {'olx': [FIXTURES_DIR / 'olx_search.html'], 'rieltor': [FIXTURES_DIR / 'rieltor_search.html']}
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith('--rounds=')]
+rounds = next((int(arg.split('=', 1)[1]) for arg in sys.argv[1:] if arg.startswith('--rounds=')), 20)
+if args and (args[0] not in PARSERS or len(args) < 2):
+    print('usage: python scripts/benchmark_html_parsers.py [olx|rieltor page.html [page.html ...]] [--rounds=N]')
+    sys.exit(2)
+runs = {args[0]: [Path(path) for path in args[1:]]} if args else FIXTURES
+mismatches = 0
+
+for name, paths in runs.items():
+    print(f'{name}:')
+    parser = PARSERS[name]
+    pages = [path.read_text(encoding='utf-8') for path in paths]
+    reference = [parser.process_page(page, 'bs4') for page in pages]
+    for backend in BACKENDS:
+        try:
+            results = [parser.process_page(page, backend) for page in pages]
+        except ImportError as error:
+            print(f'{backend:>6}: skipped ({error})')
+            continue
+        for path, result, expected in zip(paths, results, reference):
+            if result != expected:
+                mismatches += 1
+                print(f'{backend:>6}: output differs from bs4 for {path}')
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for page in pages:
+                parser.process_page(page, backend)
+        elapsed = (time.perf_counter() - started) / (rounds * len(pages))
+        ads = sum(len(result[1]) for result in results)
+        print(f'{backend:>6}: {elapsed * 1000:8.2f} ms/page, {ads} ads from {len(pages)} page(s)')
+
+sys.exit(1 if mismatches else 0)
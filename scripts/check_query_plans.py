@@ -0,0 +1,122 @@
+import asyncio
+import json
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from notify_bot.config import Settings  # noqa: E402
+from notify_bot.database import Database  # noqa: E402
+
+# each hot read and the tables (or aliases) it must reach through an index, never a full scan
+HOT_QUERIES = [
+    ('list_active_queries', lambda db: db.list_active_queries(), {'checker_query', 'q'}),
+    ('list_queries_for_user', lambda db: db.list_queries_for_user(1), {'checker_query'}),
+    ('query_url_exists', lambda db: db.query_url_exists(1, 'https://www.olx.ua/'), {'checker_query'}),
+    ('get_user_stats', lambda db: db.get_user_stats(1), {'checker_query'}),
+    ('list_found_ads_for_query', lambda db: db.list_found_ads_for_query(1), {'found_ad'}),
+    ('list_found_ad_keys new rows', lambda db: db.list_found_ad_keys(1, after_id=1000), {'found_ad'}),
+    ('count_new_ads_by_query', lambda db: db.count_new_ads_by_query(3600, 10), {'found_ad', 'f'}),
+    ('list_recent_ads', lambda db: db.list_recent_ads(20), {'found_ad', 'f'}),
+    ('list_recent_ads next page', lambda db: db.list_recent_ads(20, before_id=1000), {'found_ad', 'f'}),
+    ('list_queries_page next page', lambda db: db.list_queries_page('olx', before_id=1000), {'checker_query', 'q'}),
+    ('list_insta_subscriptions_page next page', lambda db: db.list_insta_subscriptions_page(before_id=1000), {'insta_subscription', 's'}),
+    ('get_insta_subscriber_ids', lambda db: db.get_insta_subscriber_ids(1), {'insta_subscription', 's'}),
+    ('list_insta_subscriptions', lambda db: db.list_insta_subscriptions(1), {'insta_subscription', 's'}),
+    ('get_job_logs by level', lambda db: db.get_job_logs(level='ERROR'), {'job_log'}),
+    ('get_job_logs by job', lambda db: db.get_job_logs(job_name='check_new_ads'), {'job_log'}),
+    ('get_job_logs older page', lambda db: db.get_job_logs(level='ERROR', before_id=1000), {'job_log'}),
+    ('get_job_logs newer page', lambda db: db.get_job_logs(job_name='check_insta', after_id=1000), {'job_log'}),
+]
+
+SQLITE_SCAN = re.compile(r'^SCAN (\S+)(?: USING (?:COVERING )?INDEX (\S+))?$')
+
+
+async def _recorded_sql(db: Database, call) -> list[tuple[str, tuple]]:
+    backend = db._backend
+    recorded = []
+    fetchone, fetchall = backend.fetchone, backend.fetchall
+
+    async def record_fetchone(sql, params=()):
+        recorded.append((sql, params))
+        return await fetchone(sql, params)
+
+    async def record_fetchall(sql, params=()):
+        recorded.append((sql, params))
+        return await fetchall(sql, params)
+
+    backend.fetchone, backend.fetchall = record_fetchone, record_fetchall
+    try:
+        await call(db)
+    finally:
+        del backend.fetchone, backend.fetchall
+    return recorded
+
+
+async def _partial_indexes(db: Database) -> set[str]:
+    if db.settings.use_sqlite:
+        rows = await db._backend.fetchall("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")
+        return {row['name'] for row in rows if ' WHERE ' in row['sql'].upper()}
+    rows = await db._backend.fetchall("SELECT indexname AS name, indexdef AS sql FROM pg_indexes WHERE schemaname = 'public'")
+    return {row['name'] for row in rows if ' WHERE ' in row['sql'].upper()}
+
+
+async def _full_scans(db: Database, sql: str, params: tuple, partial: set[str]) -> tuple[set[str], list[str]]:
+    # walking a whole index counts as a scan too, unless the index is partial and only
+    # holds the rows the query wants
+    backend = db._backend
+    if db.settings.use_sqlite:
+        rows = await backend.fetchall(f'EXPLAIN QUERY PLAN {sql}', params)
+        details = [row['detail'] for row in rows]
+        scans = {
+            match.group(1)
+            for match in map(SQLITE_SCAN.match, details)
+            if match and match.group(2) not in partial
+        }
+        return scans, details
+
+    # with seq scans priced out, a Seq Scan left in the plan means no usable index
+    async with backend.transaction():
+        await backend.execute('SET LOCAL enable_seqscan = off')
+        row = await backend.fetchone(f'EXPLAIN (FORMAT JSON) {sql}', params)
+    plan = row['QUERY PLAN']
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    scans, details, nodes = set(), [], [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', []))
+        relation = node.get('Relation Name')
+        if relation:
+            details.append(f"{node['Node Type']} on {relation} {node.get('Alias', '')}".strip())
+        full_index_walk = (
+            node['Node Type'] in ('Index Scan', 'Index Only Scan')
+            and 'Index Cond' not in node
+            and node.get('Index Name') not in partial
+        )
+        if node['Node Type'] == 'Seq Scan' or full_index_walk:
+            scans.update({relation, node.get('Alias')})
+    return scans, details
+
+
+async def main() -> int:
+    db = await Database(Settings.load()).connect()
+    failures = 0
+    try:
+        partial = await _partial_indexes(db)
+        for label, call, indexed_tables in HOT_QUERIES:
+            for sql, params in await _recorded_sql(db, call):
+                scans, details = await _full_scans(db, sql, params, partial)
+                regressed = scans & indexed_tables
+                status = 'SCAN' if regressed else 'ok'
+                failures += bool(regressed)
+                print(f'{status:>4} {label}: ' + '; '.join(details))
+    finally:
+        await db.close()
+    if failures:
+        print(f'{failures} hot query plan(s) fall back to a full table scan')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
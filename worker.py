@@ -0,0 +1,67 @@
+import asyncio
+import logging
+
+from notify_bot.config import Settings
+from notify_bot.database import Database
+from notify_bot.http_clients import HttpClients
+from notify_bot.jobs import create_job_queue
+from notify_bot.known_ads import KnownAdsIndex
+from notify_bot.leases import CheckLeases, worker_name
+from notify_bot.log_sink import JobLogSink
+from notify_bot.scheduler import run_scheduler
+from notify_bot.services import MonitorService
+from scrapers import browser_pool, http_cache, parse_executor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(name)s %(message)s',
+)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    # scrapes and reconciles the leased checks and runs queued jobs; notifications
+    # go to notification_outbox and are delivered by the bot process
+    settings = Settings.load()
+    db = await Database(settings).connect()
+    log_sink = JobLogSink(db)
+    log_sink.start()
+    ad_index = KnownAdsIndex(db)
+    ad_index.start()
+    parse_executor.start(settings.parse_workers)
+    http_cache.start(settings.http_cache_path, settings.http_cache_max_entries)
+    http_clients = HttpClients(settings)
+    browser_pool.start(
+        settings.insta_browser_contexts,
+        settings.insta_pages_per_context,
+        settings.insta_page_max_uses,
+    )
+    leases = CheckLeases(db, worker_name('worker'))
+    jobs = create_job_queue(None, db, MonitorService(db, http_clients), http_clients, leases.owner)
+    if settings.job_queue_backend != 'local':
+        jobs.start()
+
+    logger.info('Check worker %s started', leases.owner)
+    try:
+        await run_scheduler(
+            None,
+            db,
+            settings.request_interval_minutes,
+            settings.insta_request_interval_minutes,
+            http_clients=http_clients,
+            leases=leases,
+            jobs=jobs,
+        )
+    finally:
+        await jobs.close()
+        parse_executor.shutdown()
+        http_cache.shutdown()
+        await http_clients.close()
+        await browser_pool.shutdown()
+        await ad_index.close()
+        await log_sink.close()
+        await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())